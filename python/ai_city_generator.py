@@ -4,9 +4,31 @@ Handles intelligent city layout generation and spatial optimization
 """
 
 import numpy as np
-from typing import List, Dict, Tuple
-from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Dict, Tuple, Optional, Union, TYPE_CHECKING
+from dataclasses import dataclass, replace
 import json
+import textwrap
+from collections import Counter
+
+from poisson_sampling import poisson_disk_sample, SamplingResult
+from geometry import footprint_coverage, hull_area
+from heatmap import grid_extent
+from annealing import AnnealingSchedule, AnnealingResult, LayoutAnnealer, layout_energy
+from parallel_annealing import MultiChainResult, optimize_multichain
+from tiled_generation import DEFAULT_TILE_SIZE, TileResult, generate_tiled, iter_tiles
+from placement import DEFAULT_GAP, PlacementResult, place_buildings, radial_zoning
+from phased_generation import PHASE_SCHEDULE, AnnealingSnapshot, PhaseResult, iter_phases
+
+if TYPE_CHECKING:
+    from city_arrays import CityArrays
+    from score_optimizer import ScoreOptimizationResult
+
+
+# Ways of measuring how much of the grid a city covers
+COVERAGE_METHODS = ('hull', 'footprint')
+
+# Characters read per chunk when importing a city document
+_READ_CHUNK_SIZE = 1 << 16
 
 
 @dataclass
@@ -31,170 +53,434 @@ class CityGenerator:
         self.building_count = building_count
         self.buildings: List[Building] = []
         self.occupied_positions = set()
+        self.last_sampling: Optional[SamplingResult] = None
+        self.last_annealing: Optional[Union[AnnealingResult, MultiChainResult]] = None
+        self.last_placement: Optional[PlacementResult] = None
+        self.last_score_optimization: Optional['ScoreOptimizationResult'] = None
         
-    def generate_spatial_distribution(self) -> np.ndarray:
+    def generate_spatial_distribution(self, min_distance: float = 4.0,
+                                      max_attempts: int = 30,
+                                      seed: Optional[int] = None) -> np.ndarray:
         """
         Generate optimal spatial distribution using Poisson disk sampling
-        for even building placement across the city grid
+        for even building placement across the city grid.
+
+        Returns at most ``building_count`` (x, z) positions. If the grid cannot
+        hold that many buildings at ``min_distance`` the maximal achievable set
+        is returned and ``last_sampling.saturated`` is set.
+        """
+        result = poisson_disk_sample(
+            self.grid_size, self.grid_size, self.building_count,
+            min_distance=min_distance,
+            max_attempts=max_attempts,
+            seed=seed,
+            origin=(-self.grid_size / 2, -self.grid_size / 2)
+        )
+        self.last_sampling = result
+        
+        return result.positions
+    
+    def iter_tiled_distribution(self, tile_size: float = DEFAULT_TILE_SIZE,
+                                min_distance: float = 4.0, max_attempts: int = 30,
+                                seed: Optional[int] = None,
+                                workers: Optional[int] = None) -> Iterator[TileResult]:
         """
-        positions = []
-        min_distance = 4.0
-        max_attempts = 30
+        Tiled variant of ``generate_spatial_distribution`` for very large
+        grids: tiles are sampled in parallel worker processes and yielded as
+        they finish, with ``min_distance`` kept across tile seams
+        """
+        return iter_tiles(
+            self.grid_size, self.grid_size, self.building_count,
+            tile_size=tile_size,
+            min_distance=min_distance,
+            max_attempts=max_attempts,
+            seed=seed,
+            workers=workers,
+            origin=(-self.grid_size / 2, -self.grid_size / 2)
+        )
+    
+    def generate_tiled_distribution(self, tile_size: float = DEFAULT_TILE_SIZE,
+                                    min_distance: float = 4.0, max_attempts: int = 30,
+                                    seed: Optional[int] = None,
+                                    workers: Optional[int] = None) -> np.ndarray:
+        """All positions of ``iter_tiled_distribution`` in row-major tile order"""
+        result = generate_tiled(
+            self.grid_size, self.grid_size, self.building_count,
+            tile_size=tile_size,
+            min_distance=min_distance,
+            max_attempts=max_attempts,
+            seed=seed,
+            workers=workers,
+            origin=(-self.grid_size / 2, -self.grid_size / 2)
+        )
+        self.last_sampling = result
         
-        while len(positions) < self.building_count:
-            for _ in range(max_attempts):
-                x = np.random.uniform(-self.grid_size/2, self.grid_size/2)
-                z = np.random.uniform(-self.grid_size/2, self.grid_size/2)
-                
-                # Check minimum distance from existing buildings
-                if self._is_valid_position(x, z, positions, min_distance):
-                    positions.append((x, z))
-                    break
+        return result.positions
+    
+    def place_buildings(self, buildings: List[Building],
+                        zoning: Optional[Dict[str, np.ndarray]] = None,
+                        gap: float = DEFAULT_GAP, max_attempts: int = 30,
+                        seed: Optional[int] = None) -> List[Building]:
+        """
+        Place buildings on the grid by type so that no two footprints,
+        grown by ``gap``, overlap. ``zoning`` maps building types to weight
+        rasters over the grid (default: ``radial_zoning``; an empty dict
+        places every type uniformly). Buildings that find no free spot keep
+        their position and are listed in ``last_placement.unplaced``.
+        """
+        types = [b.type for b in buildings]
+        footprints = np.array([(b.size[0], b.size[2]) for b in buildings]).reshape(-1, 2)
+        result = self._place(types, footprints, zoning, gap, max_attempts, seed)
         
-        return np.array(positions)
-    
-    def _is_valid_position(self, x: float, z: float, 
-                          existing: List[Tuple], min_dist: float) -> bool:
-        """Check if position maintains minimum distance from existing buildings"""
-        for ex, ez in existing:
-            dist = np.sqrt((x - ex)**2 + (z - ez)**2)
-            if dist < min_dist:
-                return False
-        return True
+        return [
+            replace(b, position=(float(x), b.position[1], float(z))) if placed else b
+            for b, (x, z), placed in zip(buildings, result.positions, result.placed)
+        ]
+    
+    def place_city(self, city: 'CityArrays',
+                   zoning: Optional[Dict[str, np.ndarray]] = None,
+                   gap: float = DEFAULT_GAP, max_attempts: int = 30,
+                   seed: Optional[int] = None) -> 'CityArrays':
+        """Array-backed variant of ``place_buildings``"""
+        types = [city.type_names[code] for code in city.type_codes.tolist()]
+        result = self._place(types, city.sizes[:, ::2], zoning, gap, max_attempts, seed)
+        xz = np.where(result.placed[:, None], result.positions, city.xz)
+        return city.with_xz(xz)
+    
+    def _place(self, types: List[str], footprints: np.ndarray,
+               zoning: Optional[Dict[str, np.ndarray]], gap: float,
+               max_attempts: int, seed: Optional[int]) -> PlacementResult:
+        result = place_buildings(
+            types, footprints,
+            extent=grid_extent(self.grid_size),
+            zoning=radial_zoning() if zoning is None else zoning,
+            gap=gap,
+            max_attempts=max_attempts,
+            seed=seed
+        )
+        self.last_placement = result
+        return result
+    
+    def iter_phased_city(self, city: 'CityArrays',
+                         zoning: Optional[Dict[str, np.ndarray]] = None,
+                         gap: float = DEFAULT_GAP, max_attempts: int = 30,
+                         schedule: Optional[AnnealingSchedule] = PHASE_SCHEDULE,
+                         seed: Optional[int] = None,
+                         snapshot_every: int = 0) -> Iterator[Union[AnnealingSnapshot, PhaseResult]]:
+        """
+        Place and locally anneal a city one construction phase at a time,
+        yielding every phase (and optional annealing snapshots) as soon as
+        it is done. ``zoning`` defaults to ``radial_zoning`` as in
+        ``place_buildings``.
+        """
+        return iter_phases(
+            [city.type_names[code] for code in city.type_codes.tolist()],
+            city.sizes[:, ::2],
+            city.phases,
+            self.grid_size,
+            zoning=radial_zoning() if zoning is None else zoning,
+            gap=gap,
+            max_attempts=max_attempts,
+            schedule=schedule,
+            seed=seed,
+            snapshot_every=snapshot_every
+        )
     
     def calculate_building_metrics(self, buildings: List[Building]) -> Dict:
         """
         Calculate city statistics and metrics
         """
+        type_counts = Counter(b.type for b in buildings)
         metrics = {
             'total_buildings': len(buildings),
-            'infrastructure_count': sum(1 for b in buildings if b.type == 'infrastructure'),
-            'commercial_count': sum(1 for b in buildings if b.type == 'commercial'),
-            'residential_count': sum(1 for b in buildings if b.type == 'residential'),
-            'office_count': sum(1 for b in buildings if b.type == 'office'),
-            'public_count': sum(1 for b in buildings if b.type == 'public'),
+            'infrastructure_count': type_counts['infrastructure'],
+            'commercial_count': type_counts['commercial'],
+            'residential_count': type_counts['residential'],
+            'office_count': type_counts['office'],
+            'public_count': type_counts['public'],
             'average_building_size': np.mean([b.size[1] for b in buildings]),
             'city_density': len(buildings) / (self.grid_size ** 2),
-            'spatial_coverage': self._calculate_coverage(buildings)
+            'spatial_coverage': self._calculate_coverage(buildings),
+            'footprint_coverage': self._calculate_coverage(buildings, method='footprint')
         }
         return metrics
     
-    def _calculate_coverage(self, buildings: List[Building]) -> float:
-        """Calculate percentage of grid covered by buildings"""
+    def _calculate_coverage(self, buildings: List[Building], method: str = 'hull',
+                            resolution: int = 256) -> float:
+        """
+        Calculate percentage of grid covered by buildings.
+        
+        ``hull`` measures the convex hull of the building positions, which
+        overstates coverage for sparse cities; ``footprint`` rasterises the
+        union of the building footprints at ``resolution`` cells per side.
+        """
+        if method not in COVERAGE_METHODS:
+            raise ValueError(f"method must be one of {', '.join(COVERAGE_METHODS)}")
         if not buildings:
             return 0.0
         
-        positions = np.array([(b.position[0], b.position[2]) for b in buildings])
+        positions = np.fromiter((b.position for b in buildings), dtype=(np.float64, 3),
+                                count=len(buildings))[:, ::2]
+        if method == 'footprint':
+            sizes = np.fromiter((b.size for b in buildings), dtype=(np.float64, 3),
+                                count=len(buildings))[:, ::2]
+            return footprint_coverage(positions, sizes, resolution, grid_extent(self.grid_size))
         
-        # Calculate convex hull area
-        from scipy.spatial import ConvexHull
-        try:
-            hull = ConvexHull(positions)
-            coverage = hull.volume / (self.grid_size ** 2)
-            return min(coverage * 100, 100.0)
-        except:
-            return 0.0
+        coverage = hull_area(positions) / (self.grid_size ** 2)
+        return min(coverage * 100, 100.0)
     
-    def optimize_layout(self, buildings: List[Building]) -> List[Building]:
+    def optimize_layout(self, buildings: List[Building],
+                        schedule: Optional[AnnealingSchedule] = None,
+                        seed: Optional[int] = None, chains: int = 1,
+                        workers: Optional[int] = None,
+                        mode: str = 'restarts',
+                        footprint_gap: Optional[float] = None) -> List[Building]:
         """
         Optimize building layout using simulated annealing
-        to improve spatial distribution and aesthetics
-        """
-        # Simulated annealing parameters
-        temperature = 100.0
-        cooling_rate = 0.95
-        min_temperature = 0.1
-        
-        current_energy = self._calculate_layout_energy(buildings)
-        best_buildings = buildings.copy()
-        best_energy = current_energy
-        
-        while temperature > min_temperature:
-            # Generate neighbor solution
-            new_buildings = self._perturb_layout(buildings)
-            new_energy = self._calculate_layout_energy(new_buildings)
-            
-            # Accept or reject new solution
-            delta_energy = new_energy - current_energy
-            if delta_energy < 0 or np.random.random() < np.exp(-delta_energy / temperature):
-                buildings = new_buildings
-                current_energy = new_energy
-                
-                if current_energy < best_energy:
-                    best_buildings = buildings.copy()
-                    best_energy = current_energy
-            
-            temperature *= cooling_rate
-        
-        return best_buildings
-    
-    def _calculate_layout_energy(self, buildings: List[Building]) -> float:
-        """Calculate energy function for layout optimization"""
-        energy = 0.0
+        to improve spatial distribution and aesthetics.
         
-        # Penalty for clustering
-        for i, b1 in enumerate(buildings):
-            for b2 in buildings[i+1:]:
-                dist = np.sqrt(
-                    (b1.position[0] - b2.position[0])**2 + 
-                    (b1.position[2] - b2.position[2])**2
-                )
-                if dist < 5.0:
-                    energy += (5.0 - dist) ** 2
-        
-        # Reward for even distribution
+        With ``chains > 1`` several chains run across ``workers`` processes
+        (independent restarts or parallel tempering) and the best layout wins.
+        With a ``footprint_gap`` overlapping footprints, grown by the gap, are
+        penalised instead of centres closer than the clustering radius.
+        """
         positions = np.array([(b.position[0], b.position[2]) for b in buildings])
-        center = np.mean(positions, axis=0)
-        distances = np.sqrt(np.sum((positions - center)**2, axis=1))
-        energy -= np.std(distances) * 10
+        footprints = None
+        if footprint_gap is not None:
+            footprints = np.array([(b.size[0], b.size[2]) for b in buildings]).reshape(-1, 2)
+        result = self._anneal(positions, schedule, seed, chains, workers, mode,
+                              footprints, footprint_gap)
         
-        return energy
+        return [
+            replace(b, position=(float(x), b.position[1], float(z)))
+            for b, (x, z) in zip(buildings, result.positions)
+        ]
     
-    def _perturb_layout(self, buildings: List[Building]) -> List[Building]:
-        """Slightly modify building positions for optimization"""
-        new_buildings = buildings.copy()
-        idx = np.random.randint(0, len(new_buildings))
-        building = new_buildings[idx]
-        
-        # Small random displacement
-        dx = np.random.normal(0, 2.0)
-        dz = np.random.normal(0, 2.0)
-        
-        new_x = np.clip(building.position[0] + dx, -self.grid_size/2, self.grid_size/2)
-        new_z = np.clip(building.position[2] + dz, -self.grid_size/2, self.grid_size/2)
+    def optimize_city(self, city: 'CityArrays',
+                      schedule: Optional[AnnealingSchedule] = None,
+                      seed: Optional[int] = None, chains: int = 1,
+                      workers: Optional[int] = None,
+                      mode: str = 'restarts',
+                      footprint_gap: Optional[float] = None) -> 'CityArrays':
+        """Array-backed variant of ``optimize_layout`` that never builds per-building objects"""
+        footprints = city.sizes[:, ::2] if footprint_gap is not None else None
+        result = self._anneal(city.xz, schedule, seed, chains, workers, mode,
+                              footprints, footprint_gap)
+        return city.with_xz(result.positions)
+    
+    def _anneal(self, positions: np.ndarray, schedule: Optional[AnnealingSchedule],
+                seed: Optional[int], chains: int, workers: Optional[int],
+                mode: str, footprints: Optional[np.ndarray] = None,
+                footprint_gap: Optional[float] = None) -> Union[AnnealingResult, MultiChainResult]:
+        gap = footprint_gap or 0.0
+        if chains > 1:
+            result = optimize_multichain(
+                positions, self.grid_size / 2,
+                chains=chains,
+                workers=workers,
+                mode=mode,
+                schedule=schedule,
+                seed=seed,
+                footprints=footprints,
+                gap=gap
+            )
+        else:
+            annealer = LayoutAnnealer(positions, half_extent=self.grid_size / 2, seed=seed,
+                                      footprints=footprints, gap=gap)
+            result = annealer.run(schedule)
+        self.last_annealing = result
+        return result
+    
+    def optimize_scores(self, buildings: List[Building],
+                        extent: Optional[Tuple[float, float, float, float]] = None,
+                        weights: Optional[Dict[str, float]] = None,
+                        time_budget: Optional[float] = 1.0,
+                        max_steps: Optional[int] = None,
+                        seed: Optional[int] = None,
+                        footprint_gap: Optional[float] = None) -> List[Building]:
+        """
+        Optimize building layout for the weighted analytics score rather
+        than the annealing energy, within ``time_budget`` seconds.
         
-        new_buildings[idx] = Building(
-            id=building.id,
-            name=building.name,
-            type=building.type,
-            position=(new_x, building.position[1], new_z),
-            size=building.size,
-            color=building.color,
-            phase=building.phase
+        Scores are measured over ``extent`` (the grid square by default) and
+        weighted by ``weights`` (``SCORE_WEIGHTS`` by default). With a
+        ``footprint_gap`` no move may make footprints, grown by the gap,
+        overlap. The run is kept in ``last_score_optimization``.
+        """
+        from city_arrays import CityArrays
+        city = self.optimize_city_scores(
+            CityArrays.from_buildings(buildings, dtype=np.float64),
+            extent=extent,
+            weights=weights,
+            time_budget=time_budget,
+            max_steps=max_steps,
+            seed=seed,
+            footprint_gap=footprint_gap
         )
         
-        return new_buildings
-
-
-def export_city_data(buildings: List[Building], filename: str = "city_export.json"):
-    """Export city data to JSON format"""
-    data = {
-        'buildings': [
-            {
-                'id': b.id,
-                'name': b.name,
-                'type': b.type,
-                'position': b.position,
-                'size': b.size,
-                'color': b.color,
-                'phase': b.phase
-            }
-            for b in buildings
+        return [
+            replace(b, position=(float(x), b.position[1], float(z)))
+            for b, (x, z) in zip(buildings, city.xz)
         ]
-    }
     
+    def optimize_city_scores(self, city: 'CityArrays',
+                             extent: Optional[Tuple[float, float, float, float]] = None,
+                             weights: Optional[Dict[str, float]] = None,
+                             time_budget: Optional[float] = 1.0,
+                             max_steps: Optional[int] = None,
+                             seed: Optional[int] = None,
+                             footprint_gap: Optional[float] = None) -> 'CityArrays':
+        """Array-backed variant of ``optimize_scores``"""
+        # Imported here: the analytics modules depend on this one
+        from city_analytics import BuildingColumns
+        from score_optimizer import optimize_scores
+        
+        result = optimize_scores(
+            BuildingColumns.from_city(city),
+            extent=extent if extent is not None else grid_extent(self.grid_size),
+            weights=weights,
+            time_budget=time_budget,
+            max_steps=max_steps,
+            seed=seed,
+            footprints=city.sizes[:, ::2] if footprint_gap is not None else None,
+            gap=footprint_gap or 0.0
+        )
+        self.last_score_optimization = result
+        return city.with_xz(result.positions)
+    
+    def _calculate_layout_energy(self, buildings: List[Building]) -> float:
+        """Calculate energy function for layout optimization"""
+        positions = np.array([(b.position[0], b.position[2]) for b in buildings])
+        return layout_energy(positions)
+
+
+def export_city_data(buildings: Iterable[Building], filename: str = "city_export.json"):
+    """
+    Export city data to JSON format.
+    
+    Buildings are serialised one at a time, so the full document is never
+    held in memory; the output matches ``json.dump(..., indent=2)``.
+    """
     with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
+        f.write('{\n  "buildings": [')
+        first = True
+        for b in buildings:
+            record = json.dumps(_building_to_dict(b), indent=2)
+            f.write('\n' if first else ',\n')
+            f.write(textwrap.indent(record, '    '))
+            first = False
+        f.write(']\n}' if first else '\n  ]\n}')
+
+
+class _JSONReader:
+    """Incremental reader over a JSON document, decoding one value at a time"""
+    
+    def __init__(self, f, chunk_size: int = _READ_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+    
+    def _fill(self) -> bool:
+        """Append the next chunk, dropping what has been consumed; False at end of file"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+    
+    def peek(self) -> str:
+        """Next non-whitespace character, or '' at end of file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+    
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self.pos} of the city document")
+        self.pos += 1
+    
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A value running to the end of the buffer may be cut short
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_city_data(filename: str = "city_export.json") -> Iterator[Building]:
+    """
+    Stream the buildings of a document written by ``export_city_data``.
+    
+    The file is read in fixed-size chunks and each building is decoded and
+    yielded on its own, so memory stays bounded by the largest building
+    rather than the document.
+    """
+    with open(filename) as f:
+        reader = _JSONReader(f)
+        reader.expect('{')
+        while reader.peek() != '}':
+            key = reader.value()
+            reader.expect(':')
+            if key != 'buildings':
+                reader.value()
+            else:
+                reader.expect('[')
+                while reader.peek() != ']':
+                    b = reader.value()
+                    yield Building(
+                        id=b['id'],
+                        name=b['name'],
+                        type=b['type'],
+                        position=tuple(b['position']),
+                        size=tuple(b['size']),
+                        color=b['color'],
+                        phase=b['phase']
+                    )
+                    if reader.peek() != ']':
+                        reader.expect(',')
+                reader.expect(']')
+            if reader.peek() != '}':
+                reader.expect(',')
+        reader.expect('}')
+
+
+def import_city_data(filename: str = "city_export.json") -> List[Building]:
+    """
+    Import city data written by ``export_city_data``.
+    
+    The document is parsed incrementally through ``iter_city_data``; only the
+    resulting ``Building`` list is held in memory.
+    """
+    return list(iter_city_data(filename))
+
+
+def _building_to_dict(b: Building) -> Dict:
+    return {
+        'id': b.id,
+        'name': b.name,
+        'type': b.type,
+        'position': b.position,
+        'size': b.size,
+        'color': b.color,
+        'phase': b.phase
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,339 @@
+"""
+Layout Annealing Module
+Incremental delta-energy simulated annealing for building layouts
+"""
+
+import math
+import numpy as np
+from typing import Generator, List, Optional
+from dataclasses import dataclass, field
+
+from spatial_index import GridIndex
+
+
+@dataclass
+class AnnealingSchedule:
+    """Temperature schedule for simulated annealing"""
+    initial_temperature: float = 100.0
+    cooling_rate: float = 0.95
+    min_temperature: float = 0.1
+    iterations_per_temperature: int = 100
+    step_size: float = 2.0
+    # Temperature levels without a new best layout before reheating or stopping
+    stagnation_levels: int = 20
+    max_reheats: int = 0
+    # Reheating restarts the schedule at initial_temperature * reheat_factor
+    reheat_factor: float = 0.5
+
+
+@dataclass
+class AnnealingResult:
+    """Outcome of an annealing run"""
+    positions: np.ndarray
+    energy: float
+    initial_energy: float
+    steps: int
+    accepted: int
+    reheats: int
+    energy_trace: List[float] = field(default_factory=list)
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.steps if self.steps else 0.0
+
+
+@dataclass
+class AnnealingLevel:
+    """State after one temperature level of an annealing run"""
+    level: int
+    temperature: float
+    energy: float
+    best_energy: float
+
+
+class LayoutAnnealer:
+    """
+    Simulated annealing over a contiguous (n, 2) array of building positions.
+
+    The layout energy is a clustering penalty ``(radius - d)**2`` for every pair
+    closer than ``clustering_radius`` minus ``spread_weight`` times the standard
+    deviation of distances from the layout centre. Moving one building only
+    touches its own pairs, which are found through a ``GridIndex``, and the
+    running sums behind the standard deviation are patched in O(1).
+
+    The centre is frozen for the duration of a sweep (one move shifts it by
+    only ``step / n``) and re-synchronised exactly between sweeps.
+
+    With ``footprints`` ((n, 2) x/z building extents) the clustering penalty
+    becomes footprint-aware: a pair is penalised by the square of its
+    axis-aligned penetration depth, the shallower of its x and z overlaps
+    once both boxes are grown by ``gap``, instead of by its centre distance.
+
+    With ``movable`` (indices or a boolean mask) only those buildings are
+    moved; the others stay put but still count towards the energy.
+
+    With ``strict`` (footprints only) the footprints are hard constraints:
+    every footprint is clamped inside the extent, and moves that bring two
+    buildings closer than ``gap`` are rejected, so a layout that starts
+    collision-free stays collision-free.
+    """
+
+    def __init__(self, positions: np.ndarray, half_extent: float,
+                 clustering_radius: float = 5.0, spread_weight: float = 10.0,
+                 seed: Optional[int] = None, footprints: Optional[np.ndarray] = None,
+                 gap: float = 0.0, movable: Optional[np.ndarray] = None,
+                 strict: bool = False):
+        self.positions = np.ascontiguousarray(positions, dtype=np.float64).reshape(-1, 2).copy()
+        self.half_extent = float(half_extent)
+        self.clustering_radius = float(clustering_radius)
+        self.spread_weight = float(spread_weight)
+        self.rng = np.random.default_rng(seed)
+
+        self._halves = None
+        self.gap = float(gap)
+        # Farthest centre distance at which two buildings can interact
+        self._reach = self.clustering_radius
+        if footprints is not None:
+            self._halves = np.abs(np.asarray(footprints, dtype=np.float64)).reshape(-1, 2) / 2
+            if len(self._halves) != len(self.positions):
+                raise ValueError("footprints must have one row per position")
+            widest = 2 * float(self._halves.max()) if len(self._halves) else 0.0
+            self._reach = max(math.sqrt(2) * (widest + self.gap), 1e-9)
+
+        self.strict = bool(strict)
+        if self.strict and self._halves is None:
+            raise ValueError("strict annealing needs footprints")
+        # Per-building centre bounds that keep strict footprints inside the extent
+        self._bounds = None
+        if self.strict:
+            lo = -self.half_extent + self._halves
+            hi = np.maximum(self.half_extent - self._halves, lo)
+            self._bounds = np.hstack([lo, hi]).tolist()
+
+        self._movable = None
+        if movable is not None:
+            movable = np.asarray(movable)
+            self._movable = np.flatnonzero(movable) if movable.dtype == bool else movable.astype(np.intp)
+
+        self._rebuild()
+
+        self.best_positions = self.positions.copy()
+        self.best_energy = self.energy
+        self.steps = 0
+        self.accepted = 0
+
+    @property
+    def energy(self) -> float:
+        return self._pair_energy - self.spread_weight * self._spread_std()
+
+    def _pair_contribution(self, index: int, x: float, z: float) -> float:
+        """Clustering penalty between the building at ``index`` placed at (x, z) and its neighbours"""
+        if self._halves is not None:
+            return self._footprint_contribution(index, x, z)
+        radius = self.clustering_radius
+        positions = self.positions
+        total = 0.0
+        for j in self._index.neighbours(x, z):
+            if j == index:
+                continue
+            ox, oz = positions[j]
+            dist = math.hypot(x - ox, z - oz)
+            if dist < radius:
+                total += (radius - dist) ** 2
+        return total
+
+    def _footprint_contribution(self, index: int, x: float, z: float) -> float:
+        positions = self.positions
+        halves = self._halves
+        hx, hz = halves[index].tolist()
+        total = 0.0
+        for j in self._index.neighbours(x, z):
+            if j == index:
+                continue
+            ox, oz = positions[j]
+            jx, jz = halves[j]
+            depth = min(hx + jx + self.gap - abs(x - ox), hz + jz + self.gap - abs(z - oz))
+            if depth > 0:
+                total += depth * depth
+        return total
+
+    def _total_pair_energy(self) -> float:
+        pairs = self._index.pairs_within(self._reach)
+        if self._halves is not None:
+            i, j = pairs[:, 0], pairs[:, 1]
+            limits = self._halves[i] + self._halves[j] + self.gap
+            depth = (limits - np.abs(self.positions[i] - self.positions[j])).min(axis=1)
+            depth = depth[depth > 0]
+            return float(np.dot(depth, depth))
+        offsets = self.positions[pairs[:, 0]] - self.positions[pairs[:, 1]]
+        distances = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+        overlap = self.clustering_radius - distances[distances < self.clustering_radius]
+        return float(np.dot(overlap, overlap))
+
+    def _sync_spread(self):
+        """Recompute the layout centre and the running distance sums exactly"""
+        n = len(self.positions)
+        if n == 0:
+            self._center = (0.0, 0.0)
+            self._sum_d = self._sum_d2 = 0.0
+            return
+        center = self.positions.mean(axis=0)
+        distances = np.sqrt(np.sum((self.positions - center) ** 2, axis=1))
+        self._center = (float(center[0]), float(center[1]))
+        self._sum_d = float(distances.sum())
+        self._sum_d2 = float(np.dot(distances, distances))
+
+    def _spread_std(self, sum_d: Optional[float] = None, sum_d2: Optional[float] = None) -> float:
+        n = len(self.positions)
+        if n == 0:
+            return 0.0
+        sum_d = self._sum_d if sum_d is None else sum_d
+        sum_d2 = self._sum_d2 if sum_d2 is None else sum_d2
+        mean = sum_d / n
+        return math.sqrt(max(sum_d2 / n - mean * mean, 0.0))
+
+    def _rebuild(self):
+        """Rebuild the spatial index and every running sum from ``positions``"""
+        self._index = GridIndex(self.positions, self._reach)
+        self._pair_energy = self._total_pair_energy()
+        self._sync_spread()
+
+    def sweep(self, temperature: float, iterations: int, step_size: float = 2.0) -> bool:
+        """
+        Run ``iterations`` Metropolis steps at a fixed temperature.
+
+        Returns True when a new best layout was found. The layout centre is
+        re-synchronised at the end of the sweep.
+        """
+        n = len(self.positions) if self._movable is None else len(self._movable)
+        if n == 0 or iterations <= 0:
+            return False
+
+        positions = self.positions
+        lo, hi = -self.half_extent, self.half_extent
+        current_energy = self.energy
+        improved = False
+
+        # Draw the whole sweep's randomness in a few vectorised calls
+        indices = self.rng.integers(0, n, size=iterations)
+        if self._movable is not None:
+            indices = self._movable[indices]
+        indices = indices.tolist()
+        moves = self.rng.normal(0.0, step_size, size=(iterations, 2)).tolist()
+        thresholds = self.rng.random(iterations).tolist()
+        cx, cz = self._center
+        bounds = self._bounds
+
+        for idx, (dx, dz), threshold in zip(indices, moves, thresholds):
+            old_x, old_z = positions[idx].tolist()
+            if bounds is None:
+                new_x = min(max(old_x + dx, lo), hi)
+                new_z = min(max(old_z + dz, lo), hi)
+            else:
+                lo_x, lo_z, hi_x, hi_z = bounds[idx]
+                new_x = min(max(old_x + dx, lo_x), hi_x)
+                new_z = min(max(old_z + dz, lo_z), hi_z)
+
+            new_pairs = self._pair_contribution(idx, new_x, new_z)
+            if self.strict and new_pairs > 0:
+                self.steps += 1
+                continue
+            pair_delta = new_pairs - self._pair_contribution(idx, old_x, old_z)
+            old_d = math.hypot(old_x - cx, old_z - cz)
+            new_d = math.hypot(new_x - cx, new_z - cz)
+            sum_d = self._sum_d - old_d + new_d
+            sum_d2 = self._sum_d2 - old_d * old_d + new_d * new_d
+            new_energy = (self._pair_energy + pair_delta -
+                          self.spread_weight * self._spread_std(sum_d, sum_d2))
+
+            delta_energy = new_energy - current_energy
+            self.steps += 1
+            if delta_energy < 0 or threshold < math.exp(-delta_energy / temperature):
+                positions[idx] = (new_x, new_z)
+                self._index.update(idx, (new_x, new_z))
+                self._pair_energy += pair_delta
+                self._sum_d, self._sum_d2 = sum_d, sum_d2
+                current_energy = new_energy
+                self.accepted += 1
+
+                if current_energy < self.best_energy:
+                    self.best_energy = current_energy
+                    self.best_positions[:] = positions
+                    improved = True
+
+        # Re-centre and drop the frozen-centre approximation between sweeps
+        self._sync_spread()
+        return improved
+
+    def restore_best(self):
+        """Reset the layout to the best one seen, with its exact energy"""
+        self.positions[:] = self.best_positions
+        self._rebuild()
+        self.best_energy = self.energy
+
+    def run(self, schedule: Optional[AnnealingSchedule] = None) -> AnnealingResult:
+        """Anneal the layout in place, returning the best layout found"""
+        levels = self.iter_levels(schedule)
+        while True:
+            try:
+                next(levels)
+            except StopIteration as stop:
+                return stop.value
+
+    def iter_levels(self, schedule: Optional[AnnealingSchedule] = None
+                    ) -> Generator[AnnealingLevel, None, AnnealingResult]:
+        """
+        Anneal the layout in place like ``run``, yielding after every
+        temperature level; ``positions`` holds the current layout while the
+        generator is suspended. The ``AnnealingResult`` is the generator's
+        return value.
+        """
+        schedule = schedule or AnnealingSchedule()
+
+        initial_energy = self.energy
+        trace = [initial_energy]
+        reheats = stagnant = 0
+        temperature = schedule.initial_temperature
+        level = 0
+
+        while len(self.positions) and temperature > schedule.min_temperature:
+            improved = self.sweep(temperature, schedule.iterations_per_temperature,
+                                  schedule.step_size)
+            trace.append(self.energy)
+            yield AnnealingLevel(level, temperature, trace[-1], self.best_energy)
+            level += 1
+
+            stagnant = 0 if improved else stagnant + 1
+            if stagnant >= schedule.stagnation_levels:
+                if reheats >= schedule.max_reheats:
+                    break
+                reheats += 1
+                stagnant = 0
+                temperature = schedule.initial_temperature * schedule.reheat_factor
+                continue
+
+            temperature *= schedule.cooling_rate
+
+        # Report the best layout with its exact energy
+        self.restore_best()
+
+        return AnnealingResult(
+            positions=self.best_positions.copy(),
+            energy=self.best_energy,
+            initial_energy=initial_energy,
+            steps=self.steps,
+            accepted=self.accepted,
+            reheats=reheats,
+            energy_trace=trace
+        )
+
+
+def layout_energy(positions: np.ndarray, clustering_radius: float = 5.0,
+                  spread_weight: float = 10.0, footprints: Optional[np.ndarray] = None,
+                  gap: float = 0.0) -> float:
+    """Exact layout energy of an (n, 2) position array"""
+    annealer = LayoutAnnealer(positions, half_extent=np.inf,
+                              clustering_radius=clustering_radius,
+                              spread_weight=spread_weight,
+                              footprints=footprints, gap=gap)
+    return annealer.energy
@@ -3,17 +3,147 @@ Python API Service
 Microservice for handling compute-intensive city generation tasks
 """
 
-from flask import Flask, request, jsonify
-from ai_city_generator import CityGenerator, Building
-from city_analytics import CityAnalytics, calculate_population_estimate
+from flask import Flask, Response, g, request, jsonify
+import numpy as np
+from city_analytics import BuildingColumns, CityAnalytics, calculate_population_estimate, calculate_walkability
+from batch_analytics import VariantBatch, analyze_batches, stack_cities
+from city_arrays import CityArrays
+from heatmap import resolve_extent, resolve_resolution
+from heatmap_tiles import (
+    DEFAULT_PYRAMID_RESOLUTION, DEFAULT_TILE_CACHE_BYTES, DEFAULT_TILE_SIZE, HeatmapPyramids, TileCache
+)
+from incremental_analytics import AnalysisSessions
+from metrics_history import DEFAULT_CAPACITY, MetricsHistory
+from phased_generation import PhaseResult
+from instrumentation import (
+    PROFILE_SORT_KEYS, begin_request, end_request, metrics, profile_path, profile_report, stage,
+    timed_stream
+)
+from result_cache import cache_key, create_cache
+from startup import WarmUp
+from jobs import JobQueue, QueueFullError, FINISHED_STATES, JOB_COMPLETED, JOB_CANCELLED, JOB_TIMED_OUT
+from tasks import (
+    check_batch_size, check_city_request, check_layout_request, check_placement_request,
+    check_positions_request, generate_city_task, generate_positions_task, iter_city_phases,
+    iter_tiled_positions, optimize_city_task, optimize_layout_task, phase_city, phase_summary,
+    place_buildings_task, place_city_task, sample_positions
+)
+from wire_format import COLUMNAR_MIMETYPE, decode_city, encode_city, iter_encode
+import atexit
 import json
-from typing import Dict, List
+import os
+import time
+from datetime import datetime
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple
 
 app = Flask(__name__)
 
 # Initialize services
-city_generator = CityGenerator()
-analytics = CityAnalytics()
+analytics = CityAnalytics(MetricsHistory(
+    capacity=int(os.environ.get('CITY_HISTORY_CAPACITY', DEFAULT_CAPACITY)),
+    directory=os.environ.get('CITY_HISTORY_PATH')
+))
+# History rows are buffered between log flushes; write the tail on shutdown
+atexit.register(analytics.metrics_history.flush)
+job_queue = JobQueue()
+sessions = AnalysisSessions()
+pyramids = HeatmapPyramids(TileCache(
+    max_bytes=int(os.environ.get('CITY_TILE_CACHE_MAX_BYTES', DEFAULT_TILE_CACHE_BYTES))
+))
+result_cache = create_cache(
+    max_bytes=int(os.environ.get('CITY_CACHE_MAX_BYTES', 64 << 20)),
+    ttl=float(os.environ['CITY_CACHE_TTL']) if 'CITY_CACHE_TTL' in os.environ else None,
+    path=os.environ.get('CITY_CACHE_PATH')
+)
+
+# CITY_WARMUP=1 pre-touches the kernels on a background thread at startup;
+# /health answers immediately and reports the warm-up state
+warmup = WarmUp()
+if os.environ.get('CITY_WARMUP', '').lower() in ('1', 'true', 'yes'):
+    warmup.start()
+
+# Task kinds that can be submitted to the job queue
+JOB_TASKS = {
+    'generate-positions': generate_positions_task,
+    'optimize-layout': optimize_layout_task,
+    'place-buildings': place_buildings_task,
+    'generate-city': generate_city_task
+}
+
+# Parameter checks run before queueing, so malformed jobs fail with a 400
+# instead of inside a worker
+JOB_CHECKS = {
+    'generate-positions': check_positions_request,
+    'optimize-layout': check_layout_request,
+    'place-buildings': check_placement_request,
+    'generate-city': check_city_request
+}
+
+# Media type of server-sent events, the alternative to NDJSON frames
+EVENT_STREAM_MIMETYPE = 'text/event-stream'
+
+
+@app.before_request
+def _start_instrumentation():
+    g.request_start = time.perf_counter()
+    rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    begin_request(rule, request.headers.get('X-Profile'), request.headers.get('X-Profile-Token'))
+
+
+@app.after_request
+def _finish_instrumentation(response: Response) -> Response:
+    profile = end_request(response.status_code, time.perf_counter() - g.request_start)
+    if profile is not None:
+        response.headers['X-Profile'] = json.dumps(profile.to_dict(), separators=(',', ':'))
+    return response
+
+
+def _wants_columnar() -> bool:
+    """True when the client prefers the binary columnar format over JSON"""
+    best = request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE])
+    return best == COLUMNAR_MIMETYPE
+
+
+def _read_request() -> Tuple[Dict, Optional[CityArrays]]:
+    """
+    Parse a JSON or columnar request body into its parameters and, for
+    columnar bodies, the decoded city
+    """
+    with stage('parse'):
+        if request.mimetype == COLUMNAR_MIMETYPE:
+            city, params = decode_city(request.get_data())
+            return params, city
+        return request.json, None
+
+
+def _read_columns() -> Tuple[Dict, BuildingColumns]:
+    """Parse a request body into its parameters and the buildings' analytics columns"""
+    data, city = _read_request()
+    with stage('convert'):
+        if city is not None:
+            return data, BuildingColumns.from_city(city)
+        return data, BuildingColumns.from_buildings(data.get('buildings', []))
+
+
+def _columnar_response(chunks: Iterator[bytes]) -> Response:
+    return Response(timed_stream('serialise', chunks), mimetype=COLUMNAR_MIMETYPE)
+
+
+def _json_response(data: Dict) -> Response:
+    with stage('serialise'):
+        return jsonify(data)
+
+
+def _cache_header(response: Response, hit: bool) -> Response:
+    """Tag a response with whether it was served from the result cache"""
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+def _request_extent(data: Dict) -> Tuple[float, float, float, float]:
+    """The city extent of a request: ``extent``, else the ``grid_size`` square, else the default"""
+    return resolve_extent(data.get('extent'), data.get('grid_size'))
 
 
 @app.route('/api/generate-positions', methods=['POST'])
@@ -22,19 +152,154 @@ def generate_positions():
     Generate optimal building positions using Poisson disk sampling
     """
     try:
-        data = request.json
-        grid_size = data.get('grid_size', 60)
-        building_count = data.get('building_count', 50)
+        with stage('parse'):
+            data = request.json
+        with stage('compute'):
+            positions, saturated = sample_positions(data)
         
-        generator = CityGenerator(grid_size=grid_size, building_count=building_count)
-        positions = generator.generate_spatial_distribution()
+        if _wants_columnar():
+            return _columnar_response(iter_encode(
+                {'positions': positions.astype('<f4')},
+                {'success': True, 'count': len(positions), 'saturated': saturated}
+            ))
         
-        return jsonify({
+        return _json_response({
             'success': True,
             'positions': positions.tolist(),
-            'count': len(positions)
+            'count': len(positions),
+            'saturated': saturated
         })
     
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/generate-positions/tiled', methods=['POST'])
+def generate_positions_tiled():
+    """
+    Generate positions for very large grids tile by tile, streaming one
+    NDJSON line per tile as soon as it finishes and a summary line last
+    """
+    try:
+        with stage('parse'):
+            data = request.json
+        tiles = iter_tiled_positions(data)
+        # Invalid parameters fail on the first tile, before streaming starts
+        with stage('compute'):
+            first = next(tiles, None)
+        
+        def lines() -> Iterator[bytes]:
+            count = tile_count = 0
+            saturated = False
+            for result in chain([first] if first is not None else [], tiles):
+                count += len(result.positions)
+                tile_count += 1
+                saturated = saturated or result.sampling.saturated
+                yield (json.dumps({
+                    'tile': [result.tile.row, result.tile.col],
+                    'origin': list(result.tile.origin),
+                    'size': list(result.tile.size),
+                    'count': len(result.positions),
+                    'saturated': result.sampling.saturated,
+                    'positions': result.positions.tolist()
+                }) + '\n').encode()
+            yield (json.dumps({
+                'success': True,
+                'done': True,
+                'tiles': tile_count,
+                'count': count,
+                'saturated': saturated
+            }) + '\n').encode()
+        
+        return Response(timed_stream('serialise', lines()), mimetype='application/x-ndjson')
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/generate-city/stream', methods=['POST'])
+def generate_city_stream():
+    """
+    Build a city phase by phase, streaming every completed phase (and
+    optional annealing snapshots) as NDJSON lines or server-sent events
+    """
+    try:
+        data, city = _read_request()
+        if city is None:
+            with stage('convert'):
+                city = CityArrays.from_dicts(data.get('buildings', []), dtype=np.float64)
+        events = iter_city_phases(city, data)
+        # Invalid parameters fail in the first phase, before streaming starts
+        with stage('compute'):
+            first = next(events, None)
+        
+        best = request.accept_mimetypes.best_match(['application/x-ndjson', EVENT_STREAM_MIMETYPE])
+        sse = best == EVENT_STREAM_MIMETYPE
+        
+        def frame(event: str, payload: Dict) -> bytes:
+            if sse:
+                return f'event: {event}\ndata: {json.dumps(payload)}\n\n'.encode()
+            return (json.dumps({'event': event, **payload}) + '\n').encode()
+        
+        def frames() -> Iterator[bytes]:
+            phases = placed = 0
+            unplaced: List[str] = []
+            for event in chain([first] if first is not None else [], events):
+                if isinstance(event, PhaseResult):
+                    summary = phase_summary(city, event)
+                    phases += 1
+                    placed += summary['placed']
+                    unplaced += summary['unplaced']
+                    yield frame('phase', {
+                        **summary,
+                        'buildings': phase_city(city, event).to_dicts()
+                    })
+                else:
+                    yield frame('snapshot', {
+                        'phase': event.phase,
+                        'level': event.level,
+                        'temperature': event.temperature,
+                        'energy': event.energy,
+                        'ids': [city.ids[i] for i in event.indices.tolist()],
+                        'positions': event.positions.tolist()
+                    })
+            yield frame('done', {
+                'success': True,
+                'phases': phases,
+                'count': len(city),
+                'placed': placed,
+                'unplaced': unplaced
+            })
+        
+        response = Response(timed_stream('serialise', frames()),
+                            mimetype=EVENT_STREAM_MIMETYPE if sse else 'application/x-ndjson')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
     except Exception as e:
         return jsonify({
             'success': False,
@@ -48,21 +313,92 @@ def analyze_city():
     Analyze city performance and return comprehensive metrics
     """
     try:
-        city_data = request.json
-        performance = analytics.analyze_city_performance(city_data)
+        city_data, columns = _read_columns()
+        seed = city_data.get('seed')
+        extent = _request_extent(city_data)
         
-        # Calculate additional metrics
-        buildings = city_data.get('buildings', [])
-        population = calculate_population_estimate(buildings)
+        # Scores are deterministic; the population estimate only when seeded
+        # and the report timestamp never, so both are added per response
+        key = cache_key('analyze-city', columns, {'seed': seed, 'extent': list(extent)})
+        performance = result_cache.get(key)
+        hit = performance is not None
+        with stage('compute'):
+            if not hit:
+                performance = analytics.analyze_city_performance({'buildings': columns, 'extent': extent})
+                del performance['timestamp']
+                performance['building_count'] = len(columns)
+                performance['walkability'] = calculate_walkability(columns)
+                if seed is not None:
+                    performance['estimated_population'] = calculate_population_estimate(columns, seed=seed)
+                result_cache.set(key, performance)
+            
+            # Calculate additional metrics
+            if seed is None:
+                performance['estimated_population'] = calculate_population_estimate(columns)
+            performance['timestamp'] = datetime.now().isoformat()
+            
+            city_id = city_data.get('city_id')
+            if city_id is not None:
+                analytics.record_performance(str(city_id), performance, city_data.get('timestamp'))
         
-        performance['estimated_population'] = population
-        performance['building_count'] = len(buildings)
+        if _wants_columnar():
+            return _cache_header(_columnar_response(iter_encode({}, {
+                'success': True,
+                'performance': performance
+            })), hit)
         
-        return jsonify({
+        return _cache_header(_json_response({
             'success': True,
             'performance': performance
+        }), hit)
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/trends/<city_id>', methods=['GET'])
+def score_trends(city_id: str):
+    """
+    Recorded score history of a city: summary statistics plus the raw
+    series (optionally with a rolling mean) or downsampled buckets
+    """
+    try:
+        args = request.args
+        columns = args.get('columns')
+        trends = analytics.score_trends(
+            city_id,
+            start=args.get('start', type=float),
+            end=args.get('end', type=float),
+            columns=columns.split(',') if columns else None,
+            window=args.get('window', type=int),
+            buckets=args.get('buckets', type=int)
+        )
+        if trends is None:
+            return jsonify({
+                'success': False,
+                'error': 'City not found'
+            }), 404
+        
+        return _json_response({
+            'success': True,
+            'trends': trends
         })
     
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
     except Exception as e:
         return jsonify({
             'success': False,
@@ -76,44 +412,73 @@ def optimize_layout():
     Optimize building layout using simulated annealing
     """
     try:
-        data = request.json
-        buildings_data = data.get('buildings', [])
-        
-        # Convert to Building objects
-        buildings = [
-            Building(
-                id=b['id'],
-                name=b['name'],
-                type=b['type'],
-                position=tuple(b['position']),
-                size=tuple(b['size']),
-                color=b['color'],
-                phase=b['phase']
-            )
-            for b in buildings_data
-        ]
-        
-        # Optimize layout
-        optimized = city_generator.optimize_layout(buildings)
-        
-        # Convert back to dict
-        optimized_data = [
-            {
-                'id': b.id,
-                'name': b.name,
-                'type': b.type,
-                'position': list(b.position),
-                'size': list(b.size),
-                'color': b.color,
-                'phase': b.phase
-            }
-            for b in optimized
-        ]
+        data, city = _read_request()
+        if city is None:
+            with stage('convert'):
+                # float64 columns keep the JSON round trip exact
+                city = CityArrays.from_dicts(data.get('buildings', []), dtype=np.float64)
+        
+        with stage('compute'):
+            optimized, summary = optimize_city_task(city, data)
+        
+        if _wants_columnar():
+            return _columnar_response(encode_city(optimized, {
+                'success': True,
+                'annealing': summary
+            }))
         
+        with stage('serialise'):
+            return jsonify({
+                'success': True,
+                'buildings': optimized.to_dicts(),
+                'annealing': summary
+            })
+    
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'buildings': optimized_data
-        })
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/place-buildings', methods=['POST'])
+def place_buildings():
+    """
+    Place buildings by type under zoning rasters without footprint overlaps
+    """
+    try:
+        data, city = _read_request()
+        if city is None:
+            with stage('convert'):
+                city = CityArrays.from_dicts(data.get('buildings', []), dtype=np.float64)
+        
+        with stage('compute'):
+            placed, summary = place_city_task(city, data)
+        
+        if _wants_columnar():
+            return _columnar_response(encode_city(placed, {
+                'success': True,
+                'placement': summary
+            }))
+        
+        with stage('serialise'):
+            return jsonify({
+                'success': True,
+                'buildings': placed.to_dicts(),
+                'placement': summary
+            })
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     
     except Exception as e:
         return jsonify({
@@ -128,18 +493,88 @@ def generate_heatmap():
     Generate density heatmap data for visualization
     """
     try:
-        data = request.json
-        buildings = data.get('buildings', [])
+        data, columns = _read_columns()
         resolution = data.get('resolution', 20)
+        columnar = _wants_columnar()
+        params = {
+            'resolution': resolution,
+            'extent': list(_request_extent(data)),
+            'kernel': data.get('kernel', 'stencil'),
+            'sigma': data.get('sigma', 1.0),
+            'bandwidth': data.get('bandwidth'),
+            'weight_by_volume': data.get('weight_by_volume', False),
+            'dtype': 'float32' if columnar or data.get('dtype') == 'float32' else 'float64'
+        }
         
-        heatmap = analytics.generate_heatmap_data(buildings, resolution)
+        key = cache_key('generate-heatmap', columns, params)
+        heatmap = result_cache.get(key)
+        hit = heatmap is not None
+        if not hit:
+            with stage('compute'):
+                heatmap = analytics.generate_heatmap_data(columns, **{
+                    **params,
+                    'dtype': np.float32 if params['dtype'] == 'float32' else np.float64
+                })
+            result_cache.set(key, heatmap)
         
-        return jsonify({
+        if columnar:
+            return _cache_header(_columnar_response(iter_encode(
+                {'heatmap': heatmap},
+                {'success': True, 'resolution': resolution}
+            )), hit)
+        
+        return _cache_header(_json_response({
             'success': True,
             'heatmap': heatmap.tolist(),
             'resolution': resolution
+        }), hit)
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/heatmap-pyramids', methods=['POST'])
+def create_heatmap_pyramid():
+    """
+    Compute a city's heatmap once at high resolution, with coarser levels,
+    for serving as cached tiles
+    """
+    try:
+        data = request.json
+        with stage('compute'):
+            pyramid_id = pyramids.create(
+                data.get('buildings', []),
+                extent=_request_extent(data),
+                resolution=data.get('resolution', DEFAULT_PYRAMID_RESOLUTION),
+                tile_size=data.get('tile_size', DEFAULT_TILE_SIZE),
+                kernel=data.get('kernel', 'stencil'),
+                sigma=data.get('sigma', 1.0),
+                bandwidth=data.get('bandwidth'),
+                weight_by_volume=data.get('weight_by_volume', False),
+                analytics=analytics
+            )
+        
+        return jsonify({
+            'success': True,
+            'pyramid_id': pyramid_id,
+            **pyramids.get(pyramid_id).describe()
         })
     
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
     except Exception as e:
         return jsonify({
             'success': False,
@@ -147,13 +582,471 @@ def generate_heatmap():
         }), 500
 
 
+@app.route('/api/heatmap-pyramids/<pyramid_id>', methods=['GET'])
+def describe_heatmap_pyramid(pyramid_id: str):
+    """Levels and tile grid of a heatmap pyramid"""
+    pyramid = pyramids.get(pyramid_id)
+    if pyramid is None:
+        return jsonify({
+            'success': False,
+            'error': 'Pyramid not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'pyramid_id': pyramid_id,
+        **pyramid.describe()
+    })
+
+
+@app.route('/api/heatmap-pyramids/<pyramid_id>/tiles/<int:level>/<int:x>/<int:z>', methods=['GET'])
+def heatmap_tile(pyramid_id: str, level: int, x: int, z: int):
+    """One tile of a heatmap pyramid, served from the tile cache when possible"""
+    try:
+        tile, hit = pyramids.tile(pyramid_id, level, x, z)
+    except IndexError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+    if tile is None:
+        return jsonify({
+            'success': False,
+            'error': 'Pyramid not found'
+        }), 404
+    
+    if _wants_columnar():
+        return _cache_header(_columnar_response(iter_encode(
+            {'tile': tile},
+            {'success': True, 'level': level, 'x': x, 'z': z}
+        )), hit)
+    
+    return _cache_header(_json_response({
+        'success': True,
+        'level': level,
+        'x': x,
+        'z': z,
+        'tile': tile.tolist()
+    }), hit)
+
+
+@app.route('/api/heatmap-pyramids/<pyramid_id>/edits', methods=['POST'])
+def edit_heatmap_pyramid(pyramid_id: str):
+    """
+    Apply add/move/remove edits to a pyramid's city, invalidating only the
+    tiles over the changed regions
+    """
+    try:
+        edits = request.json.get('edits', [])
+        with stage('compute'):
+            changed = pyramids.apply(pyramid_id, edits)
+        if changed is None:
+            return jsonify({
+                'success': False,
+                'error': 'Pyramid not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'pyramid_id': pyramid_id,
+            'version': pyramids.get(pyramid_id).version,
+            'changed_tiles': {str(level): count for level, count in changed.items()}
+        })
+    
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e.args[0]) if e.args else str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/heatmap-pyramids/<pyramid_id>', methods=['DELETE'])
+def delete_heatmap_pyramid(pyramid_id: str):
+    """Drop a heatmap pyramid and its cached tiles"""
+    if not pyramids.delete(pyramid_id):
+        return jsonify({
+            'success': False,
+            'error': 'Pyramid not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'pyramid_id': pyramid_id
+    })
+
+
+@app.route('/api/batch/analyze-city', methods=['POST'])
+def analyze_city_batch():
+    """
+    Score many city variants, and optionally heatmap them, in one call
+    """
+    try:
+        with stage('parse'):
+            data = request.json
+        columnar = _wants_columnar()
+        extent = _request_extent(data)
+        
+        heatmap_params = data.get('heatmap')
+        heatmap_cells = 0
+        if heatmap_params is not None:
+            rows, cols = resolve_resolution(heatmap_params.get('resolution', 20))
+            heatmap_cells = rows * cols
+            heatmap_params = {
+                'resolution': heatmap_params.get('resolution', 20),
+                'extent': heatmap_params.get('extent', extent),
+                'kernel': heatmap_params.get('kernel', 'stencil'),
+                'sigma': heatmap_params.get('sigma', 1.0),
+                'bandwidth': heatmap_params.get('bandwidth'),
+                'weight_by_volume': heatmap_params.get('weight_by_volume', False),
+                'dtype': np.float32 if columnar or heatmap_params.get('dtype') == 'float32' else np.float64
+            }
+        
+        with stage('convert'):
+            if 'variants' in data:
+                base = data.get('base', {}).get('buildings', [])
+                variants = data['variants']
+                check_batch_size([len(base)] * len(variants), heatmap_cells)
+                batches = [VariantBatch.from_variants(base, variants)]
+                count = len(batches[0])
+            else:
+                cities = [city.get('buildings', []) for city in data.get('cities', [])]
+                check_batch_size([len(buildings) for buildings in cities], heatmap_cells)
+                batches = stack_cities(cities)
+                count = len(cities)
+        
+        with stage('compute'):
+            reports, heatmaps = analyze_batches(batches, count, heatmap_params, extent)
+            ranking = sorted(range(count), key=lambda i: reports[i]['overall_score'], reverse=True)
+        
+        if columnar:
+            columns = {'heatmaps': heatmaps} if heatmaps is not None else {}
+            return _columnar_response(iter_encode(columns, {
+                'success': True,
+                'count': count,
+                'performance': reports,
+                'ranking': ranking
+            }))
+        
+        response = {
+            'success': True,
+            'count': count,
+            'performance': reports,
+            'ranking': ranking
+        }
+        if heatmaps is not None:
+            response['heatmaps'] = heatmaps.tolist()
+        return _json_response(response)
+    
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e.args[0]) if e.args else str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/sessions', methods=['POST'])
+def create_session():
+    """
+    Start an incremental analysis session for a city
+    """
+    try:
+        data = request.json
+        session_id = sessions.create(data.get('buildings', []), _request_extent(data))
+        analyzer = sessions.get(session_id)
+        
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'performance': analyzer.performance()
+        }), 201
+    
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e.args[0]) if e.args else str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def session_performance(session_id: str):
+    """Current scores of an analysis session"""
+    analyzer, lock = sessions.lookup(session_id)
+    if analyzer is None:
+        return jsonify({
+            'success': False,
+            'error': 'Session not found'
+        }), 404
+    
+    with lock:
+        performance = analyzer.performance()
+    
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'performance': performance
+    })
+
+
+@app.route('/api/sessions/<session_id>/edits', methods=['POST'])
+def edit_session(session_id: str):
+    """
+    Apply add/move/remove edits to a session and return the updated scores
+    """
+    analyzer, lock = sessions.lookup(session_id)
+    if analyzer is None:
+        return jsonify({
+            'success': False,
+            'error': 'Session not found'
+        }), 404
+    
+    try:
+        edits = request.json.get('edits', [])
+        with lock:
+            analyzer.apply(edits)
+            performance = analyzer.performance()
+        
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'performance': performance
+        })
+    
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e.args[0]) if e.args else str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id: str):
+    """End an analysis session"""
+    if not sessions.delete(session_id):
+        return jsonify({
+            'success': False,
+            'error': 'Session not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'session_id': session_id
+    })
+
+
+@app.route('/api/jobs/<kind>', methods=['POST'])
+def submit_job(kind: str):
+    """
+    Queue a generate-positions, optimize-layout, place-buildings or generate-city request for background execution
+    """
+    task = JOB_TASKS.get(kind)
+    if task is None:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown job type: {kind}'
+        }), 404
+    
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ValueError("request body must be a JSON object")
+        JOB_CHECKS[kind](data)
+        job = job_queue.submit(kind, task, data, timeout=data.get('timeout'))
+        
+        return jsonify({
+            'success': True,
+            **job.to_dict()
+        }), 202
+    
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e.args[0]) if e.args else str(e)
+        }), 400
+    
+    except QueueFullError as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    """Poll the status of a queued job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        **job.to_dict()
+    })
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id: str):
+    """Fetch the result of a finished job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    if job.status not in FINISHED_STATES:
+        return jsonify({
+            'success': False,
+            **job.to_dict()
+        }), 202
+    
+    if job.status != JOB_COMPLETED:
+        status_codes = {JOB_CANCELLED: 410, JOB_TIMED_OUT: 504}
+        return jsonify({
+            'success': False,
+            **job.to_dict()
+        }), status_codes.get(job.status, 500)
+    
+    return jsonify({
+        'success': True,
+        **job.result
+    })
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        **job.to_dict()
+    })
+
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Result cache hit, miss and occupancy counters"""
+    return jsonify({
+        'success': True,
+        'cache': result_cache.stats(),
+        'sessions': sessions.stats(),
+        'tiles': pyramids.cache.stats(),
+        'warmup': warmup.stats()
+    })
+
+
+@app.route('/api/cache', methods=['DELETE'])
+def clear_cache():
+    """Drop every cached result"""
+    result_cache.clear()
+    pyramids.cache.clear()
+    return jsonify({
+        'success': True,
+        'cache': result_cache.stats(),
+        'sessions': sessions.stats(),
+        'tiles': pyramids.cache.stats(),
+        'warmup': warmup.stats()
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Service metrics in the Prometheus text exposition format"""
+    cache = result_cache.stats()
+    for name in ('hits', 'misses', 'evictions', 'expirations'):
+        metrics.set(f'city_cache_{name}_total', cache[name])
+    metrics.set('city_cache_bytes', cache['bytes'])
+    metrics.set('city_cache_entries', cache['entries'])
+    
+    jobs = job_queue.stats()
+    for name, value in jobs.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics.set(f'city_jobs_{name}', value)
+    metrics.set('city_sessions', sessions.stats()['sessions'])
+    
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id: str):
+    """
+    cProfile report of a request sent with ``X-Profile: cprofile``;
+    ``?format=raw`` returns the pstats file itself
+    """
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in PROFILE_SORT_KEYS:
+        return jsonify({
+            'success': False,
+            'error': f"sort must be one of {', '.join(PROFILE_SORT_KEYS)}"
+        }), 400
+    
+    try:
+        if request.args.get('format') == 'raw':
+            with open(profile_path(profile_id), 'rb') as f:
+                return Response(f.read(), mimetype='application/octet-stream')
+        return Response(profile_report(profile_id, sort=sort),
+                        mimetype='text/plain')
+    
+    except (OSError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Profile not found'
+        }), 404
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'service': 'Python AI City Service',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'jobs': job_queue.stats(),
+        'cache': result_cache.stats(),
+        'sessions': sessions.stats(),
+        'pyramids': pyramids.stats(),
+        'history': analytics.metrics_history.stats(),
+        'warmup': warmup.stats()
     })
 
 
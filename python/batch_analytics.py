@@ -0,0 +1,208 @@
+"""
+Batch Analytics Module
+Score and heatmap many city variants in stacked, vectorised passes
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+
+from city_analytics import (
+    _PAIR_BLOCK_ENTRIES, density_score, distribution_score, diversity_score,
+    efficiency_score, mean_pairwise_distance, performance_report, quadrant_index,
+    sustainability_score
+)
+from city_arrays import BUILDING_TYPES
+from heatmap import DEFAULT_EXTENT, density_heatmap
+
+
+@dataclass
+class VariantBatch:
+    """
+    Cities with the same building count stacked along a leading variant axis.
+
+    ``positions`` is (v, n, 2); ``sizes`` is (v, n, 3) and ``type_codes``
+    (v, n), or (n, 3) and (n,) when every variant shares them. ``indices``
+    are the variants' positions in the caller's original order.
+    """
+    positions: np.ndarray
+    sizes: np.ndarray
+    type_codes: np.ndarray
+    type_names: List[str]
+    indices: List[int]
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def building_count(self) -> int:
+        return self.positions.shape[1]
+
+    @classmethod
+    def from_variants(cls, base: Sequence[Dict], variants: Sequence) -> 'VariantBatch':
+        """
+        One base city plus per-variant positions, each an (n, 2) array of
+        x/z or an (n, 3) array of x/y/z in the base city's building order
+        """
+        type_names = list(BUILDING_TYPES)
+        _, sizes, type_codes = _parse(base, type_names)
+
+        positions = np.asarray(variants, dtype=np.float64)
+        if positions.ndim == 2 and len(base) == 0:
+            positions = positions.reshape(len(positions), 0, 2)
+        if positions.ndim != 3 or positions.shape[1] != len(base) or positions.shape[2] not in (2, 3):
+            raise ValueError(f"variants must be a list of ({len(base)}, 2) or ({len(base)}, 3) position arrays")
+        if positions.shape[2] == 3:
+            positions = positions[:, :, ::2]
+
+        return cls(np.ascontiguousarray(positions), sizes, type_codes, type_names,
+                   list(range(len(positions))))
+
+
+def _parse(buildings: Sequence[Dict], type_names: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Positions, sizes and type codes of building dicts against a shared type table"""
+    lookup = {name: code for code, name in enumerate(type_names)}
+    positions = np.empty((len(buildings), 2))
+    sizes = np.empty((len(buildings), 3))
+    type_codes = np.empty(len(buildings), dtype=np.int64)
+
+    for i, b in enumerate(buildings):
+        position, size = b['position'], b['size']
+        positions[i] = (position[0], position[2])
+        sizes[i] = (size[0], size[1], size[2])
+        code = lookup.get(b['type'])
+        if code is None:
+            code = lookup[b['type']] = len(type_names)
+            type_names.append(b['type'])
+        type_codes[i] = code
+
+    return positions, sizes, type_codes
+
+
+def stack_cities(cities: Sequence[Sequence[Dict]]) -> List[VariantBatch]:
+    """Group independent cities by building count and stack each group"""
+    type_names = list(BUILDING_TYPES)
+    groups: Dict[int, List[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]] = {}
+    for index, buildings in enumerate(cities):
+        parsed = _parse(buildings, type_names)
+        groups.setdefault(len(buildings), []).append((index,) + parsed)
+
+    return [
+        VariantBatch(
+            positions=np.stack([member[1] for member in members]),
+            sizes=np.stack([member[2] for member in members]),
+            type_codes=np.stack([member[3] for member in members]),
+            type_names=type_names,
+            indices=[member[0] for member in members]
+        )
+        for members in groups.values()
+    ]
+
+
+def batch_mean_pairwise_distance(positions: np.ndarray) -> np.ndarray:
+    """
+    Mean pairwise distance of every layout in a (v, n, 2) stack.
+
+    As many layouts as fit in one bounded block of the (v, n, n) distance
+    tensor are reduced together; layouts too large for a single block fall
+    back to the per-layout blockwise reduction.
+    """
+    variants, n = positions.shape[:2]
+    means = np.zeros(variants)
+    if n < 2:
+        return means
+
+    per_block = _PAIR_BLOCK_ENTRIES // (n * n)
+    if per_block == 0:
+        for v in range(variants):
+            means[v] = mean_pairwise_distance(positions[v])
+        return means
+
+    for start in range(0, variants, per_block):
+        block = positions[start:start + per_block]
+        dx = block[:, :, None, 0] - block[:, None, :, 0]
+        dz = block[:, :, None, 1] - block[:, None, :, 1]
+        dx *= dx
+        dz *= dz
+        dx += dz
+        np.sqrt(dx, out=dx)
+        # The diagonal is zero and every pair is counted twice
+        means[start:start + len(block)] = dx.sum(axis=(1, 2)) / (n * (n - 1))
+    return means
+
+
+def score_batch(batch: VariantBatch, extent: Sequence[float] = DEFAULT_EXTENT) -> List[Dict]:
+    """``analyze_city_performance`` reports for every variant of a batch"""
+    variants, n = len(batch), batch.building_count
+    if n == 0:
+        empty = performance_report(0.0, 0.0, 0.0, 0.0, 0.0)
+        return [{**empty, 'building_count': 0} for _ in range(variants)]
+
+    mean_distances = batch_mean_pairwise_distance(batch.positions)
+
+    # Quadrant and type counts for every variant from one bincount each
+    offsets = np.arange(variants)[:, None]
+    quadrants = np.bincount((quadrant_index(batch.positions, extent) + offsets * 4).ravel(),
+                            minlength=variants * 4).reshape(variants, 4)
+
+    types = len(batch.type_names)
+    type_codes = np.broadcast_to(batch.type_codes, (variants, n))
+    type_counts = np.bincount((type_codes + offsets * types).ravel(),
+                              minlength=variants * types).reshape(variants, types)
+
+    sizes = np.broadcast_to(batch.sizes, (variants, n, 3))
+    occupied = np.einsum('vi,vi->v', sizes[:, :, 0], sizes[:, :, 2])
+
+    infrastructure = BUILDING_TYPES.index('infrastructure')
+    public = BUILDING_TYPES.index('public')
+
+    reports = []
+    for v in range(variants):
+        report = performance_report(
+            efficiency=efficiency_score(mean_distances[v]),
+            density=density_score(float(occupied[v]), extent),
+            distribution=distribution_score(quadrants[v]),
+            diversity=diversity_score(type_counts[v]),
+            sustainability=sustainability_score(int(type_counts[v, infrastructure]),
+                                                int(type_counts[v, public]), n)
+        )
+        report['building_count'] = n
+        reports.append(report)
+    return reports
+
+
+def heatmap_batch(batch: VariantBatch, resolution=20, extent: Sequence[float] = DEFAULT_EXTENT,
+                  kernel: str = 'stencil', sigma: float = 1.0,
+                  bandwidth: Optional[float] = None, weight_by_volume: bool = False,
+                  dtype=np.float64) -> np.ndarray:
+    """Stacked (v, rows, cols) heatmaps of every variant of a batch"""
+    weights = None
+    if weight_by_volume:
+        weights = np.broadcast_to(np.prod(batch.sizes, axis=-1),
+                                  batch.positions.shape[:2])
+    return density_heatmap(batch.positions, resolution=resolution, extent=extent,
+                           kernel=kernel, sigma=sigma, bandwidth=bandwidth,
+                           weights=weights, dtype=dtype)
+
+
+def analyze_batches(batches: Sequence[VariantBatch], count: int,
+                    heatmap: Optional[Dict] = None,
+                    extent: Sequence[float] = DEFAULT_EXTENT) -> Tuple[List[Dict], Optional[np.ndarray]]:
+    """
+    Score every batch over ``extent`` and scatter the reports back into the
+    original order. With ``heatmap`` parameters, also return one
+    (count, rows, cols) tensor.
+    """
+    reports: List[Optional[Dict]] = [None] * count
+    heatmaps = None
+
+    for batch in batches:
+        for index, report in zip(batch.indices, score_batch(batch, extent)):
+            reports[index] = report
+        if heatmap is not None:
+            stacked = heatmap_batch(batch, **heatmap)
+            if heatmaps is None:
+                heatmaps = np.empty((count,) + stacked.shape[1:], dtype=stacked.dtype)
+            heatmaps[batch.indices] = stacked
+
+    return reports, heatmaps
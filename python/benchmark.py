@@ -0,0 +1,397 @@
+"""
+Benchmark Module
+Scaling benchmarks for the generation, optimisation, analytics and API services
+
+Usage:
+    python benchmark.py --sizes 50,500,5000 --output results.json
+    python benchmark.py --compare baseline.json --threshold 0.15
+    python benchmark.py --startup
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from city_arrays import BUILDING_TYPES
+
+
+DEFAULT_SIZES = (50, 500, 5000, 50000, 100000)
+DEFAULT_GRID_SIZES = (60,)
+DEFAULT_SEED = 42
+DEFAULT_THRESHOLD = 0.10
+# Slowdowns smaller than this many seconds are treated as timer noise
+DEFAULT_MIN_DELTA = 0.001
+
+PERCENTILES = (50, 90, 99)
+
+
+def make_buildings(count: int, grid_size: float, seed: int = DEFAULT_SEED) -> List[Dict]:
+    """Deterministic building dicts spread uniformly over a ``grid_size`` square"""
+    rng = np.random.default_rng(seed)
+    half = grid_size / 2
+    positions = rng.uniform(-half, half, size=(count, 2)).tolist()
+    sizes = rng.uniform(2, 6, size=(count, 3)).tolist()
+    types = rng.integers(0, len(BUILDING_TYPES), size=count).tolist()
+    phases = rng.integers(1, 6, size=count).tolist()
+
+    return [
+        {
+            'id': f'building-{i}',
+            'name': f'{BUILDING_TYPES[types[i]].title()} {i}',
+            'type': BUILDING_TYPES[types[i]],
+            'position': [positions[i][0], 0.0, positions[i][1]],
+            'size': sizes[i],
+            'color': '#4a90d9',
+            'phase': phases[i]
+        }
+        for i in range(count)
+    ]
+
+
+# Each setup builds its inputs untimed and returns the callable to time
+
+def _setup_generate(count: int, grid_size: float, seed: int) -> Callable[[], Any]:
+    from ai_city_generator import CityGenerator
+    generator = CityGenerator(grid_size=grid_size, building_count=count)
+    return lambda: generator.generate_spatial_distribution(seed=seed)
+
+
+def _setup_optimize(count: int, grid_size: float, seed: int) -> Callable[[], Any]:
+    from ai_city_generator import CityGenerator
+    from city_arrays import CityArrays
+    generator = CityGenerator(grid_size=grid_size, building_count=count)
+    buildings = CityArrays.from_dicts(make_buildings(count, grid_size, seed), np.float64).to_buildings()
+    return lambda: generator.optimize_layout(buildings, seed=seed)
+
+
+def _setup_score_optimize(count: int, grid_size: float, seed: int) -> Callable[[], Any]:
+    from ai_city_generator import CityGenerator
+    from city_arrays import CityArrays
+    generator = CityGenerator(grid_size=grid_size, building_count=count)
+    city = CityArrays.from_dicts(make_buildings(count, grid_size, seed), np.float64)
+    # A fixed step count rather than a time budget, so the case measures throughput
+    return lambda: generator.optimize_city_scores(city, time_budget=None, max_steps=2000, seed=seed)
+
+
+def _setup_place(count: int, grid_size: float, seed: int) -> Callable[[], Any]:
+    from ai_city_generator import CityGenerator
+    from city_arrays import CityArrays
+    generator = CityGenerator(grid_size=grid_size, building_count=count)
+    city = CityArrays.from_dicts(make_buildings(count, grid_size, seed), np.float64)
+    return lambda: generator.place_city(city, seed=seed)
+
+
+def _setup_performance(count: int, grid_size: float, seed: int) -> Callable[[], Any]:
+    from city_analytics import CityAnalytics
+    analytics = CityAnalytics()
+    city_data = {'buildings': make_buildings(count, grid_size, seed)}
+    return lambda: analytics.analyze_city_performance(city_data)
+
+
+def _setup_sub_score(score: str) -> Callable:
+    def setup(count: int, grid_size: float, seed: int) -> Callable[[], Any]:
+        from city_analytics import BuildingColumns, CityAnalytics
+        analytics = CityAnalytics()
+        columns = BuildingColumns.from_buildings(make_buildings(count, grid_size, seed))
+        method = getattr(analytics, f'_calculate_{score}')
+        return lambda: method(columns)
+    return setup
+
+
+def _setup_heatmap(count: int, grid_size: float, seed: int) -> Callable[[], Any]:
+    from city_analytics import BuildingColumns, CityAnalytics
+    analytics = CityAnalytics()
+    columns = BuildingColumns.from_buildings(make_buildings(count, grid_size, seed))
+    return lambda: analytics.generate_heatmap_data(columns)
+
+
+def _setup_coverage(method: str) -> Callable:
+    def setup(count: int, grid_size: float, seed: int) -> Callable[[], Any]:
+        from ai_city_generator import CityGenerator
+        from city_arrays import CityArrays
+        generator = CityGenerator(grid_size=grid_size, building_count=count)
+        buildings = CityArrays.from_dicts(make_buildings(count, grid_size, seed), np.float64).to_buildings()
+        return lambda: generator._calculate_coverage(buildings, method=method)
+    return setup
+
+
+def _setup_endpoint(route: str, with_buildings: bool) -> Callable:
+    def setup(count: int, grid_size: float, seed: int) -> Callable[[], Any]:
+        import api_service
+        client = api_service.app.test_client()
+        body = {'seed': seed, 'grid_size': grid_size, 'building_count': count}
+        if with_buildings:
+            body['buildings'] = make_buildings(count, grid_size, seed)
+
+        def call():
+            # Measure the computation, not the result cache
+            api_service.result_cache.clear()
+            response = client.post(route, json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f"{route} returned {response.status_code}")
+            return response
+        return call
+    return setup
+
+
+BENCHMARKS: Dict[str, Callable[[int, float, int], Callable[[], Any]]] = {
+    'generator.generate_spatial_distribution': _setup_generate,
+    'generator.optimize_layout': _setup_optimize,
+    'generator.place_city': _setup_place,
+    'generator.optimize_city_scores': _setup_score_optimize,
+    'generator.calculate_coverage': _setup_coverage('hull'),
+    'generator.footprint_coverage': _setup_coverage('footprint'),
+    'analytics.analyze_city_performance': _setup_performance,
+    'analytics.efficiency': _setup_sub_score('efficiency'),
+    'analytics.density': _setup_sub_score('density'),
+    'analytics.distribution': _setup_sub_score('distribution'),
+    'analytics.diversity': _setup_sub_score('diversity'),
+    'analytics.sustainability': _setup_sub_score('sustainability'),
+    'analytics.generate_heatmap_data': _setup_heatmap,
+    'api.generate-positions': _setup_endpoint('/api/generate-positions', False),
+    'api.analyze-city': _setup_endpoint('/api/analyze-city', True),
+    'api.optimize-layout': _setup_endpoint('/api/optimize-layout', True),
+    'api.generate-heatmap': _setup_endpoint('/api/generate-heatmap', True),
+}
+
+
+def case_key(result: Dict) -> str:
+    return f"{result['benchmark']}/n={result['building_count']}/grid={result['grid_size']}"
+
+
+def run_case(benchmark: str, count: int, grid_size: float, seed: int = DEFAULT_SEED,
+             repeat: int = 5, warmup: int = 1) -> Dict:
+    """
+    Time one benchmark at one size.
+
+    Wall times come from ``repeat`` untraced calls after ``warmup`` calls.
+    One further call runs under ``tracemalloc`` to record the peak traced
+    allocation and the net number of memory blocks it left allocated. Peak
+    RSS is the process high-water mark, so it is only per-case when each
+    case runs in a fresh process (the default).
+    """
+    fn = BENCHMARKS[benchmark](count, grid_size, seed)
+    for _ in range(warmup):
+        fn()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sys.getallocatedblocks() - blocks_before
+
+    times = np.array(times)
+    return {
+        'benchmark': benchmark,
+        'building_count': count,
+        'grid_size': grid_size,
+        'seed': seed,
+        'repeat': repeat,
+        'wall_time': {
+            'min': float(times.min()),
+            'mean': float(times.mean()),
+            'max': float(times.max()),
+            **{f'p{q}': float(np.percentile(times, q)) for q in PERCENTILES}
+        },
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'peak_traced_bytes': peak,
+        'allocated_blocks': blocks
+    }
+
+
+def run_suite(benchmarks: Sequence[str], sizes: Sequence[int],
+              grid_sizes: Sequence[float], seed: int = DEFAULT_SEED,
+              repeat: int = 5, warmup: int = 1, isolate: bool = True,
+              progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Run every benchmark over every (size, grid size) pair, each case in a
+    fresh spawned process unless ``isolate`` is False
+    """
+    cases = [(name, count, grid) for name in benchmarks for count in sizes for grid in grid_sizes]
+    results = []
+
+    executor = None
+    if isolate:
+        executor = ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1,
+                                       mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for name, count, grid in cases:
+            args = (name, count, grid, seed, repeat, warmup)
+            try:
+                if executor is not None:
+                    result = executor.submit(run_case, *args).result()
+                else:
+                    result = run_case(*args)
+            except Exception as e:
+                result = {'benchmark': name, 'building_count': count, 'grid_size': grid,
+                          'seed': seed, 'error': str(e)}
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'isolated': isolate
+        },
+        'results': results
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD,
+            statistic: str = 'p50', min_delta: float = DEFAULT_MIN_DELTA) -> List[Dict]:
+    """
+    Cases whose ``statistic`` wall time grew by more than ``threshold``
+    (a fraction) and by more than ``min_delta`` seconds relative to the baseline
+    """
+    previous = {case_key(result): result for result in baseline.get('results', [])
+                if 'wall_time' in result}
+    regressions = []
+
+    for result in current.get('results', []):
+        old = previous.get(case_key(result))
+        if old is None or 'wall_time' not in result:
+            continue
+        before = old['wall_time'][statistic]
+        after = result['wall_time'][statistic]
+        change = (after - before) / before if before > 0 else 0.0
+        result['change'] = change
+        if change > threshold and after - before > min_delta:
+            regressions.append({
+                'case': case_key(result),
+                'baseline': before,
+                'current': after,
+                'change': change
+            })
+
+    return regressions
+
+
+def _print_result(result: Dict):
+    if 'error' in result:
+        print(f"{case_key(result):<70} ERROR {result['error']}", file=sys.stderr)
+        return
+    wall = result['wall_time']
+    print(f"{case_key(result):<70} p50 {wall['p50'] * 1000:10.2f} ms  "
+          f"p90 {wall['p90'] * 1000:10.2f} ms  rss {result['peak_rss_kb'] / 1024:8.1f} MiB",
+          file=sys.stderr)
+
+
+def _number(text: str) -> float:
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def _run_startup_check(args: argparse.Namespace) -> int:
+    from startup import STARTUP_BUDGET_SECONDS, check_startup
+    budget = STARTUP_BUDGET_SECONDS if args.startup_budget is None else args.startup_budget
+    report = check_startup(runs=max(args.repeat, 1), budget=budget)
+
+    total = report['total_seconds']
+    print(f"startup p50 {total['p50'] * 1000:.1f} ms (import {report['import_seconds'] * 1000:.1f} ms, "
+          f"first /health {report['first_health_seconds'] * 1000:.1f} ms), "
+          f"budget {budget * 1000:.0f} ms", file=sys.stderr)
+    for violation in report['violations']:
+        print(f"REGRESSION {violation}", file=sys.stderr)
+
+    output = json.dumps({'startup': report}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 1 if report['violations'] else 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS),
+                        help='comma-separated benchmark names or name prefixes')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated building counts')
+    parser.add_argument('--grid-sizes', default=','.join(map(str, DEFAULT_GRID_SIZES)),
+                        help='comma-separated grid sizes')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--no-isolate', action='store_true',
+                        help='run every case in this process (peak RSS becomes cumulative)')
+    parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    parser.add_argument('--compare', help='baseline results JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed fractional slowdown before a case is flagged')
+    parser.add_argument('--min-delta', type=float, default=DEFAULT_MIN_DELTA,
+                        help='ignore slowdowns smaller than this many seconds')
+    parser.add_argument('--startup', action='store_true',
+                        help='only check cold start to the first /health response against the budget')
+    parser.add_argument('--startup-budget', type=float, default=None,
+                        help='cold start budget in seconds (default: startup.STARTUP_BUDGET_SECONDS)')
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        return _run_startup_check(args)
+
+    prefixes = [name.strip() for name in args.benchmarks.split(',') if name.strip()]
+    benchmarks = [name for name in BENCHMARKS if any(name.startswith(p) for p in prefixes)]
+    if not benchmarks:
+        parser.error(f"no benchmarks match {args.benchmarks}")
+
+    report = run_suite(
+        benchmarks,
+        sizes=[int(size) for size in args.sizes.split(',')],
+        grid_sizes=[_number(size) for size in args.grid_sizes.split(',')],
+        seed=args.seed,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        isolate=not args.no_isolate,
+        progress=_print_result
+    )
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold,
+                                  min_delta=args.min_delta)
+        report['regressions'] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']}: {regression['baseline'] * 1000:.2f} ms -> "
+                  f"{regression['current'] * 1000:.2f} ms ({regression['change']:+.0%})",
+                  file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,10 +4,235 @@ Advanced analytics and visualization for city metrics
 """
 
 import numpy as np
-import pandas as pd
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from dataclasses import dataclass
 from datetime import datetime
 import json
+import time
+
+from city_arrays import BUILDING_TYPES, CityArrays
+from heatmap import DEFAULT_EXTENT, density_heatmap, resolve_extent
+from metrics_history import MetricsHistory
+from spatial_index import nearest_neighbour_distances
+
+# Above this many buildings the condensed pdist matrix gets too large and the
+# mean pairwise distance is reduced block by block instead
+PDIST_MAX_BUILDINGS = 2048
+
+# Upper bound on distance-matrix entries materialised per block
+_PAIR_BLOCK_ENTRIES = 1 << 21
+
+
+@dataclass
+class BuildingColumns:
+    """Columnar view of a building list, parsed once per request"""
+    positions: np.ndarray
+    sizes: np.ndarray
+    type_codes: np.ndarray
+    type_names: List[str]
+    
+    @classmethod
+    def from_buildings(cls, buildings: List[Dict]) -> 'BuildingColumns':
+        """Parse building dicts into position, size and type-code arrays"""
+        type_names = list(BUILDING_TYPES)
+        codes = {name: code for code, name in enumerate(type_names)}
+        
+        positions = np.empty((len(buildings), 2))
+        sizes = np.empty((len(buildings), 3))
+        type_codes = np.empty(len(buildings), dtype=np.int64)
+        
+        for i, b in enumerate(buildings):
+            position, size = b['position'], b['size']
+            positions[i] = (position[0], position[2])
+            sizes[i] = (size[0], size[1], size[2])
+            code = codes.get(b['type'])
+            if code is None:
+                code = codes[b['type']] = len(type_names)
+                type_names.append(b['type'])
+            type_codes[i] = code
+        
+        return cls(positions, sizes, type_codes, type_names)
+    
+    @classmethod
+    def from_city(cls, city: CityArrays) -> 'BuildingColumns':
+        """Zero-copy views over a ``CityArrays``' columns"""
+        return cls(city.xz, city.sizes, city.type_codes, city.type_names)
+    
+    def __len__(self) -> int:
+        return len(self.type_codes)
+    
+    def type_counts(self) -> np.ndarray:
+        """Building count per entry of ``type_names``"""
+        return np.bincount(self.type_codes, minlength=len(self.type_names))
+    
+    def count(self, building_type: str) -> int:
+        if building_type not in self.type_names:
+            return 0
+        return int(np.count_nonzero(self.type_codes == self.type_names.index(building_type)))
+
+
+BuildingsLike = Union[List[Dict], BuildingColumns, CityArrays]
+
+
+def mean_pairwise_distance(positions: np.ndarray, deadline: Optional[float] = None) -> float:
+    """
+    Exact mean Euclidean distance over all unordered pairs of (n, 2) positions.
+
+    Small inputs go through ``scipy.spatial.distance.pdist``; larger ones are
+    reduced in row blocks so memory stays bounded regardless of n. With a
+    ``deadline`` (a ``time.perf_counter`` value) the blockwise reduction
+    raises TimeoutError once a block finishes past it.
+    """
+    n = len(positions)
+    if n < 2:
+        return 0.0
+    
+    if n <= PDIST_MAX_BUILDINGS:
+        from scipy.spatial.distance import pdist
+        return float(np.mean(pdist(positions)))
+    
+    x = np.ascontiguousarray(positions[:, 0])
+    z = np.ascontiguousarray(positions[:, 1])
+    rows = max(1, _PAIR_BLOCK_ENTRIES // n)
+    total = 0.0
+    
+    for start in range(0, n, rows):
+        end = min(start + rows, n)
+        # Pairs inside the block are seen twice, pairs with later rows once
+        dx = x[start:end, None] - x[None, start:]
+        dz = z[start:end, None] - z[None, start:]
+        dx *= dx
+        dz *= dz
+        dx += dz
+        np.sqrt(dx, out=dx)
+        total += dx[:, end - start:].sum() + dx[:, :end - start].sum() / 2
+        if deadline is not None and time.perf_counter() > deadline:
+            raise TimeoutError("pairwise distances did not finish before the deadline")
+    
+    return total / (n * (n - 1) / 2)
+
+
+# Bumped whenever a score's definition changes, so results cached under an
+# older definition are never served (2: quadrants split at the extent centre)
+SCORING_VERSION = 2
+
+# Weights of each sub-score in the overall score
+SCORE_WEIGHTS = {
+    'efficiency': 0.25,
+    'density': 0.20,
+    'distribution': 0.25,
+    'diversity': 0.15,
+    'sustainability': 0.15
+}
+
+
+def efficiency_score(avg_distance: float) -> float:
+    """Efficiency from the mean distance between buildings"""
+    # Optimal distance is around 8-12 units
+    optimal_distance = 10.0
+    efficiency = max(0, 100 - abs(avg_distance - optimal_distance) * 5)
+    
+    return min(efficiency, 100.0)
+
+
+def density_score(occupied_area: float, extent: Sequence[float] = DEFAULT_EXTENT) -> float:
+    """Density from the total footprint area over the city's extent"""
+    x_min, x_max, z_min, z_max = extent
+    total_area = (x_max - x_min) * (z_max - z_min)
+    
+    density_ratio = occupied_area / total_area
+    
+    # Optimal density is 15-25%
+    if 0.15 <= density_ratio <= 0.25:
+        return 100.0
+    elif density_ratio < 0.15:
+        return (density_ratio / 0.15) * 100
+    else:
+        return max(0, 100 - (density_ratio - 0.25) * 200)
+
+
+def quadrant_index(positions: np.ndarray, extent: Sequence[float] = DEFAULT_EXTENT) -> np.ndarray:
+    """
+    Quadrant of each (x, z) position around the centre of ``extent``:
+    0 north-east, 1 north-west, 2 south-west, 3 south-east
+    """
+    x_min, x_max, z_min, z_max = extent
+    x, z = positions[..., 0], positions[..., 1]
+    north = z >= (z_min + z_max) / 2
+    west = x < (x_min + x_max) / 2
+    index = np.full(x.shape, 3, dtype=np.int64)
+    index[~west & north] = 0
+    index[west & north] = 1
+    index[west & ~north] = 2
+    return index
+
+
+def distribution_score(quadrants: np.ndarray) -> float:
+    """Distribution from the building count in each quadrant"""
+    quadrants = np.asarray(quadrants, dtype=np.float64)
+    total = quadrants.sum()
+    if total < 4:
+        return 0.0
+    
+    # Calculate standard deviation (lower is better)
+    std_dev = np.std(quadrants)
+    max_std = total / 4
+    
+    return max(0, 100 - (std_dev / max_std) * 100)
+
+
+def diversity_score(type_counts: np.ndarray) -> float:
+    """Diversity from the building count per type"""
+    type_counts = np.asarray(type_counts)
+    total = type_counts.sum()
+    if not total:
+        return 0.0
+    
+    # Calculate Shannon diversity index
+    proportions = type_counts[type_counts > 0] / total
+    shannon_index = -float(np.sum(proportions * np.log(proportions)))
+    
+    # Normalize to 0-100 scale
+    max_diversity = np.log(5)  # 5 building types
+    return (shannon_index / max_diversity) * 100
+
+
+def sustainability_score(infrastructure_count: int, public_count: int,
+                         total_buildings: int) -> float:
+    """Sustainability from the infrastructure and public building counts"""
+    if not total_buildings:
+        return 0.0
+    
+    # Ideal ratio: 20% infrastructure, 12% public
+    infra_ratio = infrastructure_count / total_buildings
+    public_ratio = public_count / total_buildings
+    
+    infra_score = min(100, (infra_ratio / 0.20) * 100) if infra_ratio <= 0.20 else max(0, 100 - (infra_ratio - 0.20) * 200)
+    public_score = min(100, (public_ratio / 0.12) * 100) if public_ratio <= 0.12 else max(0, 100 - (public_ratio - 0.12) * 200)
+    
+    return (infra_score + public_score) / 2
+
+
+def performance_report(efficiency: float, density: float, distribution: float,
+                       diversity: float, sustainability: float) -> Dict:
+    """Assemble sub-scores into the ``analyze_city_performance`` report"""
+    performance = {
+        'efficiency_score': efficiency,
+        'density_score': density,
+        'distribution_score': distribution,
+        'diversity_score': diversity,
+        'sustainability_score': sustainability,
+        'overall_score': 0.0,
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    # Calculate weighted overall score
+    performance['overall_score'] = sum(
+        performance[f'{key}_score'] * weight 
+        for key, weight in SCORE_WEIGHTS.items()
+    )
+    
+    return performance
 
 
 class CityAnalytics:
@@ -15,185 +240,119 @@ class CityAnalytics:
     Comprehensive analytics engine for city performance metrics
     """
     
-    def __init__(self):
-        self.metrics_history = []
-        self.building_data = pd.DataFrame()
+    def __init__(self, history: Optional[MetricsHistory] = None):
+        self.metrics_history = history if history is not None else MetricsHistory()
+        self._building_data = None
+    
+    @property
+    def building_data(self):
+        """Building table as a pandas DataFrame, importing pandas on first use"""
+        if self._building_data is None:
+            import pandas as pd
+            self._building_data = pd.DataFrame()
+        return self._building_data
         
     def analyze_city_performance(self, city_data: Dict) -> Dict:
         """
-        Analyze overall city performance across multiple dimensions
+        Analyze overall city performance across multiple dimensions.
+        
+        Density and distribution are measured over ``city_data['extent']``,
+        else the ``city_data['grid_size']`` square, else the default 60x60 grid.
         """
-        buildings = city_data.get('buildings', [])
-        
-        performance = {
-            'efficiency_score': self._calculate_efficiency(buildings),
-            'density_score': self._calculate_density(buildings),
-            'distribution_score': self._calculate_distribution(buildings),
-            'diversity_score': self._calculate_diversity(buildings),
-            'sustainability_score': self._calculate_sustainability(buildings),
-            'overall_score': 0.0,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        # Calculate weighted overall score
-        weights = {
-            'efficiency': 0.25,
-            'density': 0.20,
-            'distribution': 0.25,
-            'diversity': 0.15,
-            'sustainability': 0.15
-        }
-        
-        performance['overall_score'] = sum(
-            performance[f'{key}_score'] * weight 
-            for key, weight in weights.items()
-        )
+        columns = _as_columns(city_data.get('buildings', []))
+        extent = resolve_extent(city_data.get('extent'), city_data.get('grid_size'))
         
-        return performance
+        return performance_report(
+            efficiency=self._calculate_efficiency(columns),
+            density=self._calculate_density(columns, extent),
+            distribution=self._calculate_distribution(columns, extent),
+            diversity=self._calculate_diversity(columns),
+            sustainability=self._calculate_sustainability(columns)
+        )
+    
+    def record_performance(self, city_id: str, performance: Dict,
+                           timestamp: Optional[float] = None):
+        """Append a performance report's scores to the city's metrics history"""
+        self.metrics_history.record(city_id, performance, timestamp)
     
-    def _calculate_efficiency(self, buildings: List[Dict]) -> float:
+    def score_trends(self, city_id: str, **query) -> Optional[Dict]:
+        """Trend report of a city's recorded scores; see ``MetricsHistory.trends``"""
+        return self.metrics_history.trends(city_id, **query)
+    
+    def _calculate_efficiency(self, buildings: BuildingsLike) -> float:
         """Calculate city efficiency based on building placement and connectivity"""
-        if not buildings:
+        columns = _as_columns(buildings)
+        if not len(columns):
             return 0.0
         
         # Calculate average distance between buildings
-        positions = np.array([[b['position'][0], b['position'][2]] for b in buildings])
-        distances = []
-        
-        for i in range(len(positions)):
-            for j in range(i + 1, len(positions)):
-                dist = np.linalg.norm(positions[i] - positions[j])
-                distances.append(dist)
-        
-        avg_distance = np.mean(distances) if distances else 0
+        avg_distance = mean_pairwise_distance(columns.positions)
         
-        # Optimal distance is around 8-12 units
-        optimal_distance = 10.0
-        efficiency = max(0, 100 - abs(avg_distance - optimal_distance) * 5)
-        
-        return min(efficiency, 100.0)
+        return efficiency_score(avg_distance)
     
-    def _calculate_density(self, buildings: List[Dict]) -> float:
+    def _calculate_density(self, buildings: BuildingsLike,
+                           extent: Sequence[float] = DEFAULT_EXTENT) -> float:
         """Calculate city density score"""
-        if not buildings:
+        columns = _as_columns(buildings)
+        if not len(columns):
             return 0.0
         
-        grid_size = 60
-        total_area = grid_size ** 2
-        
         # Calculate occupied area
-        occupied_area = sum(
-            b['size'][0] * b['size'][2] 
-            for b in buildings
-        )
+        occupied_area = float(np.dot(columns.sizes[:, 0], columns.sizes[:, 2]))
         
-        density_ratio = occupied_area / total_area
-        
-        # Optimal density is 15-25%
-        if 0.15 <= density_ratio <= 0.25:
-            return 100.0
-        elif density_ratio < 0.15:
-            return (density_ratio / 0.15) * 100
-        else:
-            return max(0, 100 - (density_ratio - 0.25) * 200)
+        return density_score(occupied_area, extent)
     
-    def _calculate_distribution(self, buildings: List[Dict]) -> float:
+    def _calculate_distribution(self, buildings: BuildingsLike,
+                                extent: Sequence[float] = DEFAULT_EXTENT) -> float:
         """Calculate spatial distribution score"""
-        if len(buildings) < 4:
+        columns = _as_columns(buildings)
+        if len(columns) < 4:
             return 0.0
         
-        positions = np.array([[b['position'][0], b['position'][2]] for b in buildings])
-        
-        # Divide grid into quadrants
-        quadrants = [0, 0, 0, 0]
-        for pos in positions:
-            if pos[0] >= 0 and pos[1] >= 0:
-                quadrants[0] += 1
-            elif pos[0] < 0 and pos[1] >= 0:
-                quadrants[1] += 1
-            elif pos[0] < 0 and pos[1] < 0:
-                quadrants[2] += 1
-            else:
-                quadrants[3] += 1
-        
-        # Calculate standard deviation (lower is better)
-        std_dev = np.std(quadrants)
-        max_std = len(buildings) / 4
+        quadrants = np.bincount(quadrant_index(columns.positions, extent), minlength=4)
         
-        distribution_score = max(0, 100 - (std_dev / max_std) * 100)
-        return distribution_score
+        return distribution_score(quadrants)
     
-    def _calculate_diversity(self, buildings: List[Dict]) -> float:
+    def _calculate_diversity(self, buildings: BuildingsLike) -> float:
         """Calculate building type diversity score"""
-        if not buildings:
+        columns = _as_columns(buildings)
+        if not len(columns):
             return 0.0
         
-        types = [b['type'] for b in buildings]
-        type_counts = pd.Series(types).value_counts()
-        
-        # Calculate Shannon diversity index
-        proportions = type_counts / len(types)
-        shannon_index = -sum(p * np.log(p) for p in proportions if p > 0)
-        
-        # Normalize to 0-100 scale
-        max_diversity = np.log(5)  # 5 building types
-        diversity_score = (shannon_index / max_diversity) * 100
-        
-        return diversity_score
+        return diversity_score(columns.type_counts())
     
-    def _calculate_sustainability(self, buildings: List[Dict]) -> float:
+    def _calculate_sustainability(self, buildings: BuildingsLike) -> float:
         """Calculate sustainability score based on green spaces and infrastructure"""
-        if not buildings:
+        columns = _as_columns(buildings)
+        if not len(columns):
             return 0.0
         
-        infrastructure_count = sum(1 for b in buildings if b['type'] == 'infrastructure')
-        public_count = sum(1 for b in buildings if b['type'] == 'public')
-        
-        total_buildings = len(buildings)
-        
-        # Ideal ratio: 20% infrastructure, 12% public
-        infra_ratio = infrastructure_count / total_buildings
-        public_ratio = public_count / total_buildings
-        
-        infra_score = min(100, (infra_ratio / 0.20) * 100) if infra_ratio <= 0.20 else max(0, 100 - (infra_ratio - 0.20) * 200)
-        public_score = min(100, (public_ratio / 0.12) * 100) if public_ratio <= 0.12 else max(0, 100 - (public_ratio - 0.12) * 200)
-        
-        sustainability = (infra_score + public_score) / 2
-        return sustainability
+        return sustainability_score(columns.count('infrastructure'), columns.count('public'),
+                                    len(columns))
     
-    def generate_heatmap_data(self, buildings: List[Dict], resolution: int = 20) -> np.ndarray:
+    def generate_heatmap_data(self, buildings: BuildingsLike,
+                              resolution: Union[int, Sequence[int]] = 20,
+                              extent: Sequence[float] = DEFAULT_EXTENT,
+                              kernel: str = 'stencil', sigma: float = 1.0,
+                              bandwidth: Optional[float] = None,
+                              weight_by_volume: bool = False,
+                              dtype=np.float64) -> np.ndarray:
         """
         Generate density heatmap data for visualization
         """
-        grid_size = 60
-        heatmap = np.zeros((resolution, resolution))
-        
-        cell_size = grid_size / resolution
-        
-        for building in buildings:
-            x, z = building['position'][0], building['position'][2]
-            
-            # Convert to grid coordinates
-            grid_x = int((x + grid_size/2) / cell_size)
-            grid_z = int((z + grid_size/2) / cell_size)
-            
-            # Clamp to grid bounds
-            grid_x = max(0, min(resolution - 1, grid_x))
-            grid_z = max(0, min(resolution - 1, grid_z))
-            
-            # Increment density
-            heatmap[grid_z, grid_x] += 1
-            
-            # Apply Gaussian blur effect
-            for dx in range(-1, 2):
-                for dz in range(-1, 2):
-                    nx, nz = grid_x + dx, grid_z + dz
-                    if 0 <= nx < resolution and 0 <= nz < resolution:
-                        distance = np.sqrt(dx**2 + dz**2)
-                        if distance > 0:
-                            heatmap[nz, nx] += 0.5 / distance
-        
-        return heatmap
+        columns = _as_columns(buildings)
+        weights = np.prod(columns.sizes, axis=1) if weight_by_volume else None
+        
+        return density_heatmap(
+            columns.positions,
+            resolution=resolution,
+            extent=extent,
+            kernel=kernel,
+            sigma=sigma,
+            bandwidth=bandwidth,
+            weights=weights,
+            dtype=dtype
+        )
     
     def export_analytics_report(self, performance: Dict, filename: str = "analytics_report.json"):
         """Export analytics report to JSON"""
@@ -207,22 +366,78 @@ class CityAnalytics:
         print(f"Diversity: {performance['diversity_score']:.2f}/100")
 
 
-def calculate_population_estimate(buildings: List[Dict]) -> int:
+def _as_columns(buildings: BuildingsLike) -> BuildingColumns:
+    """Accept raw building dicts, ``CityArrays`` or already-parsed columns"""
+    if isinstance(buildings, BuildingColumns):
+        return buildings
+    if isinstance(buildings, CityArrays):
+        return BuildingColumns.from_city(buildings)
+    return BuildingColumns.from_buildings(buildings)
+
+
+# Residential buildings count as walkable with an amenity this close
+WALKING_DISTANCE = 10.0
+AMENITY_TYPES = ('commercial', 'public')
+
+
+def calculate_walkability(buildings: BuildingsLike,
+                          walking_distance: float = WALKING_DISTANCE) -> Dict:
     """
-    Estimate city population based on residential and commercial buildings
+    Nearest-neighbour metrics from a KD-tree over the building positions.
+
+    ``walkability_score`` is the percentage of residential buildings with a
+    commercial or public building within ``walking_distance``. Mean distances
+    are ``None`` when there is nothing to measure.
     """
-    population = 0
+    columns = _as_columns(buildings)
+    codes = [columns.type_names.index(name) for name in AMENITY_TYPES if name in columns.type_names]
+    amenities = np.isin(columns.type_codes, codes)
+    residential = columns.type_codes == (
+        columns.type_names.index('residential') if 'residential' in columns.type_names else -1)
     
-    for building in buildings:
-        if building['type'] == 'residential':
-            # Average 50-100 residents per residential building
-            population += np.random.randint(50, 100)
-        elif building['type'] == 'commercial':
-            # Average 20-40 workers per commercial building
-            population += np.random.randint(20, 40)
-        elif building['type'] == 'office':
-            # Average 100-200 workers per office building
-            population += np.random.randint(100, 200)
+    neighbour = nearest_neighbour_distances(columns.positions)
+    amenity = nearest_neighbour_distances(columns.positions[residential],
+                                          columns.positions[amenities])
+    
+    def mean(distances: np.ndarray) -> Optional[float]:
+        return float(distances.mean()) if len(distances) and np.isfinite(distances).all() else None
+    
+    return {
+        'walkability_score': float(np.mean(amenity <= walking_distance) * 100) if len(amenity) else 0.0,
+        'mean_nearest_neighbour_distance': mean(neighbour),
+        'mean_amenity_distance': mean(amenity),
+        'walking_distance': walking_distance
+    }
+
+
+# Residents or workers per building type, as [low, high) ranges
+POPULATION_RANGES = {
+    'residential': (50, 100),
+    'commercial': (20, 40),
+    'office': (100, 200)
+}
+
+
+def calculate_population_estimate(buildings: BuildingsLike,
+                                  seed: Optional[Union[int, np.random.Generator]] = None) -> int:
+    """
+    Estimate city population based on residential and commercial buildings.
+    
+    Every building of a type draws its residents or workers uniformly from
+    that type's range in ``POPULATION_RANGES``, with one vectorised draw per
+    type from a per-call generator. With a ``seed`` the estimate is
+    deterministic and depends only on the per-type building counts, so it
+    can be cached alongside the scores; without one, fresh OS entropy is used
+    and concurrent calls never share random state.
+    """
+    columns = _as_columns(buildings)
+    rng = np.random.default_rng(seed)
+    
+    population = 0
+    for building_type, (low, high) in POPULATION_RANGES.items():
+        count = columns.count(building_type)
+        if count:
+            population += int(rng.integers(low, high, size=count).sum())
     
     return population
 
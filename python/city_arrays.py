@@ -0,0 +1,244 @@
+"""
+City Arrays Module
+Compact struct-of-arrays representation of a city
+"""
+
+import numpy as np
+from typing import Dict, Iterable, List, Tuple
+from dataclasses import dataclass
+
+from ai_city_generator import Building
+
+
+BUILDING_TYPES = ('infrastructure', 'commercial', 'residential', 'office', 'public')
+
+
+def _intern(values: Iterable[str], table: List[str]) -> np.ndarray:
+    """Map strings to indices into ``table``, appending unseen values"""
+    lookup = {value: code for code, value in enumerate(table)}
+    codes = []
+    for value in values:
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(table)
+            table.append(value)
+        codes.append(code)
+    return np.array(codes, dtype=np.int64)
+
+
+def _narrow(codes: np.ndarray, table: List[str]) -> np.ndarray:
+    """Store codes in the smallest unsigned integer type that fits the table"""
+    return codes.astype(np.min_scalar_type(max(len(table) - 1, 0)))
+
+
+@dataclass
+class CityArrays:
+    """
+    Struct-of-arrays city: one row per building across every column.
+
+    Positions and sizes are (n, 3) arrays in ``dtype`` (float32 by default),
+    building types are uint8 codes into ``type_names`` and colours and names
+    are interned into small lookup tables. Conversions to and from ``Building``
+    lists and JSON dicts are lossless when ``dtype`` is float64; float32
+    storage keeps coordinates to float32 precision.
+    """
+    ids: List[str]
+    positions: np.ndarray
+    sizes: np.ndarray
+    type_codes: np.ndarray
+    type_names: List[str]
+    color_codes: np.ndarray
+    colors: List[str]
+    name_codes: np.ndarray
+    names: List[str]
+    phases: np.ndarray
+
+    @classmethod
+    def _from_columns(cls, ids: List[str], names: Iterable[str], types: Iterable[str],
+                      positions: List, sizes: List, colors: Iterable[str],
+                      phases: List[int], dtype) -> 'CityArrays':
+        type_names = list(BUILDING_TYPES)
+        type_codes = _intern(types, type_names)
+        if len(type_names) > 256:
+            raise ValueError("at most 256 distinct building types are supported")
+
+        color_table: List[str] = []
+        color_codes = _intern(colors, color_table)
+        name_table: List[str] = []
+        name_codes = _intern(names, name_table)
+
+        return cls(
+            ids=ids,
+            positions=np.array(positions, dtype=dtype).reshape(-1, 3),
+            sizes=np.array(sizes, dtype=dtype).reshape(-1, 3),
+            type_codes=type_codes.astype(np.uint8),
+            type_names=type_names,
+            color_codes=_narrow(color_codes, color_table),
+            colors=color_table,
+            name_codes=_narrow(name_codes, name_table),
+            names=name_table,
+            phases=np.array(phases, dtype=np.int32)
+        )
+
+    @classmethod
+    def from_buildings(cls, buildings: List[Building], dtype=np.float32) -> 'CityArrays':
+        """Build arrays from a list of ``Building`` objects"""
+        return cls._from_columns(
+            ids=[b.id for b in buildings],
+            names=(b.name for b in buildings),
+            types=(b.type for b in buildings),
+            positions=[b.position for b in buildings],
+            sizes=[b.size for b in buildings],
+            colors=(b.color for b in buildings),
+            phases=[b.phase for b in buildings],
+            dtype=dtype
+        )
+
+    @classmethod
+    def from_dicts(cls, buildings: List[Dict], dtype=np.float32) -> 'CityArrays':
+        """Build arrays from JSON building dicts"""
+        return cls._from_columns(
+            ids=[b['id'] for b in buildings],
+            names=(b['name'] for b in buildings),
+            types=(b['type'] for b in buildings),
+            positions=[b['position'] for b in buildings],
+            sizes=[b['size'] for b in buildings],
+            colors=(b['color'] for b in buildings),
+            phases=[b['phase'] for b in buildings],
+            dtype=dtype
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def xz(self) -> np.ndarray:
+        """Zero-copy (n, 2) view of the ground-plane x/z coordinates"""
+        return self.positions[:, ::2]
+
+    def with_xz(self, xz: np.ndarray) -> 'CityArrays':
+        """Copy of the city with new ground-plane coordinates; other columns are shared"""
+        positions = self.positions.copy()
+        positions[:, ::2] = xz
+        return CityArrays(
+            ids=self.ids,
+            positions=positions,
+            sizes=self.sizes,
+            type_codes=self.type_codes,
+            type_names=self.type_names,
+            color_codes=self.color_codes,
+            colors=self.colors,
+            name_codes=self.name_codes,
+            names=self.names,
+            phases=self.phases
+        )
+
+    def slice(self, start: int, stop: int) -> 'CityArrays':
+        """Buildings ``start:stop`` as views over this city's columns"""
+        return CityArrays(
+            ids=self.ids[start:stop],
+            positions=self.positions[start:stop],
+            sizes=self.sizes[start:stop],
+            type_codes=self.type_codes[start:stop],
+            type_names=self.type_names,
+            color_codes=self.color_codes[start:stop],
+            colors=self.colors,
+            name_codes=self.name_codes[start:stop],
+            names=self.names,
+            phases=self.phases[start:stop]
+        )
+
+    def take(self, indices: np.ndarray) -> 'CityArrays':
+        """Copies of the buildings at ``indices``, in that order"""
+        indices = np.asarray(indices, dtype=np.intp)
+        return CityArrays(
+            ids=[self.ids[i] for i in indices.tolist()],
+            positions=self.positions[indices],
+            sizes=self.sizes[indices],
+            type_codes=self.type_codes[indices],
+            type_names=self.type_names,
+            color_codes=self.color_codes[indices],
+            colors=self.colors,
+            name_codes=self.name_codes[indices],
+            names=self.names,
+            phases=self.phases[indices]
+        )
+
+    @classmethod
+    def concat(cls, parts: List['CityArrays'], dtype=np.float32) -> 'CityArrays':
+        """Join cities end to end, merging their lookup tables"""
+        type_names = list(BUILDING_TYPES)
+        colors: List[str] = []
+        names: List[str] = []
+        type_codes, color_codes, name_codes = [], [], []
+
+        for part in parts:
+            # Remap each part's codes through its table into the merged one
+            type_codes.append(_intern(part.type_names, type_names)[part.type_codes])
+            color_codes.append(_intern(part.colors, colors)[part.color_codes])
+            name_codes.append(_intern(part.names, names)[part.name_codes])
+        if len(type_names) > 256:
+            raise ValueError("at most 256 distinct building types are supported")
+
+        def joined(arrays: List[np.ndarray], empty_shape: Tuple[int, ...], array_dtype) -> np.ndarray:
+            if not arrays:
+                return np.empty(empty_shape, dtype=array_dtype)
+            return np.concatenate(arrays).astype(array_dtype, copy=False)
+
+        return cls(
+            ids=[id_ for part in parts for id_ in part.ids],
+            positions=joined([part.positions for part in parts], (0, 3), dtype),
+            sizes=joined([part.sizes for part in parts], (0, 3), dtype),
+            type_codes=joined(type_codes, (0,), np.uint8),
+            type_names=type_names,
+            color_codes=_narrow(joined(color_codes, (0,), np.int64), colors),
+            colors=colors,
+            name_codes=_narrow(joined(name_codes, (0,), np.int64), names),
+            names=names,
+            phases=joined([part.phases for part in parts], (0,), np.int32)
+        )
+
+    def _rows(self) -> Iterable[Tuple]:
+        names = [self.names[c] for c in self.name_codes.tolist()]
+        types = [self.type_names[c] for c in self.type_codes.tolist()]
+        colors = [self.colors[c] for c in self.color_codes.tolist()]
+        return zip(self.ids, names, types, self.positions.tolist(),
+                   self.sizes.tolist(), colors, self.phases.tolist())
+
+    def to_buildings(self) -> List[Building]:
+        """Expand into a list of ``Building`` objects"""
+        return [
+            Building(
+                id=id_,
+                name=name,
+                type=type_,
+                position=tuple(position),
+                size=tuple(size),
+                color=color,
+                phase=phase
+            )
+            for id_, name, type_, position, size, color, phase in self._rows()
+        ]
+
+    def to_dicts(self) -> List[Dict]:
+        """Expand into JSON building dicts"""
+        return [
+            {
+                'id': id_,
+                'name': name,
+                'type': type_,
+                'position': position,
+                'size': size,
+                'color': color,
+                'phase': phase
+            }
+            for id_, name, type_, position, size, color, phase in self._rows()
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the numeric columns"""
+        return sum(array.nbytes for array in (
+            self.positions, self.sizes, self.type_codes,
+            self.color_codes, self.name_codes, self.phases
+        ))
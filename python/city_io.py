@@ -0,0 +1,238 @@
+"""
+City I/O Module
+Streaming chunked export and import of very large cities
+"""
+
+import bisect
+import bz2
+import gzip
+import json
+import lzma
+import mmap
+import os
+import struct
+import numpy as np
+from typing import IO, Iterable, Iterator, List, Optional, Union
+
+from ai_city_generator import Building
+from city_arrays import CityArrays
+from wire_format import decode_city, encode_city
+
+
+NDJSON_FORMAT = 'city-ndjson'
+BLOCK_FORMAT = 'city-blocks'
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_BLOCK_SIZE = 65536
+
+# Block files start with a magic and end with a fixed trailer pointing at
+# the JSON block index: (index offset, index length, end magic)
+_BLOCK_MAGIC = b'CITYBLK1'
+_BLOCK_END = b'CITYEND1'
+_TRAILER = struct.Struct('<QQ8s')
+_ALIGNMENT = 8
+
+CityChunks = Union[CityArrays, Iterable[CityArrays], List[Building], List[dict]]
+
+
+def _open_compressed(path: str, mode: str, compression: Optional[str]) -> IO:
+    """Open ``path`` in text mode through a standard-library codec"""
+    if compression is None:
+        compression = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}.get(
+            path[path.rfind('.'):] if '.' in path else '', 'none')
+    if compression == 'none':
+        return open(path, mode + 't', encoding='utf-8')
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if compression == 'bz2':
+        return bz2.open(path, mode + 't', encoding='utf-8')
+    if compression == 'xz':
+        return lzma.open(path, mode + 't', encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            from compression import zstd
+        except ImportError:
+            raise ValueError("zstd compression requires Python 3.14 or newer")
+        return zstd.open(path, mode + 't', encoding='utf-8')
+    raise ValueError(f"unknown compression: {compression}")
+
+
+def _chunks(city: CityChunks, chunk_size: int) -> Iterator[CityArrays]:
+    """Normalise any supported city input into CityArrays chunks"""
+    if isinstance(city, CityArrays):
+        parts: Iterable[CityArrays] = [city]
+    elif isinstance(city, list):
+        if city and isinstance(city[0], Building):
+            parts = (CityArrays.from_buildings(city[i:i + chunk_size], np.float64)
+                     for i in range(0, len(city), chunk_size))
+        else:
+            parts = (CityArrays.from_dicts(city[i:i + chunk_size], np.float64)
+                     for i in range(0, len(city), chunk_size))
+    else:
+        parts = city
+
+    for part in parts:
+        for start in range(0, len(part), chunk_size):
+            yield part.slice(start, start + chunk_size)
+
+
+def export_city_ndjson(city: CityChunks, path: str, compression: Optional[str] = None,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Write a city as NDJSON: one header record, then one building per line.
+
+    ``city`` may be a CityArrays, an iterable of CityArrays chunks or a list
+    of buildings; only one chunk is expanded to dicts at a time. Compression
+    is inferred from the extension (.gz, .bz2, .xz, .zst) unless given.
+    Returns the number of buildings written.
+    """
+    count = 0
+    with _open_compressed(path, 'w', compression) as f:
+        f.write(json.dumps({'format': NDJSON_FORMAT, 'version': 1}) + '\n')
+        for chunk in _chunks(city, chunk_size):
+            f.writelines(json.dumps(record) + '\n' for record in chunk.to_dicts())
+            count += len(chunk)
+    return count
+
+
+def iter_city_ndjson(path: str, compression: Optional[str] = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     dtype=np.float64) -> Iterator[CityArrays]:
+    """Read an NDJSON city back as CityArrays chunks of at most ``chunk_size``"""
+    with _open_compressed(path, 'r', compression) as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('format') != NDJSON_FORMAT:
+            raise ValueError(f"{path} is not a {NDJSON_FORMAT} file")
+
+        records = []
+        for line in f:
+            if not line.strip():
+                continue
+            records.append(json.loads(line))
+            if len(records) == chunk_size:
+                yield CityArrays.from_dicts(records, dtype)
+                records = []
+        if records:
+            yield CityArrays.from_dicts(records, dtype)
+
+
+def export_city_blocks(city: CityChunks, path: str,
+                       block_size: int = DEFAULT_BLOCK_SIZE) -> int:
+    """
+    Write a city as fixed-size binary blocks for memory-mapped random access.
+
+    Each block holds ``block_size`` buildings (the last may be shorter) in the
+    columnar wire format, with positions and sizes at the float width of the
+    source chunk, so float64 cities round-trip exactly. A JSON index of block
+    offsets and the trailer are written last, so the file is produced in a
+    single bounded-memory pass. Returns the number of buildings written.
+    """
+    blocks = []
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(_BLOCK_MAGIC)
+        for chunk in _chunks(city, block_size):
+            offset = f.tell()
+            float_dtype = chunk.positions.dtype.newbyteorder('<')
+            for data in encode_city(chunk, float_dtype=float_dtype):
+                f.write(data)
+            length = f.tell() - offset
+            f.write(b'\0' * (-length % _ALIGNMENT))
+            blocks.append([offset, length, len(chunk)])
+            count += len(chunk)
+
+        index = json.dumps({
+            'format': BLOCK_FORMAT,
+            'version': 1,
+            'count': count,
+            'block_size': block_size,
+            'blocks': blocks
+        }).encode('utf-8')
+        index_offset = f.tell()
+        f.write(index)
+        f.write(_TRAILER.pack(index_offset, len(index), _BLOCK_END))
+    return count
+
+
+class CityBlockReader:
+    """
+    Memory-mapped reader for block files written by ``export_city_blocks``.
+
+    Columns are decoded as views into the mapping, so reading a building range
+    only touches the pages of the blocks that cover it. Arrays handed out
+    must be released before ``close`` can unmap the file.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._map = None
+        try:
+            # Checked before mapping: mmap refuses empty files
+            if os.fstat(self._file.fileno()).st_size < len(_BLOCK_MAGIC) + _TRAILER.size:
+                raise ValueError(f"{path} is not a {BLOCK_FORMAT} file")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:len(_BLOCK_MAGIC)] != _BLOCK_MAGIC:
+                raise ValueError(f"{path} is not a {BLOCK_FORMAT} file")
+            index_offset, index_length, end = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+            if end != _BLOCK_END:
+                raise ValueError(f"{path} is truncated")
+
+            index = json.loads(self._map[index_offset:index_offset + index_length])
+            self.blocks = index['blocks']
+            self.count = index['count']
+            # Global index of the first building in each block
+            self._starts = np.cumsum([0] + [block[2] for block in self.blocks]).tolist()
+        except ValueError:
+            self.close()
+            raise
+        except (KeyError, TypeError, IndexError) as e:
+            self.close()
+            raise ValueError(f"{path} has a malformed block index") from e
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> 'CityBlockReader':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def block(self, index: int) -> CityArrays:
+        """Decode one block as views into the mapped file"""
+        offset, length, _ = self.blocks[index]
+        city, _ = decode_city(memoryview(self._map)[offset:offset + length])
+        return city
+
+    def iter_blocks(self) -> Iterator[CityArrays]:
+        for index in range(len(self.blocks)):
+            yield self.block(index)
+
+    def read(self, start: int, stop: int, dtype=np.float64) -> CityArrays:
+        """Buildings ``start:stop`` without loading the blocks outside the range"""
+        start = max(0, start)
+        stop = min(stop, self.count)
+        parts = []
+        first = max(0, bisect.bisect_right(self._starts, start) - 1)
+
+        for index in range(first, len(self.blocks)):
+            block_start = self._starts[index]
+            if block_start >= stop:
+                break
+            block = self.block(index)
+            parts.append(block.slice(max(start - block_start, 0), stop - block_start))
+
+        return CityArrays.concat(parts, dtype)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def iter_city_blocks(path: str) -> Iterator[CityArrays]:
+    """Stream the blocks of a block file as copied CityArrays chunks"""
+    with CityBlockReader(path) as reader:
+        for index in range(len(reader.blocks)):
+            yield CityArrays.concat([reader.block(index)], np.float64)
@@ -0,0 +1,152 @@
+"""
+Geometry Module
+Convex hulls, polygon areas and rasterised footprint coverage over position arrays
+"""
+
+import sys
+import numpy as np
+from typing import Sequence, Union
+
+from heatmap import DEFAULT_EXTENT, resolve_resolution
+
+
+def _cross(o: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """z component of (a - o) x (b - o); positive when o -> a -> b turns left"""
+    return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - \
+           (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+
+def _interior_filter(points: np.ndarray) -> np.ndarray:
+    """
+    Akl-Toussaint heuristic: drop every point strictly inside the polygon of
+    the points extreme in x, z, x + z and x - z, which can never be on the
+    hull. For spread-out cities this discards nearly every point in one
+    vectorised pass before the sequential scan.
+    """
+    x, z = points[:, 0], points[:, 1]
+    extremes = [np.argmin(x), np.argmin(x - z), np.argmin(z), np.argmax(x + z),
+                np.argmax(x), np.argmax(x - z), np.argmax(z), np.argmin(x + z)]
+    # Order the extremes counter-clockwise around their centre, dropping repeats
+    polygon = points[extremes]
+    centre = polygon.mean(axis=0)
+    order = np.argsort(np.arctan2(polygon[:, 1] - centre[1], polygon[:, 0] - centre[0]))
+    polygon = polygon[order]
+    polygon = polygon[np.r_[True, np.any(np.diff(polygon, axis=0) != 0, axis=1)]]
+    if len(polygon) < 3:
+        return points
+
+    inside = np.ones(len(points), dtype=bool)
+    for a, b in zip(polygon, np.roll(polygon, -1, axis=0)):
+        inside &= _cross(a, b, points) > 0
+    return points[~inside]
+
+
+def _monotone_chain(points: np.ndarray) -> np.ndarray:
+    """Andrew's monotone chain over points sorted by x, then z"""
+    def half(ordered: np.ndarray) -> list:
+        chain = []
+        for p in ordered.tolist():
+            while len(chain) >= 2 and (
+                (chain[-1][0] - chain[-2][0]) * (p[1] - chain[-2][1]) -
+                (chain[-1][1] - chain[-2][1]) * (p[0] - chain[-2][0])
+            ) <= 0:
+                chain.pop()
+            chain.append(p)
+        return chain
+
+    lower = half(points)
+    upper = half(points[::-1])
+    return np.array(lower[:-1] + upper[:-1], dtype=np.float64).reshape(-1, 2)
+
+
+def convex_hull(points: np.ndarray) -> np.ndarray:
+    """
+    Counter-clockwise hull vertices of (n, 2) points, without collinear
+    points. Degenerate inputs give the distinct extreme points (at most two).
+
+    Uses ``scipy.spatial.ConvexHull`` when scipy has already been imported
+    by something else; otherwise a vectorised interior filter followed by a
+    monotone-chain scan, so scipy is never imported just for this.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    # Sort by x, then z, and drop duplicates
+    points = points[np.lexsort((points[:, 1], points[:, 0]))]
+    points = points[np.r_[True, np.any(points[1:] != points[:-1], axis=1)]] if len(points) else points
+    if len(points) < 3:
+        return points
+
+    if 'scipy.spatial' in sys.modules:
+        from scipy.spatial import ConvexHull, QhullError
+        try:
+            return points[ConvexHull(points).vertices]
+        except QhullError:
+            # Collinear points: the hull is the segment between the extremes
+            return points[[0, -1]]
+
+    candidates = _interior_filter(points)
+    # Filtering keeps the points sorted by x, then z
+    hull = _monotone_chain(candidates)
+    return hull if len(hull) >= 3 else points[[0, -1]]
+
+
+def polygon_area(vertices: np.ndarray) -> float:
+    """Shoelace area of a simple polygon given by its ordered vertices"""
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    if len(vertices) < 3:
+        return 0.0
+    x, z = vertices[:, 0], vertices[:, 1]
+    return float(abs(np.dot(x, np.roll(z, -1)) - np.dot(z, np.roll(x, -1))) / 2)
+
+
+def hull_area(points: np.ndarray) -> float:
+    """Area of the convex hull of (n, 2) points; zero for degenerate inputs"""
+    return polygon_area(convex_hull(points))
+
+
+def footprint_raster(positions: np.ndarray, footprints: np.ndarray,
+                     resolution: Union[int, Sequence[int]] = 256,
+                     extent: Sequence[float] = DEFAULT_EXTENT) -> np.ndarray:
+    """
+    (rows, cols) count of the axis-aligned footprints covering each cell.
+
+    ``positions`` are (n, 2) footprint centres and ``footprints`` their
+    (n, 2) x/z extents. A cell counts as covered when its centre lies inside
+    a footprint. Every footprint adds four corners to a difference grid, so
+    the union costs O(n + rows * cols) however large the footprints are.
+    """
+    rows, cols = resolve_resolution(resolution)
+    x_min, x_max, z_min, z_max = (float(v) for v in extent)
+    if x_max <= x_min or z_max <= z_min:
+        raise ValueError("extent must be (x_min, x_max, z_min, z_max) with max > min")
+
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    half = np.abs(np.asarray(footprints, dtype=np.float64).reshape(-1, 2)) / 2
+    cell = np.array([(x_max - x_min) / cols, (z_max - z_min) / rows])
+    origin = np.array([x_min, z_min])
+    limit = np.array([cols, rows])
+
+    # First and one-past-last cell whose centre lies inside each footprint
+    start = np.clip(np.ceil((positions - half - origin) / cell - 0.5), 0, limit).astype(np.intp)
+    stop = np.clip(np.floor((positions + half - origin) / cell - 0.5) + 1, 0, limit).astype(np.intp)
+    keep = np.all(stop > start, axis=1)
+    start, stop = start[keep], stop[keep]
+
+    diff = np.zeros((rows + 1, cols + 1), dtype=np.int64)
+    np.add.at(diff, (start[:, 1], start[:, 0]), 1)
+    np.add.at(diff, (start[:, 1], stop[:, 0]), -1)
+    np.add.at(diff, (stop[:, 1], start[:, 0]), -1)
+    np.add.at(diff, (stop[:, 1], stop[:, 0]), 1)
+    return np.cumsum(np.cumsum(diff, axis=0), axis=1)[:rows, :cols]
+
+
+def footprint_coverage(positions: np.ndarray, footprints: np.ndarray,
+                       resolution: Union[int, Sequence[int]] = 256,
+                       extent: Sequence[float] = DEFAULT_EXTENT) -> float:
+    """
+    Percentage of ``extent`` covered by the union of the footprints,
+    rasterised at ``resolution`` cells. Overlaps are counted once, unlike a
+    sum of footprint areas, and empty space between buildings is not
+    counted, unlike the convex hull.
+    """
+    covered = footprint_raster(positions, footprints, resolution, extent) > 0
+    return float(covered.mean() * 100)
@@ -0,0 +1,418 @@
+"""
+Heatmap Tiles Module
+Multi-resolution heatmap pyramids served as cached fixed-size tiles
+"""
+
+import threading
+import time
+import uuid
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from city_analytics import BuildingColumns, CityAnalytics
+from heatmap import (
+    DEFAULT_EXTENT, MAX_RESOLUTION, gaussian_kernel_1d, resolve_extent, resolve_resolution
+)
+from incremental_analytics import EDIT_OPERATIONS, validate_edits
+
+
+DEFAULT_TILE_SIZE = 256
+
+DEFAULT_PYRAMID_RESOLUTION = 1024
+
+DEFAULT_TILE_CACHE_BYTES = 64 << 20
+
+# (level, tile x, tile z) within one pyramid
+TileIndex = Tuple[int, int, int]
+
+# (pyramid id, level, tile x, tile z)
+TileKey = Tuple[str, int, int, int]
+
+# (row start, row stop, col start, col stop) of a changed block of cells
+Region = Tuple[int, int, int, int]
+
+
+def _kernel_stamp(kernel: str, sigma: float, bandwidth: Optional[float],
+                  cell: Tuple[float, float]) -> np.ndarray:
+    """
+    Smoothed response of one unit count in a single cell, matching
+    ``density_heatmap``'s kernels before any normalisation
+    """
+    if kernel == 'stencil':
+        offsets = np.array([-1, 0, 1])
+        distance = np.hypot(offsets[:, None], offsets[None, :])
+        return np.divide(0.5, distance, out=np.ones((3, 3)), where=distance > 0)
+    if kernel == 'gaussian':
+        gaussian = gaussian_kernel_1d(sigma)
+        return np.outer(gaussian, gaussian)
+    return np.outer(gaussian_kernel_1d(bandwidth / cell[1]), gaussian_kernel_1d(bandwidth / cell[0]))
+
+
+def _reduce(grid: np.ndarray, mode: str) -> np.ndarray:
+    """2x2 reduction by sum or mean; odd edges are padded with zeros"""
+    rows, cols = grid.shape
+    padded = np.pad(grid, ((0, rows % 2), (0, cols % 2)))
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    return blocks.sum(axis=(1, 3)) if mode == 'sum' else blocks.mean(axis=(1, 3))
+
+
+class HeatmapPyramid:
+    """
+    Heatmap of a city at ``resolution`` cells plus coarser levels, each a
+    2x2 reduction of the one below, cut into ``tile_size`` square tiles.
+
+    Level 0 is the coarsest, a single tile; the last level is the base
+    computed by ``CityAnalytics.generate_heatmap_data``. Counting kernels
+    (``stencil``, ``gaussian``) are reduced by sum, so every level holds the
+    same total; ``kde`` densities are reduced by mean.
+
+    Smoothing is linear, so an edit adds or subtracts the kernel's stamp at
+    one base cell and re-reduces the blocks above it; only the tiles over
+    those regions change. ``kde`` levels are stored unnormalised and scaled
+    by ``scale`` when served, so edits that change the total weight do not
+    touch every tile.
+    """
+
+    def __init__(self, buildings: Sequence[Dict], extent: Sequence[float] = DEFAULT_EXTENT,
+                 resolution=DEFAULT_PYRAMID_RESOLUTION, tile_size: int = DEFAULT_TILE_SIZE,
+                 kernel: str = 'stencil', sigma: float = 1.0,
+                 bandwidth: Optional[float] = None, weight_by_volume: bool = False,
+                 analytics: Optional[CityAnalytics] = None):
+        tile_size = int(tile_size)
+        if not 1 <= tile_size <= MAX_RESOLUTION:
+            raise ValueError(f"tile_size must be between 1 and {MAX_RESOLUTION}")
+        ids = [b['id'] for b in buildings]
+        if len(set(ids)) != len(ids):
+            raise ValueError("building ids must be unique")
+
+        self.extent = resolve_extent(extent)
+        self.rows, self.cols = resolve_resolution(resolution)
+        # A tile never needs to be larger than the base level
+        self.tile_size = min(tile_size, max(self.rows, self.cols))
+        self.kernel = kernel
+        self.weight_by_volume = weight_by_volume
+        self.version = 0
+
+        columns = BuildingColumns.from_buildings(buildings)
+        base = (analytics or CityAnalytics()).generate_heatmap_data(
+            columns, resolution=(self.rows, self.cols), extent=self.extent, kernel=kernel,
+            sigma=sigma, bandwidth=bandwidth, weight_by_volume=weight_by_volume
+        )
+        weights = np.prod(columns.sizes, axis=1) if weight_by_volume else np.ones(len(columns))
+        self._buildings: Dict[str, Tuple[float, float, float]] = {
+            building_id: (float(x), float(z), float(w))
+            for building_id, (x, z), w in zip(ids, columns.positions.tolist(), weights.tolist())
+        }
+        self.total_weight = float(weights.sum())
+
+        x_min, x_max, z_min, z_max = self.extent
+        self._cell = ((x_max - x_min) / self.cols, (z_max - z_min) / self.rows)
+        if kernel == 'kde':
+            base = base * (self.total_weight * self._cell[0] * self._cell[1])
+        self._stamp = _kernel_stamp(kernel, sigma, bandwidth, self._cell)
+        self._mode = 'mean' if kernel == 'kde' else 'sum'
+
+        levels = [base]
+        while levels[-1].shape[0] > self.tile_size or levels[-1].shape[1] > self.tile_size:
+            levels.append(_reduce(levels[-1], self._mode))
+        self._levels: List[np.ndarray] = levels[::-1]
+
+    @property
+    def level_count(self) -> int:
+        return len(self._levels)
+
+    @property
+    def scale(self) -> float:
+        """Factor applied to stored values when serving: the kde normalisation"""
+        if self.kernel != 'kde' or self.total_weight <= 0:
+            return 1.0
+        return 1.0 / (self.total_weight * self._cell[0] * self._cell[1])
+
+    def describe(self) -> Dict:
+        return {
+            'extent': list(self.extent),
+            'tile_size': self.tile_size,
+            'kernel': self.kernel,
+            'building_count': len(self._buildings),
+            'version': self.version,
+            'levels': [
+                {
+                    'level': level,
+                    'rows': grid.shape[0],
+                    'cols': grid.shape[1],
+                    'tiles_x': -(-grid.shape[1] // self.tile_size),
+                    'tiles_z': -(-grid.shape[0] // self.tile_size)
+                }
+                for level, grid in enumerate(self._levels)
+            ]
+        }
+
+    def tile(self, level: int, x: int, z: int) -> np.ndarray:
+        """
+        Stored float32 values of tile (``x``, ``z``) at ``level``, zero-padded
+        to ``tile_size`` square; multiply by ``scale`` to serve
+        """
+        if not 0 <= level < len(self._levels):
+            raise IndexError(f"level must be between 0 and {len(self._levels) - 1}")
+        grid = self._levels[level]
+        size = self.tile_size
+        if not (0 <= z * size < grid.shape[0] and 0 <= x * size < grid.shape[1]):
+            raise IndexError(f"tile ({x}, {z}) is outside level {level}")
+        tile = np.zeros((size, size), dtype=np.float32)
+        block = grid[z * size:(z + 1) * size, x * size:(x + 1) * size]
+        tile[:block.shape[0], :block.shape[1]] = block
+        return tile
+
+    def _cell_of(self, x: float, z: float) -> Tuple[int, int]:
+        """Base cell of a position, clamped into the grid like ``bin_positions``"""
+        x_min, _, z_min, _ = self.extent
+        col = min(max(int(np.floor((x - x_min) / self._cell[0])), 0), self.cols - 1)
+        row = min(max(int(np.floor((z - z_min) / self._cell[1])), 0), self.rows - 1)
+        return row, col
+
+    def _stamp_at(self, x: float, z: float, weight: float) -> Region:
+        """Add ``weight`` times the kernel stamp around a position's cell"""
+        row, col = self._cell_of(x, z)
+        radius_z, radius_x = self._stamp.shape[0] // 2, self._stamp.shape[1] // 2
+        r0, r1 = max(row - radius_z, 0), min(row + radius_z + 1, self.rows)
+        c0, c1 = max(col - radius_x, 0), min(col + radius_x + 1, self.cols)
+        self._levels[-1][r0:r1, c0:c1] += weight * self._stamp[
+            r0 - row + radius_z:r1 - row + radius_z, c0 - col + radius_x:c1 - col + radius_x
+        ]
+        self.total_weight += weight
+        return r0, r1, c0, c1
+
+    def apply(self, edits: Sequence[Dict]) -> Set[TileIndex]:
+        """
+        Apply add/move/remove edits in the ``IncrementalAnalyzer.apply``
+        format and return the (level, x, z) of every tile they changed.
+
+        The whole list is validated first, so an invalid edit raises
+        KeyError or ValueError without stamping any of them.
+        """
+        validate_edits(edits, self._buildings)
+        regions: List[Region] = []
+        for edit in edits:
+            op = edit.get('op')
+            if op == 'add':
+                building = edit['building']
+                if building['id'] in self._buildings:
+                    raise ValueError("building ids must be unique")
+                x, z = building['position'][0], building['position'][2]
+                weight = float(np.prod(building['size'][:3])) if self.weight_by_volume else 1.0
+                self._buildings[building['id']] = (float(x), float(z), weight)
+                regions.append(self._stamp_at(x, z, weight))
+            elif op in ('move', 'remove'):
+                found = self._buildings.get(edit['id'])
+                if found is None:
+                    raise KeyError(f"building {edit['id']} not found")
+                x, z, weight = found
+                regions.append(self._stamp_at(x, z, -weight))
+                if op == 'remove':
+                    del self._buildings[edit['id']]
+                else:
+                    x, z = float(edit['position'][0]), float(edit['position'][2])
+                    self._buildings[edit['id']] = (x, z, weight)
+                    regions.append(self._stamp_at(x, z, weight))
+            else:
+                raise ValueError(f"edit op must be one of {', '.join(EDIT_OPERATIONS)}")
+
+        changed: Set[TileIndex] = set()
+        for region in regions:
+            changed |= self._propagate(region)
+        if regions:
+            self.version += 1
+        return changed
+
+    def _propagate(self, region: Region) -> Set[TileIndex]:
+        """Re-reduce a changed base region up every level, returning the tiles it touches"""
+        size = self.tile_size
+        changed: Set[TileIndex] = set()
+        for level in range(len(self._levels) - 1, -1, -1):
+            r0, r1, c0, c1 = region
+            if level < len(self._levels) - 1:
+                finer = self._levels[level + 1]
+                self._levels[level][r0:r1, c0:c1] = _reduce(
+                    finer[2 * r0:2 * r1, 2 * c0:2 * c1], self._mode)
+            changed.update((level, x, z)
+                           for z in range(r0 // size, (r1 - 1) // size + 1)
+                           for x in range(c0 // size, (c1 - 1) // size + 1))
+            region = (r0 // 2, -(-r1 // 2), c0 // 2, -(-c1 // 2))
+        return changed
+
+
+class TileCache:
+    """In-process LRU cache of float32 tiles bounded by their total bytes"""
+
+    def __init__(self, max_bytes: int = DEFAULT_TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._tiles: 'OrderedDict[TileKey, np.ndarray]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: TileKey) -> Optional[np.ndarray]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+    def set(self, key: TileKey, tile: np.ndarray):
+        if tile.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._tiles[key] = tile
+            self._bytes += tile.nbytes
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._tiles)))
+                self.evictions += 1
+
+    def invalidate(self, keys: Sequence[TileKey]):
+        with self._lock:
+            for key in keys:
+                if self._discard(key):
+                    self.invalidations += 1
+
+    def drop(self, pyramid_id: str):
+        """Forget every tile of a pyramid"""
+        with self._lock:
+            for key in [key for key in self._tiles if key[0] == pyramid_id]:
+                self._discard(key)
+
+    def _discard(self, key: TileKey) -> bool:
+        tile = self._tiles.pop(key, None)
+        if tile is None:
+            return False
+        self._bytes -= tile.nbytes
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._tiles),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+class HeatmapPyramids:
+    """
+    Thread-safe store of heatmap pyramids keyed by id, in front of a shared
+    ``TileCache``.
+
+    Tiles are cut on first request and cached; edits re-reduce the changed
+    regions and invalidate only the tiles over them. Pyramids idle for
+    longer than ``idle_timeout`` seconds are dropped, and the least recently
+    used one is dropped when ``max_pyramids`` is reached.
+    """
+
+    def __init__(self, cache: Optional[TileCache] = None, max_pyramids: int = 32,
+                 idle_timeout: float = 3600.0):
+        self.cache = cache if cache is not None else TileCache()
+        self.max_pyramids = max_pyramids
+        self.idle_timeout = idle_timeout
+        self._pyramids: Dict[str, HeatmapPyramid] = {}
+        self._last_used: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        for pyramid_id, last_used in list(self._last_used.items()):
+            if now - last_used > self.idle_timeout:
+                self._drop(pyramid_id)
+        while len(self._pyramids) >= self.max_pyramids:
+            self._drop(min(self._last_used, key=self._last_used.get))
+
+    def _drop(self, pyramid_id: str):
+        self._pyramids.pop(pyramid_id, None)
+        self._last_used.pop(pyramid_id, None)
+        self._locks.pop(pyramid_id, None)
+        self.cache.drop(pyramid_id)
+
+    def create(self, buildings: Sequence[Dict], **params) -> str:
+        """Build a pyramid (see ``HeatmapPyramid`` for ``params``) and return its id"""
+        pyramid = HeatmapPyramid(buildings, **params)
+        pyramid_id = uuid.uuid4().hex
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._pyramids[pyramid_id] = pyramid
+            self._last_used[pyramid_id] = now
+            self._locks[pyramid_id] = threading.Lock()
+        return pyramid_id
+
+    def get(self, pyramid_id: str) -> Optional[HeatmapPyramid]:
+        return self._lookup(pyramid_id)[0]
+
+    def _lookup(self, pyramid_id: str) -> Tuple[Optional[HeatmapPyramid], Optional[threading.Lock]]:
+        """A pyramid and the lock serialising its edits and tile cuts"""
+        with self._lock:
+            pyramid = self._pyramids.get(pyramid_id)
+            if pyramid is None:
+                return None, None
+            self._last_used[pyramid_id] = time.monotonic()
+            return pyramid, self._locks[pyramid_id]
+
+    def tile(self, pyramid_id: str, level: int, x: int, z: int) -> Tuple[Optional[np.ndarray], bool]:
+        """
+        Served values of one tile and whether it came from the cache;
+        (None, False) when the pyramid does not exist
+        """
+        pyramid, lock = self._lookup(pyramid_id)
+        if pyramid is None:
+            return None, False
+        key = (pyramid_id, level, x, z)
+        with lock:
+            tile = self.cache.get(key)
+            hit = tile is not None
+            if not hit:
+                tile = pyramid.tile(level, x, z)
+                self.cache.set(key, tile)
+            scale = pyramid.scale
+        return (tile * np.float32(scale) if scale != 1.0 else tile), hit
+
+    def apply(self, pyramid_id: str, edits: Sequence[Dict]) -> Optional[Dict[int, int]]:
+        """Apply edits and invalidate the tiles they changed; returns changed tiles per level"""
+        pyramid, lock = self._lookup(pyramid_id)
+        if pyramid is None:
+            return None
+        with lock:
+            changed = pyramid.apply(edits)
+            self.cache.invalidate([(pyramid_id,) + index for index in changed])
+        per_level: Dict[int, int] = {}
+        for level, _, _ in changed:
+            per_level[level] = per_level.get(level, 0) + 1
+        return dict(sorted(per_level.items()))
+
+    def delete(self, pyramid_id: str) -> bool:
+        with self._lock:
+            found = pyramid_id in self._pyramids
+            self._drop(pyramid_id)
+            return found
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'pyramids': len(self._pyramids),
+                'max_pyramids': self.max_pyramids
+            }
@@ -0,0 +1,401 @@
+"""
+Incremental Analytics Module
+Stateful city scoring with add/move/remove deltas
+"""
+
+import threading
+import time
+import uuid
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from city_analytics import (
+    _PAIR_BLOCK_ENTRIES, density_score, distribution_score, diversity_score,
+    efficiency_score, mean_pairwise_distance, performance_report, quadrant_index,
+    sustainability_score
+)
+from city_arrays import BUILDING_TYPES
+from heatmap import DEFAULT_EXTENT
+
+
+EDIT_OPERATIONS = ('add', 'move', 'remove')
+
+# Fewest edits between exact recomputations of the pairwise-distance sum
+RESYNC_EDITS = 1024
+
+# Pairwise distances each edit adds to a pending resync (whole rows, at least one)
+RESYNC_PAIRS = 1 << 19
+
+
+def _check_vector(values, name: str):
+    """Raise ValueError unless ``values`` holds at least three finite numbers"""
+    try:
+        valid = len(values) >= 3 and all(np.isfinite(float(v)) for v in values[:3])
+    except (TypeError, ValueError):
+        valid = False
+    if not valid:
+        raise ValueError(f"{name} must be [x, y, z]")
+
+
+def validate_edits(edits: Sequence[Dict], ids: Iterable[str]):
+    """
+    Check a list of add/move/remove edits against the building ``ids`` they
+    start from, tracking the ids each edit leaves behind; raises KeyError or
+    ValueError on the first invalid edit
+    """
+    ids = set(ids)
+    for edit in edits:
+        if not isinstance(edit, dict):
+            raise ValueError("each edit must be an object")
+        op = edit.get('op')
+        if op == 'add':
+            building = edit['building']
+            _check_vector(building['position'], 'position')
+            _check_vector(building['size'], 'size')
+            if not isinstance(building['type'], str):
+                raise ValueError("building type must be a string")
+            if building['id'] in ids:
+                raise ValueError("building ids must be unique")
+            ids.add(building['id'])
+        elif op in ('move', 'remove'):
+            if edit['id'] not in ids:
+                raise KeyError(f"building {edit['id']} not found")
+            if op == 'move':
+                _check_vector(edit['position'], 'position')
+            else:
+                ids.remove(edit['id'])
+        else:
+            raise ValueError(f"edit op must be one of {', '.join(EDIT_OPERATIONS)}")
+
+
+@dataclass
+class _PendingResync:
+    """An exact distance sum being accumulated row by row over a snapshot"""
+    positions: np.ndarray
+    # The running distance sum when the snapshot was taken
+    baseline: float
+    row: int = 0
+    total: float = 0.0
+
+
+class IncrementalAnalyzer:
+    """
+    Keeps the running totals behind every ``analyze_city_performance`` score.
+
+    Buildings live in preallocated columns indexed through an id -> slot map;
+    removals swap the last building into the freed slot. Each edit updates
+    the quadrant counts, type counts and occupied area in O(1) and the
+    pairwise-distance sum with one vectorised pass over the other buildings,
+    so re-scoring after an edit never revisits all pairs. Density and
+    quadrants are measured over ``extent``.
+
+    Moves and removals subtract from the distance sum and occupied area, so
+    rounding error builds up in both. After every ``RESYNC_EDITS`` moves and
+    removals, or every n when the city holds more buildings than that, the
+    occupied area is recomputed and the positions are snapshotted. The
+    snapshot's exact distance sum is then accumulated about ``RESYNC_PAIRS``
+    distances per edit, so no single edit pays the O(n^2) pass, and once
+    complete it replaces the running sum as of the snapshot, keeping the
+    deltas applied since. ``resync`` recomputes both at once.
+    """
+
+    def __init__(self, buildings: Sequence[Dict] = (), capacity: int = 64,
+                 extent: Sequence[float] = DEFAULT_EXTENT):
+        self.extent = tuple(float(v) for v in extent)
+        self.type_names = list(BUILDING_TYPES)
+        self._type_lookup = {name: code for code, name in enumerate(self.type_names)}
+        self._slots: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._positions = np.empty((capacity, 2))
+        self._sizes = np.empty((capacity, 3))
+        self._types = np.empty(capacity, dtype=np.int64)
+
+        self.quadrants = np.zeros(4, dtype=np.int64)
+        self.type_counts = np.zeros(len(self.type_names), dtype=np.int64)
+        self.occupied_area = 0.0
+        self.distance_sum = 0.0
+        self._edits_since_sync = 0
+        self._pending: Optional[_PendingResync] = None
+
+        self.add_many(buildings)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, building_id: str) -> bool:
+        return building_id in self._slots
+
+    @property
+    def positions(self) -> np.ndarray:
+        """(n, 2) ground-plane positions, in slot order"""
+        return self._positions[:len(self)]
+
+    def _type_code(self, building_type: str) -> int:
+        code = self._type_lookup.get(building_type)
+        if code is None:
+            code = self._type_lookup[building_type] = len(self.type_names)
+            self.type_names.append(building_type)
+            self.type_counts = np.append(self.type_counts, 0)
+        return code
+
+    def _grow(self, needed: int):
+        capacity = len(self._positions)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        n = len(self)
+        for name in ('_positions', '_sizes', '_types'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+
+    def _distances(self, point: np.ndarray, exclude: Optional[int] = None) -> float:
+        """Sum of distances from ``point`` to every building except slot ``exclude``"""
+        total = float(np.sqrt(((self.positions - point) ** 2).sum(axis=1)).sum())
+        if exclude is not None:
+            total -= float(np.hypot(*(self._positions[exclude] - point)))
+        return total
+
+    def add(self, building: Dict):
+        """Add one building dict"""
+        self.add_many([building])
+
+    def add_many(self, buildings: Sequence[Dict]):
+        """Add several buildings, pairing them with each other in one blockwise pass"""
+        if not buildings:
+            return
+        # A single NaN would poison the distance sum until the next resync
+        validate_edits([{'op': 'add', 'building': b} for b in buildings], self._slots)
+        ids = [b['id'] for b in buildings]
+
+        points = np.array([(b['position'][0], b['position'][2]) for b in buildings], dtype=np.float64)
+        sizes = np.array([b['size'][:3] for b in buildings], dtype=np.float64).reshape(-1, 3)
+        types = np.array([self._type_code(b['type']) for b in buildings], dtype=np.int64)
+        m = len(points)
+
+        # New-to-existing pairs, then pairs among the new buildings
+        existing = self.positions
+        rows = max(1, _PAIR_BLOCK_ENTRIES // max(len(existing), 1))
+        for start in range(0, m if len(existing) else 0, rows):
+            block = points[start:start + rows]
+            self.distance_sum += float(np.sqrt(
+                ((block[:, None, :] - existing[None, :, :]) ** 2).sum(axis=2)).sum())
+        self.distance_sum += mean_pairwise_distance(points) * m * (m - 1) / 2
+
+        start = len(self)
+        self._grow(start + m)
+        self._positions[start:start + m] = points
+        self._sizes[start:start + m] = sizes
+        self._types[start:start + m] = types
+        for offset, building_id in enumerate(ids):
+            self._slots[building_id] = start + offset
+        self._ids.extend(ids)
+
+        self.quadrants += np.bincount(quadrant_index(points, self.extent), minlength=4)
+        self.type_counts += np.bincount(types, minlength=len(self.type_counts))
+        self.occupied_area += float(np.dot(sizes[:, 0], sizes[:, 2]))
+
+    def move(self, building_id: str, position: Sequence[float]):
+        """Move a building to a new (x, y, z) position"""
+        slot = self._slot(building_id)
+        point = np.array([position[0], position[2]], dtype=np.float64)
+        old = self._positions[slot].copy()
+
+        self.distance_sum += self._distances(point, slot) - self._distances(old, slot)
+        self.quadrants[quadrant_index(old, self.extent)] -= 1
+        self.quadrants[quadrant_index(point, self.extent)] += 1
+        self._positions[slot] = point
+        self._edited(1)
+
+    def remove(self, building_id: str):
+        """Remove a building, moving the last one into its slot"""
+        slot = self._slot(building_id)
+        point = self._positions[slot].copy()
+
+        self.distance_sum -= self._distances(point, slot)
+        self.quadrants[quadrant_index(point, self.extent)] -= 1
+        self.type_counts[self._types[slot]] -= 1
+        self.occupied_area -= self._sizes[slot, 0] * self._sizes[slot, 2]
+
+        last = len(self) - 1
+        if slot != last:
+            self._positions[slot] = self._positions[last]
+            self._sizes[slot] = self._sizes[last]
+            self._types[slot] = self._types[last]
+            self._ids[slot] = self._ids[last]
+            self._slots[self._ids[slot]] = slot
+        self._ids.pop()
+        del self._slots[building_id]
+
+        if not len(self):
+            # Drop accumulated rounding once the city is empty
+            self.distance_sum = 0.0
+            self.occupied_area = 0.0
+            self._pending = None
+        self._edited(1)
+
+    def _edited(self, count: int):
+        """
+        Count subtracting edits, snapshotting for a resync once enough have
+        accumulated, and advance a pending resync by one step
+        """
+        self._edits_since_sync += count
+        if self._pending is None and self._edits_since_sync >= max(RESYNC_EDITS, len(self)):
+            self._edits_since_sync = 0
+            self._sync_area()
+            self._pending = _PendingResync(self.positions.copy(), self.distance_sum)
+        if self._pending is not None:
+            self._advance_resync()
+
+    def _advance_resync(self):
+        pending = self._pending
+        points = pending.positions
+        stop = min(pending.row + max(1, RESYNC_PAIRS // len(points)), len(points))
+        xs, zs = points[:, 0], points[:, 1]
+        for x, z in points[pending.row:stop].tolist():
+            pending.total += float(np.hypot(xs - x, zs - z).sum())
+        pending.row = stop
+
+        if stop == len(points):
+            # Every pair was counted from both ends
+            self.distance_sum = pending.total / 2 + (self.distance_sum - pending.baseline)
+            self._pending = None
+
+    def _sync_area(self):
+        sizes = self._sizes[:len(self)]
+        self.occupied_area = float(np.dot(sizes[:, 0], sizes[:, 2]))
+
+    def resync(self):
+        """Recompute the pairwise-distance sum and occupied area exactly, in one O(n^2) pass"""
+        n = len(self)
+        self.distance_sum = mean_pairwise_distance(self.positions) * n * (n - 1) / 2
+        self._sync_area()
+        self._edits_since_sync = 0
+        self._pending = None
+
+    def _slot(self, building_id: str) -> int:
+        slot = self._slots.get(building_id)
+        if slot is None:
+            raise KeyError(f"building {building_id} not found")
+        return slot
+
+    def apply(self, edits: Sequence[Dict]):
+        """
+        Apply a list of edits in order. Each edit is one of
+        ``{'op': 'add', 'building': {...}}``,
+        ``{'op': 'move', 'id': ..., 'position': [x, y, z]}`` or
+        ``{'op': 'remove', 'id': ...}``.
+
+        The whole list is validated first, so an invalid edit raises
+        KeyError or ValueError without applying any of them.
+        """
+        self._validate(edits)
+        for edit in edits:
+            op = edit.get('op')
+            if op == 'add':
+                self.add(edit['building'])
+            elif op == 'move':
+                self.move(edit['id'], edit['position'])
+            elif op == 'remove':
+                self.remove(edit['id'])
+            else:
+                raise ValueError(f"edit op must be one of {', '.join(EDIT_OPERATIONS)}")
+
+    def _validate(self, edits: Sequence[Dict]):
+        validate_edits(edits, self._slots)
+
+    def count(self, building_type: str) -> int:
+        code = self._type_lookup.get(building_type)
+        return int(self.type_counts[code]) if code is not None else 0
+
+    def performance(self) -> Dict:
+        """Scores matching ``CityAnalytics.analyze_city_performance`` for the current city"""
+        n = len(self)
+        pairs = n * (n - 1) / 2
+
+        performance = performance_report(
+            efficiency=efficiency_score(self.distance_sum / pairs if pairs else 0.0) if n else 0.0,
+            density=density_score(self.occupied_area, self.extent) if n else 0.0,
+            distribution=distribution_score(self.quadrants),
+            diversity=diversity_score(self.type_counts),
+            sustainability=sustainability_score(self.count('infrastructure'),
+                                                self.count('public'), n)
+        )
+        performance['building_count'] = n
+        return performance
+
+
+class AnalysisSessions:
+    """
+    Thread-safe store of incremental analyzers keyed by session id.
+
+    Sessions idle for longer than ``idle_timeout`` seconds are dropped, and
+    the least recently used one is dropped when ``max_sessions`` is reached.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_timeout: float = 3600.0):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, IncrementalAnalyzer] = {}
+        self._last_used: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        for session_id, last_used in list(self._last_used.items()):
+            if now - last_used > self.idle_timeout:
+                self._drop(session_id)
+        while len(self._sessions) >= self.max_sessions:
+            self._drop(min(self._last_used, key=self._last_used.get))
+
+    def _drop(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+        self._locks.pop(session_id, None)
+
+    def create(self, buildings: Sequence[Dict],
+               extent: Sequence[float] = DEFAULT_EXTENT) -> str:
+        analyzer = IncrementalAnalyzer(buildings, extent=extent)
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._sessions[session_id] = analyzer
+            self._last_used[session_id] = now
+            self._locks[session_id] = threading.Lock()
+        return session_id
+
+    def get(self, session_id: str) -> Optional[IncrementalAnalyzer]:
+        with self._lock:
+            analyzer = self._sessions.get(session_id)
+            if analyzer is not None:
+                self._last_used[session_id] = time.monotonic()
+            return analyzer
+
+    def lookup(self, session_id: str) -> Tuple[Optional[IncrementalAnalyzer], Optional[threading.Lock]]:
+        """
+        A session's analyzer and the lock serialising its edits, fetched
+        together so a concurrent expiry cannot split them; (None, None) when
+        the session does not exist
+        """
+        with self._lock:
+            analyzer = self._sessions.get(session_id)
+            if analyzer is None:
+                return None, None
+            self._last_used[session_id] = time.monotonic()
+            return analyzer, self._locks[session_id]
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            found = session_id in self._sessions
+            self._drop(session_id)
+            return found
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions
+            }
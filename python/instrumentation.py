@@ -0,0 +1,396 @@
+"""
+Instrumentation Module
+Prometheus metrics, per-stage timers and per-request profiles
+"""
+
+import contextvars
+import cProfile
+import glob
+import hmac
+import io
+import math
+import os
+import pstats
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+
+
+# Seconds; chosen to cover sub-millisecond kernels up to long optimisations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Energy traces in profiles are downsampled to at most this many points
+MAX_TRACE_POINTS = 64
+
+PROFILE_DIR = os.environ.get('CITY_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'city-profiles'))
+
+# cProfile dumps are written to disk, so they are only taken for requests
+# carrying this token in X-Profile-Token; unset disables them
+PROFILE_TOKEN = os.environ.get('CITY_PROFILE_TOKEN')
+
+# Saved profiles kept in PROFILE_DIR; older ones are deleted
+MAX_PROFILES = int(os.environ.get('CITY_PROFILE_MAX_FILES', 100))
+
+# Orderings accepted by profile_report
+PROFILE_SORT_KEYS = ('calls', 'cumulative', 'filename', 'line', 'module', 'name',
+                     'ncalls', 'pcalls', 'stdname', 'time', 'tottime')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and histograms rendered in the Prometheus
+    text exposition format. Recording a sample is a dict update under a lock.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._values: Dict[str, Dict[Labels, float]] = {}
+        # name -> labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}
+
+    def describe(self, name: str, kind: str, description: str):
+        self._meta[name] = (kind, description)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values.setdefault(name, {})[_labels(labels)] = float(value)
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def export(self) -> Dict:
+        """Picklable copy of every recorded value, for ``merge`` in another process"""
+        with self._lock:
+            return {
+                'values': {name: dict(series) for name, series in self._values.items()},
+                'histograms': {name: {labels: list(state) for labels, state in series.items()}
+                               for name, series in self._histograms.items()}
+            }
+
+    def merge(self, exported: Dict):
+        """
+        Fold another registry's ``export`` into this one: gauges take the
+        exported value, counters and histograms are added
+        """
+        with self._lock:
+            for name, series in exported['values'].items():
+                gauge = self._meta.get(name, ('',))[0] == 'gauge'
+                target = self._values.setdefault(name, {})
+                for labels, value in series.items():
+                    target[labels] = value if gauge else target.get(labels, 0.0) + value
+            for name, series in exported['histograms'].items():
+                target = self._histograms.setdefault(name, {})
+                for labels, state in series.items():
+                    current = target.get(labels)
+                    if current is None or len(current) != len(state):
+                        target[labels] = list(state)
+                    else:
+                        target[labels] = [a + b for a, b in zip(current, state)]
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            names = sorted(set(self._values) | set(self._histograms))
+            for name in names:
+                kind, description = self._meta.get(
+                    name, ('histogram' if name in self._histograms else 'untyped', ''))
+                if description:
+                    lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {kind}')
+
+                for labels, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+                for labels, state in sorted(self._histograms.get(name, {}).items()):
+                    for bound, count in zip(self.buckets, state):
+                        bucket = _format_labels(labels, [('le', _format_value(bound))])
+                        lines.append(f'{name}_bucket{bucket} {_format_value(count)}')
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} '
+                                 f'{_format_value(state[-1])}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(state[-2])}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {_format_value(state[-1])}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+metrics.describe('city_requests_total', 'counter', 'HTTP requests by endpoint and status code')
+metrics.describe('city_request_seconds', 'histogram', 'Wall time per HTTP request')
+metrics.describe('city_stage_seconds', 'histogram', 'Wall time per request stage')
+metrics.describe('city_annealing_runs_total', 'counter', 'Layout optimisation runs')
+metrics.describe('city_annealing_steps_total', 'counter', 'Annealing steps proposed')
+metrics.describe('city_annealing_accepted_total', 'counter', 'Annealing steps accepted')
+metrics.describe('city_annealing_last_energy', 'gauge', 'Final energy of the latest optimisation')
+metrics.describe('city_sampler_runs_total', 'counter', 'Poisson disk sampling runs')
+metrics.describe('city_sampler_attempts_total', 'counter', 'Candidate positions proposed by the sampler')
+metrics.describe('city_sampler_rejections_total', 'counter', 'Candidate positions rejected by the sampler')
+metrics.describe('city_sampler_saturated_total', 'counter', 'Sampling runs that saturated the grid')
+metrics.describe('city_cache_hits_total', 'counter', 'Result cache hits')
+metrics.describe('city_cache_misses_total', 'counter', 'Result cache misses')
+metrics.describe('city_cache_evictions_total', 'counter', 'Result cache LRU evictions')
+metrics.describe('city_cache_expirations_total', 'counter', 'Result cache TTL expirations')
+metrics.describe('city_cache_bytes', 'gauge', 'Bytes held by the result cache')
+metrics.describe('city_cache_entries', 'gauge', 'Entries held by the result cache')
+metrics.describe('city_jobs_workers', 'gauge', 'Job queue worker processes')
+metrics.describe('city_jobs_pending', 'gauge', 'Jobs queued or running')
+metrics.describe('city_jobs_max_pending', 'gauge', 'Job queue capacity')
+metrics.describe('city_jobs_retained', 'gauge', 'Jobs retained for status queries')
+metrics.describe('city_sessions', 'gauge', 'Open incremental analysis sessions')
+
+
+@dataclass
+class RequestProfile:
+    """Opt-in detail collected for a single request"""
+    endpoint: str
+    stages: Dict[str, float] = field(default_factory=dict)
+    annealing: List[Dict] = field(default_factory=list)
+    sampling: List[Dict] = field(default_factory=list)
+    profiler: Optional[cProfile.Profile] = None
+    profile_id: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        data = {
+            'endpoint': self.endpoint,
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+        }
+        if self.annealing:
+            data['annealing'] = self.annealing
+        if self.sampling:
+            data['sampling'] = self.sampling
+        if self.profile_id:
+            data['cprofile'] = self.profile_id
+        return data
+
+
+_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar('city_endpoint', default='none')
+_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    'city_profile', default=None)
+_registry: contextvars.ContextVar[MetricsRegistry] = contextvars.ContextVar(
+    'city_registry', default=metrics)
+
+
+@contextmanager
+def capture_metrics() -> Iterator[MetricsRegistry]:
+    """
+    Record annealing and sampling metrics into a fresh registry for the
+    duration of the block, so work done in a job worker can be shipped back
+    and merged into the service's ``metrics``
+    """
+    registry = MetricsRegistry()
+    token = _registry.set(registry)
+    try:
+        yield registry
+    finally:
+        _registry.reset(token)
+
+
+def _profiling_allowed(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def begin_request(endpoint: str, profile: Optional[str] = None,
+                  token: Optional[str] = None) -> Optional[RequestProfile]:
+    """
+    Mark the start of a request. ``profile`` is the value of the client's
+    ``X-Profile`` header: any value collects a profile, ``cprofile``
+    additionally runs the request under ``cProfile`` when ``token`` (the
+    ``X-Profile-Token`` header) matches ``PROFILE_TOKEN``.
+    """
+    _endpoint.set(endpoint)
+    if not profile:
+        _profile.set(None)
+        return None
+
+    request_profile = RequestProfile(endpoint)
+    if profile.strip().lower() == 'cprofile' and _profiling_allowed(token):
+        request_profile.profiler = cProfile.Profile()
+        request_profile.profiler.enable()
+    _profile.set(request_profile)
+    return request_profile
+
+
+def end_request(status: int, seconds: float) -> Optional[RequestProfile]:
+    """Record request totals and return the finished profile, if any"""
+    endpoint = _endpoint.get()
+    metrics.inc('city_requests_total', endpoint=endpoint, status=status)
+    metrics.observe('city_request_seconds', seconds, endpoint=endpoint)
+
+    request_profile = _profile.get()
+    _profile.set(None)
+    _endpoint.set('none')
+    if request_profile is not None and request_profile.profiler is not None:
+        request_profile.profiler.disable()
+        request_profile.profile_id = save_profile(request_profile.profiler)
+        request_profile.profiler = None
+    return request_profile
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as one stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe('city_stage_seconds', seconds, endpoint=_endpoint.get(), stage=name)
+        request_profile = _profile.get()
+        if request_profile is not None:
+            request_profile.stages[name] = request_profile.stages.get(name, 0.0) + seconds
+
+
+def timed_stream(name: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Record the time spent producing a streamed body as a stage"""
+    endpoint = _endpoint.get()
+    seconds = 0.0
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            seconds += time.perf_counter() - start
+        yield chunk
+    metrics.observe('city_stage_seconds', seconds, endpoint=endpoint, stage=name)
+
+
+def _downsample(trace: Sequence[float]) -> List[float]:
+    if len(trace) <= MAX_TRACE_POINTS:
+        return list(trace)
+    step = (len(trace) - 1) / (MAX_TRACE_POINTS - 1)
+    return [trace[round(i * step)] for i in range(MAX_TRACE_POINTS)]
+
+
+def record_annealing(result) -> None:
+    """Count an ``AnnealingResult`` or ``MultiChainResult``"""
+    if result is None:
+        return
+    registry = _registry.get()
+    registry.inc('city_annealing_runs_total')
+    registry.inc('city_annealing_steps_total', result.steps)
+    registry.inc('city_annealing_accepted_total', result.accepted)
+    registry.set('city_annealing_last_energy', result.energy)
+
+    request_profile = _profile.get()
+    if request_profile is not None:
+        trace = getattr(result, 'energy_trace', None)
+        if trace is None:
+            # Multi-chain runs: follow the winning chain
+            traces = getattr(result, 'energy_traces', [])
+            trace = traces[result.best_chain] if traces else []
+        request_profile.annealing.append({
+            'steps': result.steps,
+            'accepted': result.accepted,
+            'acceptance_rate': result.acceptance_rate,
+            'initial_energy': result.initial_energy,
+            'energy': result.energy,
+            'energy_trace': _downsample(trace)
+        })
+
+
+def record_sampling(result) -> None:
+    """Count a ``SamplingResult``"""
+    if result is None:
+        return
+    registry = _registry.get()
+    registry.inc('city_sampler_runs_total')
+    registry.inc('city_sampler_attempts_total', result.attempts)
+    registry.inc('city_sampler_rejections_total', result.rejections)
+    if result.saturated:
+        registry.inc('city_sampler_saturated_total')
+
+    request_profile = _profile.get()
+    if request_profile is not None:
+        request_profile.sampling.append({
+            'points': len(result.positions),
+            'attempts': result.attempts,
+            'rejections': result.rejections,
+            'saturated': result.saturated
+        })
+
+
+def save_profile(profiler: cProfile.Profile) -> str:
+    """
+    Write profiler stats to ``PROFILE_DIR`` and return their id, deleting
+    the oldest profiles beyond ``MAX_PROFILES``
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = uuid.uuid4().hex
+    profiler.dump_stats(profile_path(profile_id))
+    _prune_profiles(MAX_PROFILES)
+    return profile_id
+
+
+def _prune_profiles(keep: int):
+    paths = []
+    for path in glob.glob(os.path.join(PROFILE_DIR, '*.prof')):
+        try:
+            paths.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    for _, path in sorted(paths)[:max(len(paths) - keep, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def profile_path(profile_id: str) -> str:
+    if not profile_id.isalnum():
+        raise ValueError("invalid profile id")
+    return os.path.join(PROFILE_DIR, f'{profile_id}.prof')
+
+
+def profile_report(profile_id: str, sort: str = 'cumulative', limit: int = 50) -> str:
+    """Human-readable pstats report of a saved profile; ``sort`` is one of ``PROFILE_SORT_KEYS``"""
+    if sort not in PROFILE_SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(PROFILE_SORT_KEYS)}")
+    buffer = io.StringIO()
+    stats = pstats.Stats(profile_path(profile_id), stream=buffer)
+    stats.sort_stats(sort).print_stats(limit)
+    return buffer.getvalue()
@@ -0,0 +1,238 @@
+"""
+Job Queue Module
+Asynchronous process-pool execution of CPU-bound service tasks
+"""
+
+import os
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+from instrumentation import capture_metrics, metrics
+
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_TIMED_OUT = 'timed_out'
+JOB_CANCELLED = 'cancelled'
+
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_TIMED_OUT, JOB_CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds its maximum number of unfinished jobs"""
+
+
+class JobTimeoutError(Exception):
+    """Raised inside a worker when a job exceeds its time limit"""
+
+
+def _raise_timeout(signum, frame):
+    raise JobTimeoutError()
+
+
+def _run_with_timeout(fn: Callable[[Dict], Dict], data: Dict,
+                      timeout: Optional[float]) -> Tuple[Dict, Dict]:
+    """
+    Worker-side wrapper enforcing the per-job time limit, returning the
+    result with the metrics the job recorded (see ``capture_metrics``).
+
+    Pool workers run tasks on their main thread, so a SIGALRM interval timer
+    can interrupt a long computation and free the worker for the next job.
+    """
+    with capture_metrics() as registry:
+        if not timeout or not hasattr(signal, 'setitimer'):
+            return fn(data), registry.export()
+
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return fn(data), registry.export()
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+@dataclass
+class Job:
+    """A unit of work submitted to the queue"""
+    id: str
+    kind: str
+    timeout: Optional[float]
+    submitted_at: float
+    future: Optional[Future] = None
+    finished_at: Optional[float] = None
+    status: str = JOB_QUEUED
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    cancel_requested: bool = field(default=False)
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'finished_at': self.finished_at,
+            'timeout': self.timeout,
+            'cancel_requested': self.cancel_requested,
+            'error': self.error
+        }
+
+
+class JobQueue:
+    """
+    Bounded job queue backed by a ``ProcessPoolExecutor``.
+
+    At most ``max_pending`` jobs may be queued or running at once; further
+    submissions raise ``QueueFullError`` so callers can apply backpressure.
+    Finished jobs are retained for polling until ``max_finished`` newer ones
+    push them out.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 default_timeout: Optional[float] = 60.0, max_timeout: float = 600.0,
+                 max_finished: int = 1000):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+        self.max_finished = max_finished
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, Job] = {}
+        self._finished: 'OrderedDict[str, None]' = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _submit(self, fn: Callable[[Dict], Dict], data: Dict,
+                timeout: Optional[float]) -> Tuple[Future, ProcessPoolExecutor]:
+        """
+        Submit to the pool, spawning it on the first job. A worker that died
+        (e.g. killed for running out of memory) breaks the whole pool, so a
+        broken pool is replaced and the submit retried once. Call with the
+        lock held.
+        """
+        for last_try in (False, True):
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            executor = self._executor
+            try:
+                return executor.submit(_run_with_timeout, fn, data, timeout), executor
+            except BrokenProcessPool:
+                self._executor = None
+                executor.shutdown(wait=False)
+                if last_try:
+                    raise
+
+    def submit(self, kind: str, fn: Callable[[Dict], Dict], data: Dict,
+               timeout: Optional[float] = None) -> Job:
+        """Queue ``fn(data)`` for execution in a worker process"""
+        if timeout is None:
+            timeout = self.default_timeout
+        else:
+            try:
+                timeout = float(timeout)
+            except (TypeError, ValueError):
+                raise ValueError("timeout must be a number")
+        if timeout is not None:
+            if not timeout > 0:
+                raise ValueError("timeout must be positive")
+            timeout = min(timeout, self.max_timeout)
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"job queue is full ({self.max_pending} pending jobs)")
+            job = Job(id=uuid.uuid4().hex, kind=kind, timeout=timeout, submitted_at=time.time())
+            # The job is only published once it has its future
+            job.future, executor = self._submit(fn, data, timeout)
+            self._jobs[job.id] = job
+            self._pending += 1
+
+        # Outside the lock: the callback runs at once if the job already finished
+        job.future.add_done_callback(lambda future: self._on_done(job, future, executor))
+        return job
+
+    def _on_done(self, job: Job, future: Future, executor: ProcessPoolExecutor):
+        with self._lock:
+            if job.status in FINISHED_STATES:
+                return
+
+            if job.cancel_requested or future.cancelled():
+                job.status = JOB_CANCELLED
+            else:
+                try:
+                    job.result, recorded = future.result()
+                    metrics.merge(recorded)
+                    job.status = JOB_COMPLETED
+                except JobTimeoutError:
+                    job.status = JOB_TIMED_OUT
+                    job.error = f"job exceeded its {job.timeout:g}s time limit"
+                except CancelledError:
+                    job.status = JOB_CANCELLED
+                except BrokenProcessPool as e:
+                    job.status = JOB_FAILED
+                    job.error = str(e)
+                    # The next submit spawns a fresh pool
+                    if self._executor is executor:
+                        self._executor = None
+                except Exception as e:
+                    job.status = JOB_FAILED
+                    job.error = str(e)
+
+            job.finished_at = time.time()
+            self._pending -= 1
+            self._retire(job)
+
+    def _retire(self, job: Job):
+        """Track a finished job, dropping the oldest ones beyond ``max_finished``"""
+        self._finished[job.id] = None
+        while len(self._finished) > self.max_finished:
+            old_id, _ = self._finished.popitem(last=False)
+            self._jobs.pop(old_id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job, refreshing its queued/running state"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status == JOB_QUEUED and job.future.running():
+                job.status = JOB_RUNNING
+            return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job. Queued jobs never start; a running job keeps its worker
+        until it finishes or times out, but its result is discarded.
+        """
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+
+        with self._lock:
+            job.cancel_requested = True
+        # Fires _on_done immediately when the job had not started yet
+        job.future.cancel()
+        return job
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'retained': len(self._jobs)
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,349 @@
+"""
+Metrics History Module
+Bounded columnar time series of city scores with optional on-disk segments
+"""
+
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+SCORE_COLUMNS = ('efficiency_score', 'density_score', 'distribution_score',
+                 'diversity_score', 'sustainability_score', 'overall_score')
+
+# Rows kept in memory per city
+DEFAULT_CAPACITY = 4096
+
+# Rows buffered in memory before they are appended to the city's log
+DEFAULT_FLUSH_ROWS = 256
+
+
+def _record_dtype(columns: Sequence[str]) -> np.dtype:
+    """On-disk row layout: little-endian timestamp followed by the score columns"""
+    return np.dtype([('timestamp', '<f8'), ('values', '<f8', (len(columns),))])
+
+
+class ScoreSeries:
+    """
+    Ring buffer of one city's score rows.
+
+    Timestamps (seconds since the epoch) and score columns live in
+    preallocated arrays, so appending is O(1) and never reallocates. Once
+    full, the oldest rows are overwritten. With a ``log_path`` every row is
+    also appended to an on-disk log in segments of ``flush_rows`` rows, and
+    range queries reaching past the buffer read the older rows from the log
+    through a memory map.
+
+    Timestamps never go backwards: a row stamped earlier than the last one
+    is recorded at the last timestamp.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY,
+                 columns: Sequence[str] = SCORE_COLUMNS,
+                 log_path: Optional[str] = None,
+                 flush_rows: int = DEFAULT_FLUSH_ROWS):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if log_path is not None and not 1 <= flush_rows <= capacity:
+            raise ValueError("flush_rows must be between 1 and capacity")
+        self.capacity = capacity
+        self.columns = tuple(columns)
+        self.log_path = log_path
+        self.flush_rows = flush_rows
+        self.timestamps = np.empty(capacity)
+        self.values = np.empty((capacity, len(self.columns)))
+        self.size = 0
+        # Rows ever appended and rows already in the log
+        self.total = 0
+        self.flushed = 0
+        self._lock = threading.Lock()
+
+        if log_path is not None and os.path.exists(log_path):
+            self._load_tail()
+
+    def _load_tail(self):
+        """Resume from an existing log, keeping its newest rows in memory"""
+        log = self._log()
+        tail = log[-self.capacity:]
+        self.size = len(tail)
+        self.total = self.flushed = len(log)
+        self._write(np.arange(self.total - self.size, self.total),
+                    tail['timestamp'], tail['values'])
+
+    @property
+    def last_timestamp(self) -> float:
+        return float(self.timestamps[(self.total - 1) % self.capacity]) if self.size else -np.inf
+
+    def _write(self, rows: np.ndarray, timestamps: np.ndarray, values: np.ndarray):
+        slots = rows % self.capacity
+        self.timestamps[slots] = timestamps
+        self.values[slots] = values
+
+    def append(self, timestamp: float, values: Sequence[float]):
+        """Record one row of scores in ``columns`` order"""
+        with self._lock:
+            slot = self.total % self.capacity
+            self.timestamps[slot] = max(float(timestamp), self.last_timestamp)
+            self.values[slot] = values
+            self.total += 1
+            self.size = min(self.size + 1, self.capacity)
+            if self.log_path is not None and self.total - self.flushed >= self.flush_rows:
+                self._flush()
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray):
+        """Record many rows at once, in chunks of at most ``capacity`` rows"""
+        timestamps = np.asarray(timestamps, dtype=np.float64).ravel()
+        values = np.asarray(values, dtype=np.float64).reshape(len(timestamps), len(self.columns))
+        with self._lock:
+            timestamps = np.maximum.accumulate(np.maximum(timestamps, self.last_timestamp))
+            for start in range(0, len(timestamps), self.capacity):
+                # Unflushed rows must reach the log before a chunk can overwrite them
+                if self.log_path is not None:
+                    self._flush()
+                chunk = slice(start, start + self.capacity)
+                count = len(timestamps[chunk])
+                self._write(np.arange(self.total, self.total + count),
+                            timestamps[chunk], values[chunk])
+                self.total += count
+                self.size = min(self.size + count, self.capacity)
+            if self.log_path is not None and self.total - self.flushed >= self.flush_rows:
+                self._flush()
+
+    def flush(self):
+        """Append every buffered row to the log"""
+        if self.log_path is not None:
+            with self._lock:
+                self._flush()
+
+    def _flush(self):
+        if self.flushed == self.total:
+            return
+        rows = np.arange(self.flushed, self.total)
+        segment = np.empty(len(rows), dtype=_record_dtype(self.columns))
+        segment['timestamp'] = self.timestamps[rows % self.capacity]
+        segment['values'] = self.values[rows % self.capacity]
+        with open(self.log_path, 'ab') as f:
+            f.write(segment.tobytes())
+        self.flushed = self.total
+
+    def _log(self) -> np.ndarray:
+        """Memory map of the log's complete rows"""
+        dtype = _record_dtype(self.columns)
+        rows = os.path.getsize(self.log_path) // dtype.itemsize
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.log_path, dtype=dtype, mode='r', shape=(rows,))
+
+    def _buffered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Buffered rows in time order; views unless the ring has wrapped"""
+        head = self.total % self.capacity
+        if self.size < self.capacity or head == 0:
+            return self.timestamps[:self.size], self.values[:self.size]
+        order = np.r_[head:self.capacity, 0:head]
+        return self.timestamps[order], self.values[order]
+
+    def query(self, start: Optional[float] = None,
+              end: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (timestamps, values) of the rows with ``start <= timestamp <= end``
+        in time order, reading rows older than the buffer from the log
+        """
+        start = -np.inf if start is None else float(start)
+        end = np.inf if end is None else float(end)
+        with self._lock:
+            timestamps, values = self._buffered()
+            lo = np.searchsorted(timestamps, start, side='left')
+            hi = np.searchsorted(timestamps, end, side='right')
+            timestamps, values = timestamps[lo:hi].copy(), values[lo:hi].copy()
+
+            older = self.total - self.size
+            if (self.log_path is None or older == 0 or
+                    (self.size and start > self.timestamps[older % self.capacity])):
+                return timestamps, values
+            log = self._log()[:older]
+
+        lo = np.searchsorted(log['timestamp'], start, side='left')
+        hi = np.searchsorted(log['timestamp'], end, side='right')
+        return (np.concatenate([log['timestamp'][lo:hi], timestamps]),
+                np.concatenate([log['values'][lo:hi], values]))
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing mean over ``window`` rows along the first axis from one cumulative
+    sum; the first rows average over the rows available so far
+    """
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    values = np.asarray(values, dtype=np.float64)
+    sums = np.cumsum(values, axis=0)
+    means = np.empty_like(sums)
+    head = min(window, len(values))
+    means[:head] = sums[:head] / np.arange(1, head + 1).reshape((-1,) + (1,) * (values.ndim - 1))
+    means[head:] = (sums[head:] - sums[:-head]) / window
+    return means
+
+
+def downsample(timestamps: np.ndarray, values: np.ndarray, buckets: int,
+               start: Optional[float] = None, end: Optional[float] = None) -> Dict:
+    """
+    Mean, min and max of every column in ``buckets`` equal time buckets
+    between ``start`` and ``end``. Rows must be in time order; empty
+    buckets are left out.
+    """
+    if buckets < 1:
+        raise ValueError("buckets must be at least 1")
+    if not len(timestamps):
+        return {'timestamps': [], 'count': [], 'mean': [], 'min': [], 'max': []}
+    start = float(timestamps[0]) if start is None else float(start)
+    end = float(timestamps[-1]) if end is None else float(end)
+    width = (end - start) / buckets or 1.0
+
+    bucket = np.clip(((timestamps - start) // width).astype(np.int64), 0, buckets - 1)
+    counts = np.bincount(bucket, minlength=buckets)
+    # Rows are sorted, so every non-empty bucket is one contiguous run
+    filled = np.flatnonzero(counts)
+    runs = np.searchsorted(bucket, filled)
+    return {
+        'timestamps': (start + filled * width).tolist(),
+        'count': counts[filled].tolist(),
+        'mean': (np.add.reduceat(values, runs, axis=0) / counts[filled, None]).tolist(),
+        'min': np.minimum.reduceat(values, runs, axis=0).tolist(),
+        'max': np.maximum.reduceat(values, runs, axis=0).tolist()
+    }
+
+
+class MetricsHistory:
+    """
+    Score histories keyed by city id.
+
+    Each city gets its own ``ScoreSeries``; at most ``max_cities`` are held
+    in memory and the least recently used is dropped beyond that. With a
+    ``directory`` every city's rows are also logged to disk, so dropped or
+    restarted histories reload from their log. A directory must belong to a
+    single process.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, directory: Optional[str] = None,
+                 max_cities: int = 1000, flush_rows: int = DEFAULT_FLUSH_ROWS,
+                 columns: Sequence[str] = SCORE_COLUMNS):
+        self.capacity = capacity
+        self.directory = directory
+        self.max_cities = max_cities
+        self.flush_rows = min(flush_rows, capacity)
+        self.columns = tuple(columns)
+        self._series: 'OrderedDict[str, ScoreSeries]' = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _log_path(self, city_id: str) -> Optional[str]:
+        if self.directory is None:
+            return None
+        name = hashlib.sha256(city_id.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f'{name}.scores')
+
+    def _get(self, city_id: str, create: bool) -> Optional[ScoreSeries]:
+        with self._lock:
+            series = self._series.get(city_id)
+            if series is not None:
+                self._series.move_to_end(city_id)
+                return series
+
+            log_path = self._log_path(city_id)
+            if not create and (log_path is None or not os.path.exists(log_path)):
+                return None
+            series = ScoreSeries(self.capacity, self.columns, log_path, self.flush_rows)
+            self._series[city_id] = series
+            while len(self._series) > self.max_cities:
+                _, dropped = self._series.popitem(last=False)
+                dropped.flush()
+            return series
+
+    def record(self, city_id: str, scores: Dict, timestamp: Optional[float] = None):
+        """Append one report's score columns, stamped now unless ``timestamp`` is given"""
+        self._get(city_id, create=True).append(
+            time.time() if timestamp is None else timestamp,
+            [scores[column] for column in self.columns]
+        )
+
+    def record_many(self, city_id: str, timestamps: Sequence[float], values: np.ndarray):
+        """Append (n,) timestamps and (n, columns) scores in one vectorised pass"""
+        self._get(city_id, create=True).extend(timestamps, values)
+
+    def query(self, city_id: str, start: Optional[float] = None,
+              end: Optional[float] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(timestamps, values) of a city between ``start`` and ``end``, or None for unknown cities"""
+        series = self._get(city_id, create=False)
+        return None if series is None else series.query(start, end)
+
+    def trends(self, city_id: str, start: Optional[float] = None, end: Optional[float] = None,
+               columns: Optional[Sequence[str]] = None, window: Optional[int] = None,
+               buckets: Optional[int] = None) -> Optional[Dict]:
+        """
+        Trend report of a city between ``start`` and ``end``: per-column
+        summary statistics, plus either the raw series (with a trailing
+        ``window``-row rolling mean) or ``buckets`` downsampled buckets
+        """
+        columns = list(columns or self.columns)
+        unknown = [c for c in columns if c not in self.columns]
+        if unknown:
+            raise ValueError(f"unknown columns: {', '.join(unknown)}")
+        found = self.query(city_id, start, end)
+        if found is None:
+            return None
+        timestamps, values = found
+        values = values[:, [self.columns.index(c) for c in columns]]
+
+        report = {
+            'city_id': city_id,
+            'count': len(timestamps),
+            'columns': columns,
+            'summary': _summary(values, columns)
+        }
+        if buckets is not None:
+            report['buckets'] = downsample(timestamps, values, buckets, start, end)
+        else:
+            report['timestamps'] = timestamps.tolist()
+            report['series'] = {c: values[:, i].tolist() for i, c in enumerate(columns)}
+            if window is not None:
+                means = rolling_mean(values, window)
+                report['rolling_mean'] = {c: means[:, i].tolist() for i, c in enumerate(columns)}
+        return report
+
+    def flush(self):
+        with self._lock:
+            series = list(self._series.values())
+        for s in series:
+            s.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'cities': len(self._series),
+                'rows': sum(s.size for s in self._series.values()),
+                'capacity': self.capacity,
+                'persistent': self.directory is not None
+            }
+
+
+def _summary(values: np.ndarray, columns: List[str]) -> Dict:
+    if not len(values):
+        return {}
+    first, last = values[0], values[-1]
+    mins, maxs, means = values.min(axis=0), values.max(axis=0), values.mean(axis=0)
+    return {
+        column: {
+            'min': float(mins[i]),
+            'max': float(maxs[i]),
+            'mean': float(means[i]),
+            'first': float(first[i]),
+            'last': float(last[i]),
+            'change': float(last[i] - first[i])
+        }
+        for i, column in enumerate(columns)
+    }
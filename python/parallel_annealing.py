@@ -0,0 +1,252 @@
+"""
+Parallel Annealing Module
+Multi-start and parallel-tempering layout optimisation across processes
+"""
+
+import math
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+
+from annealing import AnnealingSchedule, LayoutAnnealer, layout_energy
+
+
+CHAIN_MODES = ('restarts', 'tempering')
+
+
+@dataclass
+class MultiChainResult:
+    """Outcome of a multi-chain optimisation run"""
+    positions: np.ndarray
+    energy: float
+    initial_energy: float
+    steps: int
+    accepted: int
+    reheats: int
+    mode: str
+    best_chain: int
+    chain_energies: List[float] = field(default_factory=list)
+    energy_traces: List[List[float]] = field(default_factory=list)
+    temperatures: List[float] = field(default_factory=list)
+    swaps: int = 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.steps if self.steps else 0.0
+
+
+def _attach(name: str, shape: Tuple[int, ...]) -> Tuple[SharedMemory, np.ndarray]:
+    """Map a shared-memory block created by the parent as a float64 array"""
+    shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _restart_chain(shm_name: str, shape: Tuple[int, ...], chain: int, half_extent: float,
+                   schedule: AnnealingSchedule, seed: int, footprints: Optional[np.ndarray] = None,
+                   gap: float = 0.0) -> Tuple:
+    """Worker: anneal one independent chain and write its best layout back"""
+    shm, layouts = _attach(shm_name, shape)
+    try:
+        annealer = LayoutAnnealer(layouts[chain], half_extent, seed=seed,
+                                  footprints=footprints, gap=gap)
+        result = annealer.run(schedule)
+        layouts[chain] = result.positions
+        return result.energy, result.energy_trace, result.steps, result.accepted, result.reheats
+    finally:
+        del layouts
+        shm.close()
+
+
+def _tempering_sweep(shm_name: str, shape: Tuple[int, ...], slot: int, half_extent: float,
+                     temperature: float, iterations: int, step_size: float,
+                     best_energy: float, seed: int, footprints: Optional[np.ndarray] = None,
+                     gap: float = 0.0) -> Tuple:
+    """
+    Worker: advance one replica at a fixed temperature.
+
+    ``layouts[0, slot]`` holds the replica's current state and
+    ``layouts[1, slot]`` the best layout seen at this temperature.
+    """
+    shm, layouts = _attach(shm_name, shape)
+    try:
+        annealer = LayoutAnnealer(layouts[0, slot], half_extent, seed=seed,
+                                  footprints=footprints, gap=gap)
+        annealer.best_energy = min(annealer.best_energy, best_energy)
+        if annealer.energy < best_energy:
+            layouts[1, slot] = annealer.positions
+        if annealer.sweep(temperature, iterations, step_size):
+            layouts[1, slot] = annealer.best_positions
+        layouts[0, slot] = annealer.positions
+        return annealer.energy, annealer.best_energy, annealer.steps, annealer.accepted
+    finally:
+        del layouts
+        shm.close()
+
+
+def _run_all(executor: Optional[ProcessPoolExecutor], fn: Callable, calls: Sequence[Tuple]) -> List:
+    """Run ``fn`` over argument tuples, in the pool when there is one"""
+    if executor is None:
+        return [fn(*args) for args in calls]
+    futures = [executor.submit(fn, *args) for args in calls]
+    return [future.result() for future in futures]
+
+
+def _terminate(executor: ProcessPoolExecutor):
+    """
+    Shut a pool down after an error or timeout, killing workers still
+    running chains instead of leaving them to finish with no owner
+    """
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
+
+
+def _schedule_levels(schedule: AnnealingSchedule) -> int:
+    """Number of temperature levels in a schedule without reheats"""
+    if schedule.initial_temperature <= schedule.min_temperature:
+        return 0
+    return math.ceil(math.log(schedule.min_temperature / schedule.initial_temperature) /
+                     math.log(schedule.cooling_rate))
+
+
+def optimize_multichain(positions: np.ndarray, half_extent: float, chains: int = 4,
+                        workers: Optional[int] = None, mode: str = 'restarts',
+                        schedule: Optional[AnnealingSchedule] = None,
+                        seed: Optional[int] = None,
+                        exchange_interval: int = 10,
+                        footprints: Optional[np.ndarray] = None,
+                        gap: float = 0.0) -> MultiChainResult:
+    """
+    Optimise a layout with several annealing chains in parallel processes.
+
+    ``restarts`` runs ``chains`` independent annealers from the same start with
+    independent random streams. ``tempering`` runs one replica per temperature
+    on a geometric ladder between the schedule's minimum and initial
+    temperature, proposing exchanges between neighbouring replicas every
+    ``exchange_interval`` levels' worth of steps; its replicas never cool,
+    so a schedule with ``max_reheats`` raises ValueError. Layouts live in one
+    shared-memory block so workers never pickle position arrays.
+    ``footprints`` and ``gap`` select the footprint-aware energy of
+    ``LayoutAnnealer``.
+    """
+    if mode not in CHAIN_MODES:
+        raise ValueError(f"mode must be one of {', '.join(CHAIN_MODES)}")
+    if chains < 1:
+        raise ValueError("chains must be at least 1")
+
+    schedule = schedule or AnnealingSchedule()
+    if mode == 'tempering' and schedule.max_reheats:
+        raise ValueError("tempering does not reheat; max_reheats must be 0")
+    positions = np.ascontiguousarray(positions, dtype=np.float64).reshape(-1, 2)
+    workers = max(1, min(chains, workers or os.cpu_count() or 1))
+    streams = np.random.SeedSequence(seed).spawn(chains + 1)
+
+    def draw_seed(stream: np.random.SeedSequence) -> int:
+        return int(stream.spawn(1)[0].generate_state(1)[0])
+
+    layers = 2 if mode == 'tempering' else 1
+    shape = (layers, chains) + positions.shape
+    shm = SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+    layouts = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    layouts[:] = positions
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    finished = False
+
+    try:
+        initial_energy = layout_energy(positions, footprints=footprints, gap=gap)
+
+        if mode == 'restarts':
+            outcomes = _run_all(executor, _restart_chain, [
+                (shm.name, shape[1:], chain, half_extent, schedule, draw_seed(streams[chain]),
+                 footprints, gap)
+                for chain in range(chains)
+            ])
+            finished = True
+            chain_energies = [outcome[0] for outcome in outcomes]
+            best_chain = int(np.argmin(chain_energies))
+
+            return MultiChainResult(
+                positions=layouts[0, best_chain].copy(),
+                energy=chain_energies[best_chain],
+                initial_energy=initial_energy,
+                steps=sum(outcome[2] for outcome in outcomes),
+                accepted=sum(outcome[3] for outcome in outcomes),
+                reheats=sum(outcome[4] for outcome in outcomes),
+                mode=mode,
+                best_chain=best_chain,
+                chain_energies=chain_energies,
+                energy_traces=[outcome[1] for outcome in outcomes]
+            )
+
+        # Coldest replica first
+        temperatures = np.geomspace(schedule.min_temperature, schedule.initial_temperature,
+                                    chains).tolist()
+        rounds = max(1, math.ceil(_schedule_levels(schedule) / exchange_interval))
+        iterations = exchange_interval * schedule.iterations_per_temperature
+        exchange_rng = np.random.default_rng(streams[-1])
+
+        energies = [initial_energy] * chains
+        best_energies = [initial_energy] * chains
+        traces = [[initial_energy] for _ in range(chains)]
+        steps = accepted = swaps = 0
+
+        for round_index in range(rounds):
+            outcomes = _run_all(executor, _tempering_sweep, [
+                (shm.name, shape, slot, half_extent, temperatures[slot], iterations,
+                 schedule.step_size, best_energies[slot], draw_seed(streams[slot]),
+                 footprints, gap)
+                for slot in range(chains)
+            ])
+            for slot, (energy, best, slot_steps, slot_accepted) in enumerate(outcomes):
+                energies[slot] = energy
+                best_energies[slot] = best
+                traces[slot].append(energy)
+                steps += slot_steps
+                accepted += slot_accepted
+
+            # Alternate between even and odd neighbour pairs each round
+            for slot in range(round_index % 2, chains - 1, 2):
+                beta_gap = 1 / temperatures[slot] - 1 / temperatures[slot + 1]
+                log_ratio = beta_gap * (energies[slot] - energies[slot + 1])
+                if log_ratio >= 0 or exchange_rng.random() < math.exp(log_ratio):
+                    layouts[0, [slot, slot + 1]] = layouts[0, [slot + 1, slot]]
+                    energies[slot], energies[slot + 1] = energies[slot + 1], energies[slot]
+                    swaps += 1
+
+        finished = True
+        # Best energies were tracked under a frozen centre; rank them exactly
+        chain_energies = [layout_energy(layouts[1, slot], footprints=footprints, gap=gap)
+                          for slot in range(chains)]
+        best_chain = int(np.argmin(chain_energies))
+
+        return MultiChainResult(
+            positions=layouts[1, best_chain].copy(),
+            energy=chain_energies[best_chain],
+            initial_energy=initial_energy,
+            steps=steps,
+            accepted=accepted,
+            reheats=0,
+            mode=mode,
+            best_chain=best_chain,
+            chain_energies=chain_energies,
+            energy_traces=traces,
+            temperatures=temperatures,
+            swaps=swaps
+        )
+
+    finally:
+        if executor is not None:
+            if finished:
+                executor.shutdown()
+            else:
+                _terminate(executor)
+        del layouts
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,141 @@
+"""
+Phased Generation Module
+Phase-by-phase placement and local annealing, yielded as each phase completes
+"""
+
+import numpy as np
+from typing import Dict, Iterator, Optional, Sequence, Union
+from dataclasses import dataclass
+
+from annealing import AnnealingResult, AnnealingSchedule, LayoutAnnealer
+from heatmap import grid_extent
+from placement import DEFAULT_GAP, PlacementResult, place_buildings
+
+
+# Short, cool schedule for the per-phase pass: placement already gives a
+# collision-free layout, so annealing only has to settle it locally
+PHASE_SCHEDULE = AnnealingSchedule(
+    initial_temperature=5.0,
+    cooling_rate=0.85,
+    min_temperature=0.1,
+    iterations_per_temperature=200,
+    step_size=1.0,
+    stagnation_levels=5
+)
+
+
+@dataclass
+class AnnealingSnapshot:
+    """
+    Positions of one phase's placed buildings part-way through its
+    annealing pass; ``indices`` are their rows in the input
+    """
+    phase: int
+    indices: np.ndarray
+    level: int
+    temperature: float
+    energy: float
+    positions: np.ndarray
+
+
+@dataclass
+class PhaseResult:
+    """
+    One completed phase. ``indices`` are the phase's rows in the input and
+    ``positions`` their final x/z; unplaced buildings have NaN positions.
+    """
+    phase: int
+    indices: np.ndarray
+    positions: np.ndarray
+    placement: PlacementResult
+    annealing: Optional[AnnealingResult]
+
+    @property
+    def unplaced(self) -> np.ndarray:
+        """Input rows of the phase's buildings that found no free spot"""
+        return self.indices[self.placement.unplaced]
+
+
+def iter_phases(types: Sequence[str], footprints: np.ndarray, phases: Sequence[int],
+                grid_size: float, zoning: Optional[Dict[str, np.ndarray]] = None,
+                gap: float = DEFAULT_GAP, max_attempts: int = 30,
+                schedule: Optional[AnnealingSchedule] = PHASE_SCHEDULE,
+                seed: Optional[int] = None,
+                snapshot_every: int = 0) -> Iterator[Union[AnnealingSnapshot, PhaseResult]]:
+    """
+    Build a city phase by phase in ascending phase order, yielding each
+    ``PhaseResult`` as soon as the phase is done.
+
+    Every phase places its buildings around the earlier phases (see
+    ``place_buildings``), then anneals only the new buildings against the
+    fixed earlier ones with the footprint-aware energy. Annealing keeps
+    the placement's guarantees: footprints stay inside the extent and at
+    least ``gap`` apart. Passing ``schedule`` as None skips annealing.
+    With ``snapshot_every`` an ``AnnealingSnapshot`` is yielded every that
+    many temperature levels. Each phase draws from its own stream spawned
+    from ``seed``.
+    """
+    types = list(types)
+    footprints = np.abs(np.asarray(footprints, dtype=np.float64)).reshape(-1, 2)
+    phases = np.asarray(phases, dtype=np.int64).ravel()
+    if not len(types) == len(footprints) == len(phases):
+        raise ValueError("types, footprints and phases must have one entry per building")
+    if snapshot_every < 0:
+        raise ValueError("snapshot_every must be non-negative")
+
+    order = np.unique(phases)
+    streams = np.random.SeedSequence(seed).spawn(2 * len(order))
+    seeds = [int(stream.generate_state(1)[0]) for stream in streams]
+    extent = grid_extent(grid_size)
+
+    # Buildings of finished phases that made it onto the map
+    placed_positions = np.empty((0, 2))
+    placed_footprints = np.empty((0, 2))
+
+    for number, phase in enumerate(order.tolist()):
+        indices = np.flatnonzero(phases == phase)
+        placement = place_buildings(
+            [types[i] for i in indices.tolist()], footprints[indices],
+            extent=extent,
+            zoning=zoning,
+            gap=gap,
+            max_attempts=max_attempts,
+            seed=seeds[2 * number],
+            fixed_positions=placed_positions,
+            fixed_footprints=placed_footprints
+        )
+        positions = placement.positions.copy()
+        new = placement.placed
+
+        annealing = None
+        if schedule is not None and new.any():
+            layout = np.concatenate([placed_positions, positions[new]])
+            annealer = LayoutAnnealer(
+                layout, grid_size / 2,
+                seed=seeds[2 * number + 1],
+                footprints=np.concatenate([placed_footprints, footprints[indices][new]]),
+                gap=gap,
+                movable=np.arange(len(placed_positions), len(layout)),
+                strict=True
+            )
+            levels = annealer.iter_levels(schedule)
+            while True:
+                try:
+                    level = next(levels)
+                except StopIteration as stop:
+                    annealing = stop.value
+                    break
+                if snapshot_every and level.level % snapshot_every == 0:
+                    yield AnnealingSnapshot(
+                        phase=phase,
+                        indices=indices[new],
+                        level=level.level,
+                        temperature=level.temperature,
+                        energy=level.energy,
+                        positions=annealer.positions[len(placed_positions):].copy()
+                    )
+            positions[new] = annealing.positions[len(placed_positions):]
+
+        placed_positions = np.concatenate([placed_positions, positions[new]])
+        placed_footprints = np.concatenate([placed_footprints, footprints[indices][new]])
+        yield PhaseResult(phase, indices, positions, placement, annealing)
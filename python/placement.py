@@ -0,0 +1,271 @@
+"""
+Placement Module
+Footprint-aware bulk building placement with per-type zoning rasters
+"""
+
+import math
+import numpy as np
+from typing import Callable, Dict, Optional, Sequence, Union
+from dataclasses import dataclass
+
+from heatmap import DEFAULT_EXTENT, resolve_resolution
+
+
+# Clearance kept between neighbouring footprints, in world units
+DEFAULT_GAP = 1.0
+
+DEFAULT_ZONING_RESOLUTION = 64
+
+# Cells sharing (row % 2, col % 2) are more than one cell apart, so boxes
+# centred in distinct cells of one phase can never collide with each other
+_BOX_PHASES = ((0, 0), (0, 1), (1, 0), (1, 1))
+
+# Zoning weight as a function of the normalised distance from the centre
+# of the extent: 0 at the centre, 1 on the edges
+ZONING_PROFILES: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    'commercial': lambda d: (1 - d) ** 2,
+    'office': lambda d: 1 - d,
+    'residential': lambda d: np.clip(1 - np.abs(d - 0.6) / 0.6, 0.05, 1),
+    'infrastructure': lambda d: d ** 2,
+    'public': lambda d: np.ones_like(d)
+}
+
+
+def radial_zoning(resolution: Union[int, Sequence[int]] = DEFAULT_ZONING_RESOLUTION,
+                  profiles: Optional[Dict[str, Callable[[np.ndarray], np.ndarray]]] = None
+                  ) -> Dict[str, np.ndarray]:
+    """
+    Zoning rasters from radial profiles: commercial and office near the
+    centre, residential in a ring, infrastructure near the edges and public
+    buildings anywhere
+    """
+    rows, cols = resolve_resolution(resolution)
+    z = np.abs((np.arange(rows) + 0.5) / rows * 2 - 1)
+    x = np.abs((np.arange(cols) + 0.5) / cols * 2 - 1)
+    distance = np.maximum(z[:, None], x[None, :])
+    return {
+        building_type: np.broadcast_to(profile(distance), (rows, cols)).astype(np.float64)
+        for building_type, profile in (profiles or ZONING_PROFILES).items()
+    }
+
+
+@dataclass
+class PlacementResult:
+    """Outcome of a placement run"""
+    positions: np.ndarray
+    placed: np.ndarray
+    attempts: int
+    rejections: int
+
+    @property
+    def unplaced(self) -> np.ndarray:
+        """Indices of the buildings that found no free spot"""
+        return np.flatnonzero(~self.placed)
+
+
+class BoxGrid:
+    """
+    Broad-phase uniform grid over axis-aligned boxes.
+
+    Each box is stored in the cell holding its centre. Cells are at least as
+    wide as the largest box plus the gap, so every box that can collide with
+    a query box is centred in the 3x3 block of cells around the query's
+    centre. Cells have a fixed number of slots, doubled when one overflows,
+    which keeps every lookup a fixed-shape gather.
+    """
+
+    def __init__(self, extent: Sequence[float], cell_size: float, capacity: int, slots: int = 2):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.x_min, x_max, self.z_min, z_max = (float(v) for v in extent)
+        self.cell_size = float(cell_size)
+        self.cols = max(1, math.ceil((x_max - self.x_min) / self.cell_size))
+        self.rows = max(1, math.ceil((z_max - self.z_min) / self.cell_size))
+
+        # One cell of padding keeps 3x3 lookups in bounds
+        self._stride = self.cols + 2
+        self._slots = np.full(((self.rows + 2) * self._stride, slots), -1, dtype=np.int32)
+        self._fill = np.zeros(len(self._slots), dtype=np.int32)
+        self._offsets = np.array([dr * self._stride + dc for dr in (-1, 0, 1) for dc in (-1, 0, 1)])
+        # Centres and half extents, with a far-away sentinel at index -1
+        self.centres = np.full((capacity + 1, 2), np.inf)
+        self.halves = np.zeros((capacity + 1, 2))
+        self.count = 0
+
+    def cells(self, centres: np.ndarray) -> np.ndarray:
+        """Flat padded cell index of each centre"""
+        col = np.clip(np.floor((centres[:, 0] - self.x_min) / self.cell_size), 0, self.cols - 1)
+        row = np.clip(np.floor((centres[:, 1] - self.z_min) / self.cell_size), 0, self.rows - 1)
+        return ((row.astype(np.intp) + 1) * self._stride + col.astype(np.intp) + 1)
+
+    def collides(self, centres: np.ndarray, halves: np.ndarray, gap: float,
+                 cells: Optional[np.ndarray] = None) -> np.ndarray:
+        """Whether each box overlaps a stored box once both are grown by ``gap``"""
+        if cells is None:
+            cells = self.cells(centres)
+        neighbours = self._slots[cells[:, None] + self._offsets].reshape(len(cells), -1)
+        limits = self.halves[neighbours] + halves[:, None, :] + gap
+        overlap = np.abs(self.centres[neighbours] - centres[:, None, :]) < limits
+        return np.any(overlap[..., 0] & overlap[..., 1], axis=1)
+
+    def insert(self, centres: np.ndarray, halves: np.ndarray,
+               cells: Optional[np.ndarray] = None) -> np.ndarray:
+        """Store boxes, returning their indices"""
+        if cells is None:
+            cells = self.cells(centres)
+        index = np.arange(self.count, self.count + len(centres))
+        self.centres[index] = centres
+        self.halves[index] = halves
+        self.count += len(centres)
+
+        # Rank boxes sharing a cell so each gets its own slot
+        order = np.argsort(cells, kind='stable')
+        sorted_cells = cells[order]
+        first = np.r_[0, np.flatnonzero(np.diff(sorted_cells)) + 1]
+        rank = np.arange(len(order)) - np.repeat(first, np.diff(np.r_[first, len(order)]))
+        slot = np.empty(len(order), dtype=np.intp)
+        slot[order] = self._fill[sorted_cells] + rank
+
+        needed = int(slot.max()) + 1 if len(slot) else 0
+        if needed > self._slots.shape[1]:
+            grown = np.full((len(self._slots), max(needed, 2 * self._slots.shape[1])), -1, dtype=np.int32)
+            grown[:, :self._slots.shape[1]] = self._slots
+            self._slots = grown
+        self._slots[cells, slot] = index
+        np.add.at(self._fill, cells, 1)
+        return index
+
+
+def _zone_lookup(raster: np.ndarray, extent: Sequence[float], centres: np.ndarray) -> np.ndarray:
+    """Zoning weight of the raster cell under each centre"""
+    x_min, x_max, z_min, z_max = extent
+    rows, cols = raster.shape
+    col = np.clip(((centres[:, 0] - x_min) / (x_max - x_min) * cols).astype(np.intp), 0, cols - 1)
+    row = np.clip(((centres[:, 1] - z_min) / (z_max - z_min) * rows).astype(np.intp), 0, rows - 1)
+    return raster[row, col]
+
+
+def _check_raster(building_type: str, raster) -> np.ndarray:
+    raster = np.asarray(raster, dtype=np.float64)
+    if raster.ndim != 2 or not raster.size:
+        raise ValueError(f"zoning raster for {building_type} must be a non-empty 2D array")
+    if not np.all(np.isfinite(raster)) or np.any(raster < 0):
+        raise ValueError(f"zoning raster for {building_type} must be finite and non-negative")
+    return raster
+
+
+def place_buildings(types: Sequence[str], footprints: np.ndarray,
+                    extent: Sequence[float] = DEFAULT_EXTENT,
+                    zoning: Optional[Dict[str, np.ndarray]] = None,
+                    gap: float = DEFAULT_GAP, max_attempts: int = 30,
+                    seed: Optional[int] = None,
+                    fixed_positions: Optional[np.ndarray] = None,
+                    fixed_footprints: Optional[np.ndarray] = None) -> PlacementResult:
+    """
+    Place buildings with (n, 2) x/z ``footprints`` inside ``extent`` so that
+    no two footprints, grown by ``gap``, overlap.
+
+    Buildings are placed in bulk one type at a time, types with the largest
+    footprints first. Every round proposes one position for each remaining
+    building of the type, drawn from the type's ``zoning`` raster (cell
+    probability proportional to its weight, uniform within the cell; zero
+    weight forbids a cell). Types without a raster are placed uniformly.
+    Proposals are tested against the placed boxes through a ``BoxGrid`` and
+    committed one grid phase at a time, which resolves conflicts inside the
+    batch without pairwise checks. A building gives up after
+    ``max_attempts`` rejected proposals and is reported as unplaced.
+
+    ``fixed_positions`` and ``fixed_footprints`` are buildings already on
+    the map: new footprints keep ``gap`` clear of them but they never move.
+    """
+    if gap < 0:
+        raise ValueError("gap must be non-negative")
+    if max_attempts < 1:
+        raise ValueError("max_attempts must be at least 1")
+    x_min, x_max, z_min, z_max = extent = tuple(float(v) for v in extent)
+    if x_max <= x_min or z_max <= z_min:
+        raise ValueError("extent must be (x_min, x_max, z_min, z_max) with max > min")
+
+    types = list(types)
+    halves = np.abs(np.asarray(footprints, dtype=np.float64)).reshape(-1, 2) / 2
+    if len(halves) != len(types):
+        raise ValueError("footprints must have one row per building")
+    n = len(types)
+    rng = np.random.default_rng(seed)
+    zoning = {t: _check_raster(t, raster) for t, raster in (zoning or {}).items()}
+    fixed = np.empty((0, 2)) if fixed_positions is None else \
+        np.asarray(fixed_positions, dtype=np.float64).reshape(-1, 2)
+    fixed_halves = np.abs(np.asarray(
+        fixed_footprints if fixed_footprints is not None else np.empty((0, 2)),
+        dtype=np.float64)).reshape(-1, 2) / 2
+    if len(fixed) != len(fixed_halves):
+        raise ValueError("fixed_footprints must have one row per fixed position")
+
+    positions = np.full((n, 2), np.nan)
+    placed = np.zeros(n, dtype=bool)
+    attempts = rejections = 0
+    if n == 0:
+        return PlacementResult(positions, placed, attempts, rejections)
+
+    widest = 2 * float(np.concatenate([halves, fixed_halves]).max())
+    grid = BoxGrid(extent, widest + gap or 1.0, n + len(fixed))
+    if len(fixed):
+        grid.insert(fixed, fixed_halves)
+    fits = (halves[:, 0] * 2 <= x_max - x_min) & (halves[:, 1] * 2 <= z_max - z_min)
+    lo = np.array([x_min, z_min]) + halves
+    hi = np.array([x_max, z_max]) - halves
+
+    # Largest footprints first, by type and then within each type
+    areas = halves[:, 0] * halves[:, 1]
+    type_names = sorted(set(types), key=lambda t: -max(areas[i] for i in range(n) if types[i] == t))
+    type_array = np.array(types, dtype=object)
+
+    for building_type in type_names:
+        members = np.flatnonzero((type_array == building_type) & fits)
+        members = members[np.argsort(-areas[members], kind='stable')]
+        raster = zoning.get(building_type)
+        if raster is None:
+            raster = np.ones((1, 1))
+        cdf = np.cumsum(raster.ravel())
+        if cdf[-1] <= 0:
+            continue
+        rows, cols = raster.shape
+        cell = np.array([(x_max - x_min) / cols, (z_max - z_min) / rows])
+
+        active = members
+        failures = np.zeros(len(active), dtype=np.int32)
+        while len(active):
+            m = len(active)
+            attempts += m
+            zone = np.minimum(np.searchsorted(cdf, rng.random(m) * cdf[-1], side='right'), cdf.size - 1)
+            row, col = np.divmod(zone, cols)
+            centres = np.array([x_min, z_min]) + (np.column_stack((col, row)) + rng.random((m, 2))) * cell
+            centres = np.clip(centres, lo[active], hi[active])
+
+            allowed = _zone_lookup(raster, extent, centres) > 0
+            cells = grid.cells(centres)
+            rows_of, cols_of = np.divmod(cells, grid._stride)
+            accepted = np.zeros(m, dtype=bool)
+
+            for py, px in _BOX_PHASES:
+                phase = np.flatnonzero(allowed & (rows_of % 2 == py) & (cols_of % 2 == px))
+                if not len(phase):
+                    continue
+                # One proposal per cell; the proposal order is already random
+                _, first = np.unique(cells[phase], return_index=True)
+                phase = phase[np.sort(first)]
+                free = ~grid.collides(centres[phase], halves[active[phase]], gap, cells[phase])
+                phase = phase[free]
+                if len(phase):
+                    grid.insert(centres[phase], halves[active[phase]], cells[phase])
+                    accepted[phase] = True
+
+            positions[active[accepted]] = centres[accepted]
+            placed[active[accepted]] = True
+            rejections += m - int(accepted.sum())
+
+            failures = np.where(accepted, 0, failures + 1)
+            keep = ~accepted & (failures < max_attempts)
+            active, failures = active[keep], failures[keep]
+
+    return PlacementResult(positions, placed, attempts, rejections)
@@ -0,0 +1,251 @@
+"""
+Poisson Disk Sampling Module
+Grid-accelerated Bridson sampler for even building placement
+"""
+
+import numpy as np
+from typing import Optional, Tuple
+from dataclasses import dataclass
+
+
+# Neighbour cells that can hold a conflicting sample. With a cell size of
+# r/sqrt(2) conflicts can only come from the 5x5 block around a cell; its four
+# corners are at least r away and are skipped.
+_NEIGHBOUR_OFFSETS = np.array([
+    (dy, dx)
+    for dy in range(-2, 3)
+    for dx in range(-2, 3)
+    if abs(dy) != 2 or abs(dx) != 2
+], dtype=np.intp)
+
+# Cells sharing (row % 3, col % 3) are two cells (sqrt(2) * r) apart, so
+# candidates inside distinct cells of one phase never conflict with each other.
+_PHASES = [(py, px) for py in range(3) for px in range(3)]
+
+# Darts are thrown uniformly while at least this fraction of a batch lands;
+# below it the sampler switches to Bridson annulus growth.
+_DART_ACCEPTANCE_THRESHOLD = 0.5
+
+
+@dataclass
+class SamplingResult:
+    """Outcome of a Poisson disk sampling run"""
+    positions: np.ndarray
+    saturated: bool
+    attempts: int
+    rejections: int
+
+
+class PoissonDiskSampler:
+    """
+    Bridson-style Poisson disk sampler backed by a background acceleration grid.
+
+    Each grid cell is r/sqrt(2) wide and holds at most one sample, so checking a
+    candidate against the existing set costs a fixed 21-cell lookup. Candidates
+    are processed in vectorised batches: every active sample proposes a point in
+    its [r, 2r] annulus per round, and intra-batch conflicts are resolved by
+    committing the batch one grid phase at a time.
+
+    ``fixed`` points, already placed outside the domain and at least
+    ``min_distance`` apart, constrain the samples without being returned.
+    Only those within ``min_distance`` of the domain matter; they occupy the
+    grid's padding cells, which keeps the minimum distance across the seams
+    between adjacent domains.
+    """
+
+    def __init__(self, width: float, height: float, min_distance: float = 4.0,
+                 max_attempts: int = 30, seed: Optional[int] = None,
+                 origin: Tuple[float, float] = (0.0, 0.0),
+                 fixed: Optional[np.ndarray] = None):
+        if width <= 0 or height <= 0:
+            raise ValueError("width and height must be positive")
+        if min_distance <= 0:
+            raise ValueError("min_distance must be positive")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+        self.width = float(width)
+        self.height = float(height)
+        self.min_distance = float(min_distance)
+        self.max_attempts = int(max_attempts)
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.rng = np.random.default_rng(seed)
+
+        self.cell_size = self.min_distance / np.sqrt(2)
+        self.cols = int(np.ceil(self.width / self.cell_size))
+        self.rows = int(np.ceil(self.height / self.cell_size))
+
+        # Two cells of padding on each side keep neighbour lookups in bounds;
+        # the grid is addressed through its flat view to keep gathers 1-D
+        self._grid = np.full((self.rows + 4, self.cols + 4), -1, dtype=np.int32)
+        self._flat_grid = self._grid.ravel()
+        self._stride = self.cols + 4
+        self._offsets = _NEIGHBOUR_OFFSETS[:, 0] * self._stride + _NEIGHBOUR_OFFSETS[:, 1]
+        fixed = self._nearby(fixed)
+        # x and y rows with one slot per fixed point and per cell plus a
+        # far-away sentinel at index -1; samples start after the fixed points
+        self._points = np.full((2, len(fixed) + self.rows * self.cols + 1), np.inf)
+        self._base = self._count = len(fixed)
+        self._points[:, :self._base] = fixed.T
+        cells = np.floor(fixed / self.cell_size).astype(np.intp)
+        self._flat_grid[(cells[:, 1] + 2) * self._stride + cells[:, 0] + 2] = np.arange(self._base)
+        self.attempts = 0
+        self.rejections = 0
+
+    def _nearby(self, fixed: Optional[np.ndarray]) -> np.ndarray:
+        """Fixed points within ``min_distance`` of the domain, in local coordinates"""
+        if fixed is None:
+            return np.empty((0, 2))
+        local = np.asarray(fixed, dtype=np.float64).reshape(-1, 2) - self.origin
+        r = self.min_distance
+        near = (
+            (local[:, 0] >= -r) & (local[:, 0] < self.width + r) &
+            (local[:, 1] >= -r) & (local[:, 1] < self.height + r)
+        )
+        return local[near]
+
+    @property
+    def capacity(self) -> int:
+        """Upper bound on the number of samples the domain can hold"""
+        return self.rows * self.cols
+
+    def sample(self, count: int) -> SamplingResult:
+        """
+        Place up to ``count`` samples.
+
+        Always terminates: every active sample is retired after ``max_attempts``
+        consecutive failed proposals and each cell can be filled only once. When
+        the domain saturates before ``count`` is reached the maximal achievable
+        set is returned with ``saturated=True``.
+        """
+        count = max(0, int(count))
+        # Slot counts include the fixed points
+        target = self._base + count
+
+        self._throw_darts(target)
+        if self._count < target:
+            self._grow(target)
+
+        # Work in local coordinates, report relative to the domain origin
+        positions = self._points[:, self._base:self._count].T.copy()
+        positions[:, 0] += self.origin[0]
+        positions[:, 1] += self.origin[1]
+
+        return SamplingResult(
+            positions=positions,
+            saturated=self._count < target,
+            attempts=self.attempts,
+            rejections=self.rejections
+        )
+
+    def _throw_darts(self, count: int):
+        """Uniform dart throwing while the domain is sparse enough to accept most darts"""
+        while self._count < count:
+            # Never throw more darts than there are free cells left to fill
+            batch = min(count - self._count, self.capacity - (self._count - self._base))
+            if batch <= 0:
+                break
+            darts = self.rng.uniform((0.0, 0.0), (self.width, self.height), size=(batch, 2))
+            accepted = self._commit(darts, count)
+            if accepted.sum() < batch * _DART_ACCEPTANCE_THRESHOLD:
+                break
+
+    def _grow(self, count: int):
+        """Bridson growth from every existing sample and fixed point in parallel rounds"""
+        if self._count == 0:
+            seed_point = self.rng.uniform((0.0, 0.0), (self.width, self.height), size=(1, 2))
+            self._commit(seed_point, count)
+
+        active = np.arange(self._count)
+        failures = np.zeros(len(active), dtype=np.int32)
+        r = self.min_distance
+
+        while len(active) and self._count < count:
+            n = len(active)
+            radius = np.sqrt(self.rng.uniform(r * r, 4 * r * r, size=n))
+            angle = self.rng.uniform(0.0, 2 * np.pi, size=n)
+            candidates = self._points[:, active].T + np.column_stack(
+                (radius * np.cos(angle), radius * np.sin(angle))
+            )
+
+            first_new = self._count
+            accepted = self._commit(candidates, count)
+
+            # Successful proposers stay active and their fresh samples join them
+            failures = np.where(accepted, 0, failures + 1)
+            keep = failures < self.max_attempts
+            new = np.arange(first_new, self._count)
+            active = np.concatenate((active[keep], new))
+            failures = np.concatenate((failures[keep], np.zeros(len(new), dtype=np.int32)))
+
+    def _commit(self, candidates: np.ndarray, count: int) -> np.ndarray:
+        """Insert conflict-free candidates into the grid, returning an acceptance mask"""
+        self.attempts += len(candidates)
+        accepted = np.zeros(len(candidates), dtype=bool)
+
+        inside = (
+            (candidates[:, 0] >= 0) & (candidates[:, 0] < self.width) &
+            (candidates[:, 1] >= 0) & (candidates[:, 1] < self.height)
+        )
+        index = np.flatnonzero(inside)
+        cells = (candidates[index] / self.cell_size).astype(np.intp)
+        cols = np.minimum(cells[:, 0], self.cols - 1)
+        rows = np.minimum(cells[:, 1], self.rows - 1)
+        slots = (rows + 2) * self._stride + cols + 2
+
+        # Candidates landing in an occupied cell are rejected without a distance test
+        free = self._flat_grid[slots] < 0
+        index, rows, cols, slots = index[free], rows[free], cols[free], slots[free]
+
+        for py, px in _PHASES:
+            if self._count >= count:
+                break
+
+            phase = np.flatnonzero((rows % 3 == py) & (cols % 3 == px))
+            if not len(phase):
+                continue
+
+            # One candidate per cell; order is already random
+            _, first = np.unique(slots[phase], return_index=True)
+            phase = phase[np.sort(first)]
+
+            ok = self._fits(candidates[index[phase]], slots[phase])
+            phase = phase[ok][:count - self._count]
+            if not len(phase):
+                continue
+
+            start = self._count
+            self._count += len(phase)
+            self._points[:, start:self._count] = candidates[index[phase]].T
+            self._flat_grid[slots[phase]] = np.arange(start, self._count)
+            accepted[index[phase]] = True
+
+        self.rejections += len(candidates) - int(accepted.sum())
+        return accepted
+
+    def _fits(self, points: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        """Vectorised minimum-distance test against the samples already in the grid"""
+        neighbours = self._flat_grid[slots[:, None] + self._offsets]
+        dx = self._points[0][neighbours] - points[:, 0:1]
+        dy = self._points[1][neighbours] - points[:, 1:2]
+        dx *= dx
+        dy *= dy
+        dx += dy
+        return np.all(dx >= self.min_distance ** 2, axis=1)
+
+
+def poisson_disk_sample(width: float, height: float, count: int,
+                        min_distance: float = 4.0, max_attempts: int = 30,
+                        seed: Optional[int] = None,
+                        origin: Tuple[float, float] = (0.0, 0.0),
+                        fixed: Optional[np.ndarray] = None) -> SamplingResult:
+    """Convenience wrapper sampling ``count`` points in a single call"""
+    sampler = PoissonDiskSampler(
+        width, height,
+        min_distance=min_distance,
+        max_attempts=max_attempts,
+        seed=seed,
+        origin=origin,
+        fixed=fixed
+    )
+    return sampler.sample(count)
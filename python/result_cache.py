@@ -0,0 +1,315 @@
+"""
+Result Cache Module
+Content-addressed caching of analytics and heatmap results
+"""
+
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+import numpy as np
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from city_analytics import SCORING_VERSION, BuildingColumns
+
+
+DEFAULT_MAX_BYTES = 64 << 20
+
+
+def city_fingerprint(columns: BuildingColumns) -> str:
+    """
+    Canonical, order-insensitive hash of the columns analytics read.
+
+    Buildings are sorted by (type, size, ground position) before hashing and
+    types are hashed by name, so permuting the building list or its type
+    table yields the same fingerprint.
+    """
+    used = np.unique(columns.type_codes)
+    names = sorted(columns.type_names[code] for code in used.tolist())
+    rank = np.zeros(max(len(columns.type_names), 1), dtype=np.int64)
+    for code in used.tolist():
+        rank[code] = names.index(columns.type_names[code])
+    types = rank[columns.type_codes]
+
+    # Adding 0.0 folds -0.0 into 0.0
+    positions = np.asarray(columns.positions, dtype=np.float64) + 0.0
+    sizes = np.asarray(columns.sizes, dtype=np.float64) + 0.0
+    order = np.lexsort((positions[:, 1], positions[:, 0],
+                        sizes[:, 2], sizes[:, 1], sizes[:, 0], types))
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps(names).encode('utf-8'))
+    for array in (types[order], sizes[order], positions[order]):
+        digest.update(np.ascontiguousarray(array).astype(array.dtype.newbyteorder('<')).tobytes())
+    return digest.hexdigest()
+
+
+def cache_key(kind: str, columns: BuildingColumns, params: Optional[Dict] = None) -> str:
+    """
+    Key for one result: the endpoint kind, the city fingerprint and its
+    parameters, salted with ``SCORING_VERSION`` so persistent caches drop
+    results computed under an older scoring definition
+    """
+    payload = json.dumps({
+        'version': SCORING_VERSION,
+        'kind': kind,
+        'city': city_fingerprint(columns),
+        'params': params or {}
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache(ABC):
+    """
+    Base class for cache backends.
+
+    Values are pickled on ``set`` and unpickled on ``get``, so callers can
+    mutate what they get back and entry sizes are exact byte counts.
+    Backends implement ``_load``, ``_store``, ``_usage`` and ``clear``; a
+    backend missing any of them cannot be instantiated.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._counter_lock = threading.Lock()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._counter_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def get(self, key: str) -> Optional[Any]:
+        blob = self._load(key)
+        if blob is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return pickle.loads(blob)
+
+    def set(self, key: str, value: Any):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) <= self.max_bytes:
+            self._store(key, blob)
+
+    def stats(self) -> Dict:
+        entries, used = self._usage()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'entries': entries,
+            'bytes': used,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl
+        }
+
+    @abstractmethod
+    def _load(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def _store(self, key: str, blob: bytes):
+        ...
+
+    @abstractmethod
+    def _usage(self) -> Tuple[int, int]:
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+
+class MemoryCache(ResultCache):
+    """In-process LRU cache bounded by the total size of its pickled values"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: Optional[float] = None):
+        super().__init__(max_bytes, ttl)
+        # key -> (blob, expiry on the monotonic clock or None)
+        self._entries: 'OrderedDict[str, Tuple[bytes, Optional[float]]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _load(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            blob, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                self._discard(key)
+                self._count('expirations')
+                return None
+            self._entries.move_to_end(key)
+            return blob
+
+    def _store(self, key: str, blob: bytes):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (blob, expires)
+            self._bytes += len(blob)
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self._count('evictions')
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def _usage(self) -> Tuple[int, int]:
+        with self._lock:
+            return len(self._entries), self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class SQLiteCache(ResultCache):
+    """
+    On-disk LRU cache in a SQLite database.
+
+    Several worker processes can point at the same file and share entries;
+    the database runs in WAL mode so readers never block on a writer. Hit
+    and miss counters are per process, entry and byte totals are shared.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES * 4,
+                 ttl: Optional[float] = None):
+        super().__init__(max_bytes, ttl)
+        self.path = path
+        self._local = threading.local()
+
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+            'expires REAL, accessed REAL NOT NULL)'
+        )
+        db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+    def _db(self) -> sqlite3.Connection:
+        """One autocommit connection per thread"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _load(self, key: str) -> Optional[bytes]:
+        db = self._db()
+        row = db.execute('SELECT value, expires FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        blob, expires = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            db.execute('DELETE FROM results WHERE key = ?', (key,))
+            self._count('expirations')
+            return None
+        db.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+        return blob
+
+    def _store(self, key: str, blob: bytes):
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else None
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                       (key, sqlite3.Binary(blob), len(blob), expires, now))
+            expired = db.execute('DELETE FROM results WHERE expires IS NOT NULL AND expires <= ?',
+                                 (now,)).rowcount
+            used = db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+            evicted = []
+            if used > self.max_bytes:
+                for old_key, size in db.execute('SELECT key, size FROM results ORDER BY accessed'):
+                    evicted.append((old_key,))
+                    used -= size
+                    if used <= self.max_bytes:
+                        break
+                db.executemany('DELETE FROM results WHERE key = ?', evicted)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+        self._count('expirations', expired)
+        self._count('evictions', len(evicted))
+
+    def _usage(self) -> Tuple[int, int]:
+        entries, used = self._db().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        return entries, used
+
+    def clear(self):
+        self._db().execute('DELETE FROM results')
+
+
+class TieredCache(ResultCache):
+    """In-process cache in front of a shared on-disk tier"""
+
+    def __init__(self, memory: MemoryCache, disk: SQLiteCache):
+        super().__init__(memory.max_bytes + disk.max_bytes, memory.ttl)
+        self.memory = memory
+        self.disk = disk
+
+    def _load(self, key: str) -> Optional[bytes]:
+        blob = self.memory._load(key)
+        if blob is not None:
+            self.memory._count('hits')
+            return blob
+        self.memory._count('misses')
+
+        blob = self.disk._load(key)
+        self.disk._count('misses' if blob is None else 'hits')
+        if blob is not None and len(blob) <= self.memory.max_bytes:
+            self.memory._store(key, blob)
+        return blob
+
+    def _store(self, key: str, blob: bytes):
+        if len(blob) <= self.memory.max_bytes:
+            self.memory._store(key, blob)
+        self.disk._store(key, blob)
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats['tiers'] = {
+            'memory': self.memory.stats(),
+            'disk': self.disk.stats()
+        }
+        return stats
+
+    def _usage(self) -> Tuple[int, int]:
+        return self.disk._usage()
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.clear()
+
+
+def create_cache(max_bytes: int = DEFAULT_MAX_BYTES, ttl: Optional[float] = None,
+                 path: Optional[str] = None,
+                 disk_max_bytes: Optional[int] = None) -> ResultCache:
+    """In-process cache, backed by a shared SQLite tier when ``path`` is given"""
+    memory = MemoryCache(max_bytes, ttl)
+    if path is None:
+        return memory
+    return TieredCache(memory, SQLiteCache(path, disk_max_bytes or max_bytes * 4, ttl))
@@ -0,0 +1,425 @@
+"""
+Score Optimizer Module
+Time-budgeted layout optimisation against the shipped analytics scores
+"""
+
+import math
+import time
+import numpy as np
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+
+from city_analytics import (
+    SCORE_WEIGHTS, BuildingColumns, density_score, distribution_score, diversity_score,
+    efficiency_score, mean_pairwise_distance, performance_report, quadrant_index,
+    sustainability_score
+)
+from heatmap import DEFAULT_EXTENT
+
+# Sub-scores that depend on where buildings stand; density, diversity and
+# sustainability only see sizes and types, so moves cannot change them
+POSITIONAL_SCORES = ('efficiency', 'distribution')
+
+# Metropolis steps drawn per batch; the clock is checked between batches
+_BATCH_STEPS = 256
+
+# Distances a batch may evaluate, so large cities check the clock as often
+_BATCH_ENTRIES = 1 << 18
+
+# Surrogate drift, in score points, beyond which a checkpoint re-synchronises it
+_SYNC_TOLERANCE = 1e-6
+
+
+def resolve_weights(weights: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    Objective weights normalised to sum to one: ``SCORE_WEIGHTS`` by default,
+    else a mapping from score names (``efficiency``, ``density``, ...) to
+    non-negative weights, where missing scores weigh nothing
+    """
+    if weights is None:
+        return dict(SCORE_WEIGHTS)
+    if not isinstance(weights, Mapping):
+        raise ValueError("weights must be an object mapping score names to weights")
+    unknown = set(weights) - set(SCORE_WEIGHTS)
+    if unknown:
+        raise ValueError(f"unknown scores in weights: {', '.join(sorted(unknown))}")
+    try:
+        resolved = {key: float(weights.get(key, 0.0)) for key in SCORE_WEIGHTS}
+    except (TypeError, ValueError):
+        raise ValueError("weights must be numbers")
+    total = sum(resolved.values())
+    if not all(0 <= w < math.inf for w in resolved.values()) or not 0 < total < math.inf:
+        raise ValueError("weights must be non-negative with a positive sum")
+    return {key: w / total for key, w in resolved.items()}
+
+
+def _scores(performance: Dict) -> Dict[str, float]:
+    """The numeric scores of an ``analyze_city_performance`` report"""
+    return {key: float(value) for key, value in performance.items() if key.endswith('_score')}
+
+
+def _objective(scores: Dict[str, float], weights: Dict[str, float]) -> float:
+    return sum(scores[f'{key}_score'] * weight for key, weight in weights.items())
+
+
+@dataclass
+class ScoreCheckpoint:
+    """Surrogate scores next to the exact scorer's at one point of a run"""
+    elapsed: float
+    steps: int
+    surrogate: Dict[str, float]
+    exact: Dict[str, float]
+
+    @property
+    def drift(self) -> float:
+        """Largest absolute gap between a surrogate score and the exact one"""
+        return max((abs(self.surrogate[key] - self.exact[key]) for key in self.surrogate),
+                   default=0.0)
+
+
+@dataclass
+class ScoreOptimizationResult:
+    """Outcome of ``optimize_scores``; scores are exact ``analyze_city_performance`` values"""
+    positions: np.ndarray
+    weights: Dict[str, float]
+    initial_scores: Dict[str, float]
+    scores: Dict[str, float]
+    initial_objective: float
+    objective: float
+    steps: int
+    accepted: int
+    elapsed: float
+    checkpoints: List[ScoreCheckpoint] = field(default_factory=list)
+
+    @property
+    def improvements(self) -> Dict[str, float]:
+        """Change of every score from the initial layout to the returned one"""
+        return {key: self.scores[key] - self.initial_scores[key] for key in self.scores}
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.steps if self.steps else 0.0
+
+
+class ScoreSurrogate:
+    """
+    Incremental mirror of the position-dependent scores.
+
+    Keeps the sum of pairwise distances behind ``efficiency_score`` and the
+    per-quadrant building counts behind ``distribution_score``, starting from
+    ``distance_sum`` when the caller already measured it. Moving one building
+    patches the distance sum with one vectorised O(n) pass over the other
+    buildings and the quadrant counts in O(1), so a move is scored without
+    the O(n^2) exact scorer. Float error accumulates slowly in the distance
+    sum; ``sync`` resets both to exact values.
+
+    Both scores are kept unclamped as well (``raw_efficiency`` and
+    ``raw_distribution``): the shipped scores floor at zero, which leaves the
+    search no gradient on a city crammed into one quadrant.
+    """
+
+    def __init__(self, positions: np.ndarray, extent: Sequence[float],
+                 distance_sum: Optional[float] = None):
+        self.positions = positions
+        self.extent = extent
+        x_min, x_max, z_min, z_max = extent
+        self.center = ((x_min + x_max) / 2, (z_min + z_max) / 2)
+        n = len(positions)
+        self.pairs = n * (n - 1) / 2
+        self.sync(distance_sum)
+
+    def sync(self, distance_sum: Optional[float] = None):
+        """
+        Reset the distance sum, to ``distance_sum`` when given (an exact value
+        measured elsewhere) else recomputed from scratch, and the quadrant counts
+        """
+        if distance_sum is None:
+            distance_sum = mean_pairwise_distance(self.positions) * self.pairs
+        self.distance_sum = distance_sum
+        self.quadrants = np.bincount(quadrant_index(self.positions, self.extent), minlength=4)
+        self.raw_efficiency = self.efficiency_for(self.distance_sum)
+        self.raw_distribution = self.distribution_for(self.quadrants)
+
+    def efficiency_for(self, distance_sum: float) -> float:
+        """Unclamped ``efficiency_score`` for a pairwise distance sum"""
+        if not len(self.positions):
+            return 0.0
+        avg_distance = distance_sum / self.pairs if self.pairs else 0.0
+        return 100 - abs(avg_distance - 10.0) * 5
+
+    @staticmethod
+    def distribution_for(quadrants: np.ndarray) -> float:
+        """Unclamped ``distribution_score`` for quadrant counts"""
+        total = int(quadrants.sum())
+        if total < 4:
+            return 0.0
+        return 100 - float(np.std(quadrants)) / (total / 4) * 100
+
+    @property
+    def efficiency(self) -> float:
+        return min(max(self.raw_efficiency, 0.0), 100.0)
+
+    @property
+    def distribution(self) -> float:
+        return max(self.raw_distribution, 0.0)
+
+    def quadrant(self, x: float, z: float) -> int:
+        """Scalar ``quadrant_index``"""
+        cx, cz = self.center
+        if z >= cz:
+            return 1 if x < cx else 0
+        return 2 if x < cx else 3
+
+    def distance_delta(self, index: int, x: float, z: float) -> float:
+        """Change of the pairwise distance sum if building ``index`` moved to (x, z)"""
+        positions = self.positions
+        old_x, old_z = positions[index]
+        xs, zs = positions[:, 0], positions[:, 1]
+        # The new position's distance to the old one stands in for the self pair
+        after = np.hypot(xs - x, zs - z).sum() - math.hypot(old_x - x, old_z - z)
+        before = np.hypot(xs - old_x, zs - old_z).sum()
+        return float(after - before)
+
+    def scores_for(self, distance_sum: float, quadrants: np.ndarray) -> Dict[str, float]:
+        """Clamped positional scores for a distance sum and quadrant counts"""
+        return {
+            'efficiency_score': min(max(self.efficiency_for(distance_sum), 0.0), 100.0),
+            'distribution_score': max(self.distribution_for(quadrants), 0.0)
+        }
+
+    def scores(self) -> Dict[str, float]:
+        return {'efficiency_score': self.efficiency, 'distribution_score': self.distribution}
+
+
+def _overlaps(positions: np.ndarray, halves: np.ndarray, gap: float,
+              index: int, x: float, z: float) -> bool:
+    """Whether building ``index`` at (x, z), grown by ``gap``, overlaps any other footprint"""
+    hx, hz = halves[index]
+    hit = ((np.abs(positions[:, 0] - x) < halves[:, 0] + hx + gap) &
+           (np.abs(positions[:, 1] - z) < halves[:, 1] + hz + gap))
+    hit[index] = False
+    return bool(hit.any())
+
+
+def optimize_scores(columns: BuildingColumns,
+                    extent: Sequence[float] = DEFAULT_EXTENT,
+                    weights: Optional[Dict[str, float]] = None,
+                    time_budget: Optional[float] = 1.0,
+                    max_steps: Optional[int] = None,
+                    step_size: float = 2.0,
+                    initial_temperature: float = 2.0,
+                    min_temperature: float = 0.01,
+                    checkpoints: int = 4,
+                    seed: Optional[int] = None,
+                    footprints: Optional[np.ndarray] = None,
+                    gap: float = 0.0) -> ScoreOptimizationResult:
+    """
+    Move buildings to maximise the weighted analytics score within
+    ``time_budget`` seconds (and/or ``max_steps`` Metropolis steps).
+
+    The objective is ``overall_score`` under ``weights`` (see
+    ``resolve_weights``). Only efficiency and distribution depend on
+    positions; they are tracked by a ``ScoreSurrogate`` while density,
+    diversity and sustainability enter as constants. The temperature, in
+    score points, cools geometrically from ``initial_temperature`` to
+    ``min_temperature`` over the budget; the search follows the unclamped
+    sub-scores while the best layout is judged on the shipped ones.
+
+    Exact scoring, the O(n^2) pass behind ``analyze_city_performance``, runs
+    once on the input and once per checkpoint. The surrogate starts from the
+    input's exact distance sum. ``checkpoints`` checkpoints are spread over
+    the run, each recording the surrogate against the exact scores and
+    re-synchronising it if it drifted; the last one scores the returned
+    layout, so there is always at least one. Under a time budget the
+    checkpoints are reserved from it, at the cost the input's exact pass
+    took, and dropped when the budget cannot hold them. A budget shorter
+    than two exact passes therefore returns the input unsearched, with the
+    input's scoring as its only checkpoint, and one whose input pass alone
+    overruns the budget raises ValueError as soon as it does.
+
+    Moves are clipped to ``extent``. With ``footprints`` ((n, 2) x/z sizes) a
+    move is rejected if the footprint, grown by ``gap``, would overlap another.
+    The best layout seen is returned, and never one scoring below the input.
+    Runs are reproducible under ``seed`` only when bounded by ``max_steps``
+    alone.
+    """
+    if time_budget is None and max_steps is None:
+        raise ValueError("time_budget or max_steps is required")
+    if time_budget is not None and time_budget <= 0:
+        raise ValueError("time_budget must be positive")
+    if not 0 < min_temperature <= initial_temperature:
+        raise ValueError("temperatures must satisfy 0 < min_temperature <= initial_temperature")
+    if checkpoints < 1:
+        raise ValueError("checkpoints must be at least 1")
+
+    weights = resolve_weights(weights)
+    extent = tuple(float(v) for v in extent)
+    x_min, x_max, z_min, z_max = extent
+    positions = np.array(columns.positions, dtype=np.float64).reshape(-1, 2)
+    n = len(positions)
+    pairs = n * (n - 1) / 2
+
+    halves = None
+    if footprints is not None:
+        halves = np.abs(np.asarray(footprints, dtype=np.float64)).reshape(-1, 2) / 2
+        if len(halves) != n:
+            raise ValueError("footprints must have one row per building")
+
+    # Scores a move cannot change, computed once
+    density = density_score(float(np.dot(columns.sizes[:, 0], columns.sizes[:, 2])), extent) if n else 0.0
+    diversity = diversity_score(columns.type_counts()) if n else 0.0
+    sustainability = sustainability_score(columns.count('infrastructure'),
+                                          columns.count('public'), n) if n else 0.0
+
+    def exact(layout: np.ndarray, deadline: Optional[float] = None) -> Tuple[Dict[str, float], float]:
+        """``analyze_city_performance`` scores of a layout and its pairwise distance sum"""
+        distance_sum = mean_pairwise_distance(layout, deadline) * pairs
+        scores = _scores(performance_report(
+            efficiency=efficiency_score(distance_sum / pairs if pairs else 0.0) if n else 0.0,
+            density=density,
+            distribution=distribution_score(np.bincount(quadrant_index(layout, extent), minlength=4)),
+            diversity=diversity,
+            sustainability=sustainability
+        ))
+        return scores, distance_sum
+
+    # The exact pass imports pdist lazily; a one-off import must not be
+    # mistaken for the per-pass cost reserved below
+    from scipy.spatial.distance import pdist  # noqa: F401
+
+    start = time.perf_counter()
+    try:
+        initial_scores, initial_distance_sum = exact(
+            positions, start + time_budget if time_budget is not None else None)
+    except TimeoutError:
+        raise ValueError(f"time_budget is too short to score {n} buildings exactly")
+    exact_cost = time.perf_counter() - start
+    initial_objective = _objective(initial_scores, weights)
+
+    surrogate = ScoreSurrogate(positions, extent, distance_sum=initial_distance_sum)
+    constant = sum(initial_scores[f'{key}_score'] * weight
+                   for key, weight in weights.items() if key not in POSITIONAL_SCORES)
+    w_efficiency, w_distribution = weights['efficiency'], weights['distribution']
+
+    def objectives(efficiency: float, distribution: float):
+        """The search objective over raw scores and the true one over clamped scores"""
+        shaped = constant + w_efficiency * efficiency + w_distribution * distribution
+        true = (constant + w_efficiency * min(max(efficiency, 0.0), 100.0) +
+                w_distribution * max(distribution, 0.0))
+        return shaped, true
+
+    current, best_objective = objectives(surrogate.raw_efficiency, surrogate.raw_distribution)
+    best_positions = positions.copy()
+    best_distance_sum, best_quadrants = surrogate.distance_sum, surrogate.quadrants
+    improved = False
+    rng = np.random.default_rng(seed)
+    log_cooling = math.log(min_temperature / initial_temperature)
+    history: List[ScoreCheckpoint] = []
+    steps = accepted = 0
+
+    # Each checkpoint costs one exact pass; keep only those the budget holds
+    search_time = None
+    if time_budget is not None:
+        remaining = time_budget - exact_cost
+        if exact_cost > 0:
+            checkpoints = min(checkpoints, max(int(remaining // exact_cost), 0))
+        search_time = remaining - checkpoints * exact_cost
+
+    def progress() -> float:
+        fractions = []
+        if search_time is not None:
+            elapsed = time.perf_counter() - start - exact_cost
+            fractions.append(elapsed / search_time if search_time > 0 else 1.0)
+        if max_steps is not None:
+            fractions.append(steps / max_steps if max_steps > 0 else 1.0)
+        return max(fractions)
+
+    def checkpoint(surrogate_scores: Dict[str, float], exact_scores: Dict[str, float]):
+        history.append(ScoreCheckpoint(
+            elapsed=time.perf_counter() - start,
+            steps=steps,
+            surrogate=surrogate_scores,
+            exact={key: exact_scores[key] for key in surrogate_scores}
+        ))
+
+    batch_steps = max(1, min(_BATCH_STEPS, _BATCH_ENTRIES // max(n, 1)))
+    searchable = n > 0 and checkpoints > 0 and (w_efficiency > 0 or w_distribution > 0)
+    done = progress() if searchable else 1.0
+
+    while done < 1.0:
+        temperature = initial_temperature * math.exp(log_cooling * done)
+        batch = batch_steps if max_steps is None else min(batch_steps, max_steps - steps)
+        indices = rng.integers(0, n, size=batch).tolist()
+        moves = rng.normal(0.0, step_size, size=(batch, 2)).tolist()
+        thresholds = rng.random(batch).tolist()
+
+        for index, (dx, dz), threshold in zip(indices, moves, thresholds):
+            old_x, old_z = positions[index].tolist()
+            x = min(max(old_x + dx, x_min), x_max)
+            z = min(max(old_z + dz, z_min), z_max)
+            steps += 1
+            if halves is not None and _overlaps(positions, halves, gap, index, x, z):
+                continue
+
+            distance_sum = surrogate.distance_sum + surrogate.distance_delta(index, x, z)
+            efficiency = surrogate.efficiency_for(distance_sum)
+            old_quadrant, new_quadrant = surrogate.quadrant(old_x, old_z), surrogate.quadrant(x, z)
+            quadrants = surrogate.quadrants
+            distribution = surrogate.raw_distribution
+            if new_quadrant != old_quadrant:
+                quadrants = quadrants.copy()
+                quadrants[old_quadrant] -= 1
+                quadrants[new_quadrant] += 1
+                distribution = surrogate.distribution_for(quadrants)
+
+            candidate, true = objectives(efficiency, distribution)
+            delta = candidate - current
+            if delta >= 0 or threshold < math.exp(delta / temperature):
+                positions[index] = (x, z)
+                surrogate.distance_sum = distance_sum
+                surrogate.raw_efficiency = efficiency
+                surrogate.quadrants = quadrants
+                surrogate.raw_distribution = distribution
+                current = candidate
+                accepted += 1
+                if true > best_objective:
+                    best_objective = true
+                    best_positions[:] = positions
+                    best_distance_sum, best_quadrants = distance_sum, quadrants
+                    improved = True
+
+        done = progress()
+        # Intermediate checkpoints are spread evenly over the run; the last
+        # one is taken on the returned layout below
+        while len(history) < checkpoints - 1 and done >= (len(history) + 1) / checkpoints:
+            exact_scores, distance_sum = exact(positions)
+            checkpoint(surrogate.scores(), exact_scores)
+            if history[-1].drift > _SYNC_TOLERANCE:
+                surrogate.sync(distance_sum)
+                current, _ = objectives(surrogate.raw_efficiency, surrogate.raw_distribution)
+
+    if improved:
+        scores, _ = exact(best_positions)
+    else:
+        # Still the input layout, whose exact scores are already known
+        best_positions = np.array(columns.positions, dtype=np.float64).reshape(-1, 2)
+        scores = initial_scores
+    checkpoint(surrogate.scores_for(best_distance_sum, best_quadrants), scores)
+
+    objective = _objective(scores, weights)
+    if objective < initial_objective:
+        best_positions = np.array(columns.positions, dtype=np.float64).reshape(-1, 2)
+        scores, objective = initial_scores, initial_objective
+
+    return ScoreOptimizationResult(
+        positions=best_positions,
+        weights=weights,
+        initial_scores=initial_scores,
+        scores=scores,
+        initial_objective=initial_objective,
+        objective=objective,
+        steps=steps,
+        accepted=accepted,
+        elapsed=time.perf_counter() - start,
+        checkpoints=history
+    )
@@ -0,0 +1,220 @@
+"""
+Spatial Index Module
+Uniform hash grid and KD-tree proximity queries over 2D points
+"""
+
+import math
+import numpy as np
+from typing import Dict, List, Optional, Set, Tuple
+
+
+SPATIAL_BACKENDS = ('grid', 'kdtree')
+
+# Neighbour-cell offsets covering each unordered pair of adjacent cells once
+_HALF_NEIGHBOURHOOD = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+class GridIndex:
+    """
+    Uniform hash grid mapping cells to the indices of the points inside them.
+
+    Queries within one ``cell_size`` of a point only visit the 3x3 block of
+    cells around it; larger radii widen the block. Points can be moved in
+    place in O(1), which makes the grid the backend of choice when points
+    change between queries.
+    """
+
+    def __init__(self, points: np.ndarray, cell_size: float):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.cell_size = float(cell_size)
+        self.points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}
+        for i, (x, z) in enumerate(self.points.tolist()):
+            self.cells.setdefault(self.key(x, z), set()).add(i)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def key(self, x: float, z: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_size), math.floor(z / self.cell_size))
+
+    def update(self, index: int, point: Tuple[float, float]):
+        """Move point ``index`` to ``point``"""
+        x, z = point
+        old_key = self.key(*self.points[index].tolist())
+        new_key = self.key(x, z)
+        if old_key != new_key:
+            self.cells[old_key].discard(index)
+            self.cells.setdefault(new_key, set()).add(index)
+        self.points[index] = (x, z)
+
+    def neighbours(self, x: float, z: float, reach: int = 1) -> List[int]:
+        """Candidate indices in the block of cells ``reach`` cells around (x, z)"""
+        cx, cz = self.key(x, z)
+        found = []
+        for dx in range(-reach, reach + 1):
+            for dz in range(-reach, reach + 1):
+                cell = self.cells.get((cx + dx, cz + dz))
+                if cell:
+                    found.extend(cell)
+        return found
+
+    def query_radius(self, point: Tuple[float, float], radius: float) -> np.ndarray:
+        """Indices of the points within ``radius`` of ``point``"""
+        x, z = point
+        candidates = np.array(self.neighbours(x, z, max(1, math.ceil(radius / self.cell_size))),
+                              dtype=np.int64)
+        if not len(candidates):
+            return candidates
+        offsets = self.points[candidates] - (x, z)
+        inside = np.einsum('ij,ij->i', offsets, offsets) <= radius * radius
+        return np.sort(candidates[inside])
+
+    def nearest(self, point: Tuple[float, float], k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Distances and indices of the ``k`` points nearest to ``point``"""
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+
+        x, z = point
+        reach = 1
+        while True:
+            if (2 * reach + 1) ** 2 > len(self.cells):
+                candidates = np.arange(len(self))
+            else:
+                candidates = np.array(self.neighbours(x, z, reach), dtype=np.int64)
+            # Everything within reach * cell_size has been seen; stop once the
+            # k-th nearest candidate lies inside that disc
+            if len(candidates) >= k:
+                distances = np.hypot(*(self.points[candidates] - (x, z)).T)
+                order = np.argsort(distances, kind='stable')[:k]
+                if distances[order[-1]] <= reach * self.cell_size or len(candidates) == len(self):
+                    return distances[order], candidates[order]
+            reach *= 2
+
+    def pairs_within(self, radius: float) -> np.ndarray:
+        """
+        (m, 2) array of index pairs ``i < j`` closer than or at ``radius``.
+
+        Points are bucketed by cell and each pair of adjacent cells is joined
+        once with array operations, so no Python loop runs per point.
+        """
+        n = len(self)
+        if n < 2:
+            return np.empty((0, 2), dtype=np.int64)
+
+        cell_size = max(self.cell_size, radius)
+        cells = np.floor(self.points / cell_size).astype(np.int64)
+        cells -= cells.min(axis=0)
+        width = int(cells[:, 1].max()) + 3
+        codes = (cells[:, 0] + 1) * width + cells[:, 1] + 1
+
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        unique_codes, starts, counts = np.unique(sorted_codes, return_index=True, return_counts=True)
+
+        pairs = []
+        for dx, dz in _HALF_NEIGHBOURHOOD:
+            target = codes + dx * width + dz
+            slot = np.searchsorted(unique_codes, target)
+            slot = np.minimum(slot, len(unique_codes) - 1)
+            hit = unique_codes[slot] == target
+            left = np.nonzero(hit)[0]
+            if not len(left):
+                continue
+            lengths = counts[slot[left]]
+            first = starts[slot[left]]
+
+            # Expand every (point, neighbour-cell) match into its candidate pairs
+            i = np.repeat(left, lengths)
+            runs = np.cumsum(lengths) - lengths
+            j = order[np.repeat(first - runs, lengths) + np.arange(lengths.sum())]
+            if (dx, dz) == (0, 0):
+                keep = i < j
+                i, j = i[keep], j[keep]
+
+            offsets = self.points[i] - self.points[j]
+            inside = np.einsum('ij,ij->i', offsets, offsets) <= radius * radius
+            pairs.append(np.column_stack((np.minimum(i, j)[inside], np.maximum(i, j)[inside])))
+
+        if not pairs:
+            return np.empty((0, 2), dtype=np.int64)
+        return np.concatenate(pairs)
+
+
+class KDTreeIndex:
+    """
+    ``scipy.spatial.cKDTree`` behind the same interface as ``GridIndex``.
+
+    The tree is static: ``update`` edits the point array and the tree is
+    rebuilt lazily before the next query, so it suits query-heavy workloads
+    with few moves.
+    """
+
+    def __init__(self, points: np.ndarray):
+        self.points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        self._tree = None
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.points)
+        return self._tree
+
+    def update(self, index: int, point: Tuple[float, float]):
+        self.points[index] = point
+        self._tree = None
+
+    def query_radius(self, point: Tuple[float, float], radius: float) -> np.ndarray:
+        return np.sort(np.array(self.tree.query_ball_point(point, radius), dtype=np.int64))
+
+    def nearest(self, point: Tuple[float, float], k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        distances, indices = self.tree.query(point, k=[*range(1, k + 1)])
+        return distances, indices.astype(np.int64)
+
+    def pairs_within(self, radius: float) -> np.ndarray:
+        if len(self) < 2:
+            return np.empty((0, 2), dtype=np.int64)
+        return self.tree.query_pairs(radius, output_type='ndarray').astype(np.int64)
+
+
+def build_index(points: np.ndarray, backend: str = 'kdtree',
+                cell_size: Optional[float] = None):
+    """
+    Build a spatial index over (n, 2) points. The grid backend needs a
+    ``cell_size``, ideally the radius most queries will use.
+    """
+    if backend == 'grid':
+        if cell_size is None:
+            raise ValueError("the grid backend needs a cell_size")
+        return GridIndex(points, cell_size)
+    if backend == 'kdtree':
+        return KDTreeIndex(points)
+    raise ValueError(f"backend must be one of {', '.join(SPATIAL_BACKENDS)}")
+
+
+def nearest_neighbour_distances(points: np.ndarray, targets: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Distance from each point to its nearest other point, or to the nearest
+    of ``targets`` when given. Empty inputs give ``inf`` distances.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if targets is None:
+        if len(points) < 2:
+            return np.full(len(points), np.inf)
+        distances, _ = KDTreeIndex(points).tree.query(points, k=[2])
+        return distances[:, 0]
+
+    targets = np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+    if not len(targets):
+        return np.full(len(points), np.inf)
+    distances, _ = KDTreeIndex(targets).tree.query(points, k=1)
+    return np.asarray(distances)
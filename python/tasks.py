@@ -0,0 +1,554 @@
+"""
+Service Tasks Module
+Compute entry points shared by the synchronous routes and the job queue
+"""
+
+import math
+import os
+import numpy as np
+from dataclasses import fields, replace
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Union
+
+from ai_city_generator import CityGenerator
+from annealing import AnnealingSchedule
+from city_arrays import CityArrays
+from heatmap import resolve_extent
+from instrumentation import record_annealing, record_sampling
+from parallel_annealing import CHAIN_MODES, MultiChainResult
+from phased_generation import PHASE_SCHEDULE, AnnealingSnapshot, PhaseResult
+from placement import DEFAULT_GAP, DEFAULT_ZONING_RESOLUTION, radial_zoning
+from score_optimizer import resolve_weights
+from tiled_generation import DEFAULT_TILE_SIZE, TileResult
+
+
+# Largest city a positions request may ask for
+MAX_GRID_SIZE = 20000.0
+MAX_BUILDING_COUNT = 2_000_000
+
+# Largest acceleration grid a single sampler may allocate
+MAX_SAMPLER_CELLS = 4_000_000
+
+# Most candidates a sampler may try around each active point before retiring it
+DEFAULT_MAX_ATTEMPTS = 30
+MAX_ATTEMPTS = 100
+
+# Longest time a single request may spend optimising for the analytics score
+MAX_TIME_BUDGET = 30.0
+
+# Most Metropolis steps one request's schedule may run per annealing chain
+MAX_ANNEALING_STEPS = 2_000_000
+
+# Largest batch one request may score: variants, buildings and building
+# pairs summed over every variant, and heatmap cells over the stacked heatmaps
+MAX_BATCH_VARIANTS = 1000
+MAX_BATCH_BUILDINGS = 1_000_000
+MAX_BATCH_PAIRS = 500_000_000
+MAX_BATCH_HEATMAP_CELLS = 16_000_000
+
+# Process pools a single request may ask for
+MAX_WORKERS = os.cpu_count() or 1
+MAX_CHAINS = 4 * MAX_WORKERS
+
+
+def request_workers(data: Dict) -> Optional[int]:
+    """A request's ``workers``, None for the default; ValueError above ``MAX_WORKERS``"""
+    workers = data.get('workers')
+    if workers is None:
+        return None
+    workers = request_number(data, 'workers', None, int)
+    if not 1 <= workers <= MAX_WORKERS:
+        raise ValueError(f"workers must be in [1, {MAX_WORKERS}]")
+    return workers
+
+
+def check_batch_size(building_counts: Sequence[int], heatmap_cells: int = 0):
+    """
+    Raise ValueError when a batch of variants with ``building_counts``
+    buildings each, plus one ``heatmap_cells`` heatmap per variant, exceeds
+    the ``MAX_BATCH_*`` limits
+    """
+    count = len(building_counts)
+    if count > MAX_BATCH_VARIANTS:
+        raise ValueError(f"a batch may hold at most {MAX_BATCH_VARIANTS} variants")
+    if sum(building_counts) > MAX_BATCH_BUILDINGS:
+        raise ValueError(f"a batch may hold at most {MAX_BATCH_BUILDINGS} buildings in total")
+    if sum(n * (n - 1) // 2 for n in building_counts) > MAX_BATCH_PAIRS:
+        raise ValueError(f"a batch may hold at most {MAX_BATCH_PAIRS} building pairs in total")
+    if count * heatmap_cells > MAX_BATCH_HEATMAP_CELLS:
+        raise ValueError(f"a batch may hold at most {MAX_BATCH_HEATMAP_CELLS} heatmap cells in total")
+
+
+def request_number(data: Dict, key: str, default, convert=float):
+    """
+    A request's ``key`` passed through ``convert`` (``float`` or ``int``),
+    ``default`` when absent; ValueError for nulls, lists and other values
+    ``convert`` rejects
+    """
+    try:
+        return convert(data.get(key, default))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{key} must be {'an integer' if convert is int else 'a number'}")
+
+
+def request_max_attempts(data: Dict) -> int:
+    """A request's ``max_attempts``; ValueError outside [1, ``MAX_ATTEMPTS``]"""
+    max_attempts = request_number(data, 'max_attempts', DEFAULT_MAX_ATTEMPTS, int)
+    if not 1 <= max_attempts <= MAX_ATTEMPTS:
+        raise ValueError(f"max_attempts must be in [1, {MAX_ATTEMPTS}]")
+    return max_attempts
+
+
+def request_seed(data: Dict) -> Optional[int]:
+    """A request's ``seed`` as an int, None when absent; ValueError unless a non-negative integer"""
+    seed = data.get('seed')
+    if seed is None:
+        return None
+    try:
+        seed = int(seed)
+    except (TypeError, ValueError):
+        raise ValueError("seed must be a non-negative integer")
+    if seed < 0:
+        raise ValueError("seed must be a non-negative integer")
+    return seed
+
+
+def request_footprint_gap(data: Dict) -> Optional[float]:
+    """A request's ``footprint_gap``, None when absent; ValueError unless a non-negative number"""
+    if data.get('footprint_gap') is None:
+        return None
+    gap = request_number(data, 'footprint_gap', None)
+    if not 0 <= gap < math.inf:
+        raise ValueError("footprint_gap must be a non-negative number")
+    return gap
+
+
+def request_grid_size(data: Dict) -> float:
+    """A request's ``grid_size`` (default 60); ValueError unless a number in (0, ``MAX_GRID_SIZE``]"""
+    grid_size = request_number(data, 'grid_size', 60)
+    if not 0 < grid_size <= MAX_GRID_SIZE:
+        raise ValueError(f"grid_size must be in (0, {MAX_GRID_SIZE:g}]")
+    return grid_size
+
+
+def _sampling_request(data: Dict,
+                      tile_size: Optional[float] = None) -> Tuple[float, int, float, int, Optional[int]]:
+    """
+    Validated ``grid_size``, ``building_count``, ``min_distance``,
+    ``max_attempts`` and ``seed`` of a positions request, with one sampler
+    per ``tile_size`` square or one for the whole grid; raises ValueError
+    when out of range
+    """
+    grid_size = request_grid_size(data)
+    building_count = request_number(data, 'building_count', 50, int)
+    min_distance = request_number(data, 'min_distance', 4.0)
+    if not 0 <= building_count <= MAX_BUILDING_COUNT:
+        raise ValueError(f"building_count must be in [0, {MAX_BUILDING_COUNT}]")
+    if not min_distance > 0:
+        raise ValueError("min_distance must be positive")
+    domain = grid_size if tile_size is None else min(tile_size, grid_size)
+    cells = (domain * np.sqrt(2) / min_distance) ** 2
+    if cells > MAX_SAMPLER_CELLS:
+        raise ValueError("min_distance is too small for the grid; use the tiled endpoint "
+                         "or a larger min_distance")
+    return grid_size, building_count, min_distance, request_max_attempts(data), request_seed(data)
+
+
+def sample_positions(data: Dict) -> Tuple[np.ndarray, bool]:
+    """
+    Generate optimal building positions using Poisson disk sampling,
+    returning the (n, 2) positions and whether the grid saturated
+    """
+    grid_size, building_count, min_distance, max_attempts, seed = _sampling_request(data)
+    generator = CityGenerator(grid_size=grid_size, building_count=building_count)
+    positions = generator.generate_spatial_distribution(
+        min_distance=min_distance,
+        max_attempts=max_attempts,
+        seed=seed
+    )
+    record_sampling(generator.last_sampling)
+    return positions, generator.last_sampling.saturated
+
+
+def iter_tiled_positions(data: Dict) -> Iterator[TileResult]:
+    """
+    Tiled Poisson disk sampling for very large grids, yielding each tile's
+    positions as soon as its worker finishes
+    """
+    tile_size = request_number(data, 'tile_size', DEFAULT_TILE_SIZE)
+    if not tile_size > 0:
+        raise ValueError("tile_size must be positive")
+    grid_size, building_count, min_distance, max_attempts, seed = _sampling_request(data, tile_size)
+    generator = CityGenerator(grid_size=grid_size, building_count=building_count)
+    for result in generator.iter_tiled_distribution(
+        tile_size=tile_size,
+        min_distance=min_distance,
+        max_attempts=max_attempts,
+        seed=seed,
+        workers=request_workers(data)
+    ):
+        record_sampling(result.sampling)
+        yield result
+
+
+def check_positions_request(data: Dict):
+    """Validate a positions request without sampling; raises ValueError"""
+    _sampling_request(data)
+
+
+def generate_positions_task(data: Dict) -> Dict:
+    """
+    Generate optimal building positions using Poisson disk sampling
+    """
+    positions, saturated = sample_positions(data)
+
+    return {
+        'positions': positions.tolist(),
+        'count': len(positions),
+        'saturated': saturated
+    }
+
+
+def schedule_steps(schedule: AnnealingSchedule) -> int:
+    """Upper bound on the Metropolis steps one chain runs under ``schedule``"""
+    if schedule.initial_temperature <= schedule.min_temperature:
+        return 0
+    levels = math.ceil(math.log(schedule.min_temperature / schedule.initial_temperature) /
+                       math.log(schedule.cooling_rate))
+    return levels * (schedule.max_reheats + 1) * schedule.iterations_per_temperature
+
+
+def request_schedule(overrides: Dict,
+                     base: AnnealingSchedule = AnnealingSchedule()) -> AnnealingSchedule:
+    """
+    ``base`` with a request's ``schedule`` fields applied. Unknown fields,
+    out-of-range values and schedules that could run more than
+    ``MAX_ANNEALING_STEPS`` steps raise ValueError.
+    """
+    if not isinstance(overrides, dict):
+        raise ValueError("schedule must be an object")
+    unknown = set(overrides) - {f.name for f in fields(AnnealingSchedule)}
+    if unknown:
+        raise ValueError(f"unknown schedule fields: {', '.join(sorted(unknown))}")
+
+    schedule = replace(base, **overrides)
+    schedule = replace(
+        schedule,
+        initial_temperature=float(schedule.initial_temperature),
+        cooling_rate=float(schedule.cooling_rate),
+        min_temperature=float(schedule.min_temperature),
+        iterations_per_temperature=int(schedule.iterations_per_temperature),
+        step_size=float(schedule.step_size),
+        stagnation_levels=int(schedule.stagnation_levels),
+        max_reheats=int(schedule.max_reheats),
+        reheat_factor=float(schedule.reheat_factor)
+    )
+    if not 0 < schedule.min_temperature <= schedule.initial_temperature:
+        raise ValueError("schedule temperatures must satisfy 0 < min_temperature <= initial_temperature")
+    if not 0 < schedule.cooling_rate < 1:
+        raise ValueError("cooling_rate must be in (0, 1)")
+    if schedule.iterations_per_temperature < 1 or schedule.stagnation_levels < 1:
+        raise ValueError("iterations_per_temperature and stagnation_levels must be at least 1")
+    if schedule.step_size <= 0:
+        raise ValueError("step_size must be positive")
+    if schedule.max_reheats < 0 or not 0 < schedule.reheat_factor <= 1:
+        raise ValueError("max_reheats must be non-negative and reheat_factor in (0, 1]")
+    if schedule_steps(schedule) > MAX_ANNEALING_STEPS:
+        raise ValueError(f"schedule would run more than {MAX_ANNEALING_STEPS} steps")
+    return schedule
+
+
+def request_city(data: Dict) -> CityArrays:
+    """A request's ``buildings`` as float64 columns, which keep the JSON round trip exact"""
+    buildings = data.get('buildings', [])
+    if not isinstance(buildings, list):
+        raise ValueError("buildings must be a list")
+    return CityArrays.from_dicts(buildings, dtype=np.float64)
+
+
+def request_objective(data: Dict) -> str:
+    """A request's ``objective``, ``"energy"`` (the default) or ``"score"``"""
+    objective = data.get('objective', 'energy')
+    if objective not in ('energy', 'score'):
+        raise ValueError("objective must be 'energy' or 'score'")
+    return objective
+
+
+def annealing_params(data: Dict) -> Dict:
+    """Keyword arguments of ``CityGenerator.optimize_city`` for a request; raises ValueError"""
+    chains = request_number(data, 'chains', 1, int)
+    if not 1 <= chains <= MAX_CHAINS:
+        raise ValueError(f"chains must be in [1, {MAX_CHAINS}]")
+    # Checked here as well as in optimize_multichain, which a single chain never reaches
+    mode = data.get('mode', 'restarts')
+    if mode not in CHAIN_MODES:
+        raise ValueError(f"mode must be one of {', '.join(CHAIN_MODES)}")
+
+    return {
+        'schedule': request_schedule(data.get('schedule', {})),
+        'seed': request_seed(data),
+        'chains': chains,
+        'workers': request_workers(data),
+        'mode': mode,
+        'footprint_gap': request_footprint_gap(data)
+    }
+
+
+def score_params(data: Dict) -> Dict:
+    """Keyword arguments of ``CityGenerator.optimize_city_scores`` for a request; raises ValueError"""
+    time_budget = request_number(data, 'time_budget', 1.0)
+    if not 0 < time_budget <= MAX_TIME_BUDGET:
+        raise ValueError(f"time_budget must be in (0, {MAX_TIME_BUDGET}] seconds")
+    max_steps = None
+    if data.get('max_steps') is not None:
+        max_steps = request_number(data, 'max_steps', None, int)
+        if max_steps < 0:
+            raise ValueError("max_steps must be a non-negative integer")
+    grid_size = request_grid_size(data) if data.get('grid_size') is not None else None
+
+    return {
+        'extent': resolve_extent(data.get('extent'), grid_size),
+        'weights': resolve_weights(data.get('weights')),
+        'time_budget': time_budget,
+        'max_steps': max_steps,
+        'seed': request_seed(data),
+        'footprint_gap': request_footprint_gap(data)
+    }
+
+
+def check_layout_request(data: Dict):
+    """Validate an optimize-layout request without optimising; raises KeyError or ValueError"""
+    request_city(data)
+    if request_objective(data) == 'score':
+        score_params(data)
+    else:
+        annealing_params(data)
+
+
+def optimize_city_task(city: CityArrays, data: Dict) -> Tuple[CityArrays, Dict]:
+    """
+    Optimize a city layout using simulated annealing, returning the
+    optimized city and a summary of the annealing run.
+
+    With ``objective`` set to ``"score"`` the layout is optimised for the
+    weighted analytics score instead; see ``optimize_city_scores_task``.
+    """
+    if request_objective(data) == 'score':
+        return optimize_city_scores_task(city, data)
+
+    generator = CityGenerator()
+    optimized = generator.optimize_city(city, **annealing_params(data))
+    result = generator.last_annealing
+    record_annealing(result)
+
+    summary = {
+        'initial_energy': result.initial_energy,
+        'energy': result.energy,
+        'steps': result.steps,
+        'acceptance_rate': result.acceptance_rate,
+        'reheats': result.reheats
+    }
+    if isinstance(result, MultiChainResult):
+        summary.update({
+            'mode': result.mode,
+            'best_chain': result.best_chain,
+            'chain_energies': result.chain_energies,
+            'energy_traces': result.energy_traces,
+            'temperatures': result.temperatures,
+            'swaps': result.swaps
+        })
+
+    return optimized, summary
+
+
+def optimize_city_scores_task(city: CityArrays, data: Dict) -> Tuple[CityArrays, Dict]:
+    """
+    Optimize a city layout for the weighted ``overall_score`` (or the
+    request's ``weights``) within ``time_budget`` seconds, returning the
+    optimized city and how each score moved
+    """
+    params = score_params(data)
+    generator = CityGenerator()
+    optimized = generator.optimize_city_scores(city, **params)
+    result = generator.last_score_optimization
+
+    summary = {
+        'objective': 'score',
+        'weights': result.weights,
+        'initial_scores': result.initial_scores,
+        'scores': result.scores,
+        'improvements': result.improvements,
+        'initial_objective': result.initial_objective,
+        'objective_score': result.objective,
+        'steps': result.steps,
+        'acceptance_rate': result.acceptance_rate,
+        'elapsed': result.elapsed,
+        'time_budget': params['time_budget'],
+        'checkpoints': [
+            {
+                'elapsed': checkpoint.elapsed,
+                'steps': checkpoint.steps,
+                'surrogate': checkpoint.surrogate,
+                'exact': checkpoint.exact,
+                'drift': checkpoint.drift
+            }
+            for checkpoint in result.checkpoints
+        ]
+    }
+
+    return optimized, summary
+
+
+def optimize_layout_task(data: Dict) -> Dict:
+    """
+    Optimize building layout using simulated annealing
+    """
+    optimized, summary = optimize_city_task(request_city(data), data)
+
+    return {
+        'buildings': optimized.to_dicts(),
+        'annealing': summary
+    }
+
+
+def request_zoning(data: Dict) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Zoning rasters of a request: ``"radial"`` (the default) for the radial
+    preset at ``zoning_resolution``, ``"uniform"`` for none, or a mapping of
+    building types to 2D weight grids (row 0 at the smallest z)
+    """
+    zoning = data.get('zoning', 'radial')
+    if zoning == 'radial':
+        return radial_zoning(data.get('zoning_resolution', DEFAULT_ZONING_RESOLUTION))
+    if zoning == 'uniform':
+        return {}
+    if not isinstance(zoning, dict):
+        raise ValueError("zoning must be 'radial', 'uniform' or a mapping of building types to grids")
+    return {building_type: np.asarray(grid, dtype=np.float64) for building_type, grid in zoning.items()}
+
+
+def placement_params(data: Dict) -> Dict:
+    """Keyword arguments of ``CityGenerator.place_city`` for a request; raises ValueError"""
+    gap = request_number(data, 'gap', DEFAULT_GAP)
+    if not gap >= 0:
+        raise ValueError("gap must be non-negative")
+
+    return {
+        'zoning': request_zoning(data),
+        'gap': gap,
+        'max_attempts': request_max_attempts(data),
+        'seed': request_seed(data)
+    }
+
+
+def check_placement_request(data: Dict):
+    """Validate a place-buildings request without placing; raises KeyError or ValueError"""
+    request_city(data)
+    request_grid_size(data)
+    placement_params(data)
+
+
+def place_city_task(city: CityArrays, data: Dict) -> Tuple[CityArrays, Dict]:
+    """
+    Place a city's buildings by type under zoning rasters without footprint
+    overlaps, returning the placed city and a placement summary
+    """
+    generator = CityGenerator(grid_size=request_grid_size(data))
+    placed = generator.place_city(city, **placement_params(data))
+    result = generator.last_placement
+
+    summary = {
+        'placed': int(result.placed.sum()),
+        'unplaced': [city.ids[i] for i in result.unplaced.tolist()],
+        'attempts': result.attempts,
+        'rejections': result.rejections
+    }
+    return placed, summary
+
+
+def place_buildings_task(data: Dict) -> Dict:
+    """
+    Place buildings by type under zoning rasters without footprint overlaps
+    """
+    placed, summary = place_city_task(request_city(data), data)
+
+    return {
+        'buildings': placed.to_dicts(),
+        'placement': summary
+    }
+
+
+def phase_params(data: Dict) -> Dict:
+    """Keyword arguments of ``CityGenerator.iter_phased_city`` for a request; raises ValueError"""
+    schedule = data.get('schedule', {})
+    snapshot_every = request_number(data, 'snapshot_every', 0, convert=int)
+    if snapshot_every < 0:
+        raise ValueError("snapshot_every must be non-negative")
+    return {
+        **placement_params(data),
+        'schedule': request_schedule(schedule, PHASE_SCHEDULE) if schedule is not False else None,
+        'snapshot_every': snapshot_every
+    }
+
+
+def check_city_request(data: Dict):
+    """Validate a generate-city request without generating; raises KeyError or ValueError"""
+    request_city(data)
+    request_grid_size(data)
+    phase_params(data)
+
+
+def iter_city_phases(city: CityArrays, data: Dict) -> Iterator[Union[AnnealingSnapshot, PhaseResult]]:
+    """
+    Place and locally anneal a city phase by phase, yielding each phase
+    (and, with ``snapshot_every``, annealing snapshots) as it completes.
+    ``schedule`` overrides fields of the per-phase schedule; ``false``
+    skips annealing.
+    """
+    generator = CityGenerator(grid_size=request_grid_size(data))
+    for event in generator.iter_phased_city(city, **phase_params(data)):
+        if isinstance(event, PhaseResult) and event.annealing is not None:
+            record_annealing(event.annealing)
+        yield event
+
+
+def phase_city(city: CityArrays, result: PhaseResult) -> CityArrays:
+    """A phase's buildings at their final positions; unplaced ones keep their input position"""
+    phase = city.take(result.indices)
+    placed = result.placement.placed
+    return phase.with_xz(np.where(placed[:, None], result.positions, phase.xz))
+
+
+def phase_summary(city: CityArrays, result: PhaseResult) -> Dict:
+    """Placement and annealing summary of one completed phase"""
+    summary = {
+        'phase': result.phase,
+        'placed': int(result.placement.placed.sum()),
+        'unplaced': [city.ids[i] for i in result.unplaced.tolist()],
+        'attempts': result.placement.attempts,
+        'rejections': result.placement.rejections
+    }
+    if result.annealing is not None:
+        summary['annealing'] = {
+            'initial_energy': result.annealing.initial_energy,
+            'energy': result.annealing.energy,
+            'steps': result.annealing.steps,
+            'acceptance_rate': result.annealing.acceptance_rate
+        }
+    return summary
+
+
+def generate_city_task(data: Dict) -> Dict:
+    """
+    Build a whole city phase by phase, returning every building and the
+    per-phase summaries at once
+    """
+    city = request_city(data)
+    parts, phases = [], []
+    for event in iter_city_phases(city, {**data, 'snapshot_every': 0}):
+        parts.append(phase_city(city, event))
+        phases.append(phase_summary(city, event))
+
+    return {
+        'buildings': CityArrays.concat(parts, dtype=np.float64).to_dicts(),
+        'phases': phases
+    }
@@ -0,0 +1,52 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# The service modules live flat in python/, one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from city_arrays import BUILDING_TYPES  # noqa: E402
+
+
+def make_building(index: int, rng: np.random.Generator, half_extent: float = 30.0) -> dict:
+    x, z = rng.uniform(-half_extent, half_extent, size=2).tolist()
+    width, height, depth = rng.uniform(1.0, 6.0, size=3).tolist()
+    return {
+        'id': f'b{index}',
+        'name': f'Building {index % 7}',
+        'type': BUILDING_TYPES[int(rng.integers(len(BUILDING_TYPES)))],
+        'position': [x, height / 2, z],
+        'size': [width, height, depth],
+        'color': f'#{int(rng.integers(8)):06x}',
+        'phase': int(rng.integers(1, 4))
+    }
+
+
+@pytest.fixture
+def make_buildings():
+    """Factory for reproducible building dicts spread over the default extent"""
+    def make(count: int, seed: int = 0, half_extent: float = 30.0):
+        rng = np.random.default_rng(seed)
+        return [make_building(i, rng, half_extent) for i in range(count)]
+    return make
+
+
+def overlapping_pairs(positions: np.ndarray, footprints: np.ndarray, gap: float = 0.0) -> int:
+    """Number of footprint pairs closer than ``gap`` on both axes (a small tolerance aside)"""
+    halves = np.abs(np.asarray(footprints, dtype=np.float64)) / 2
+    reach = halves[:, None, :] + halves[None, :, :] + gap
+    apart = np.abs(positions[:, None, :] - positions[None, :, :])
+    overlap = np.all(apart < reach - 1e-9, axis=2)
+    return int(np.triu(overlap, k=1).sum())
+
+
+def outside_extent(positions: np.ndarray, footprints: np.ndarray, extent) -> int:
+    """Number of footprints that are not wholly inside ``extent``"""
+    halves = np.abs(np.asarray(footprints, dtype=np.float64)) / 2
+    x_min, x_max, z_min, z_max = extent
+    lo = positions - halves
+    hi = positions + halves
+    inside = ((lo[:, 0] >= x_min - 1e-9) & (hi[:, 0] <= x_max + 1e-9) &
+              (lo[:, 1] >= z_min - 1e-9) & (hi[:, 1] <= z_max + 1e-9))
+    return int((~inside).sum())
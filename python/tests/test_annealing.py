@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from annealing import LayoutAnnealer, layout_energy
+
+
+@pytest.mark.parametrize('footprints', [False, True])
+def test_patched_energy_matches_full_energy(footprints):
+    rng = np.random.default_rng(1)
+    positions = rng.uniform(-20, 20, size=(200, 2))
+    sizes = rng.uniform(1, 5, size=(200, 2)) if footprints else None
+    annealer = LayoutAnnealer(positions, half_extent=20, seed=2, footprints=sizes, gap=0.5)
+
+    for temperature in (5.0, 1.0, 0.1):
+        annealer.sweep(temperature, 500)
+        expected = layout_energy(annealer.positions, footprints=sizes, gap=0.5)
+        assert annealer.energy == pytest.approx(expected, rel=1e-9, abs=1e-6)
+    assert annealer.accepted > 0
+
+
+def test_best_energy_is_exact_after_restore():
+    rng = np.random.default_rng(3)
+    annealer = LayoutAnnealer(rng.uniform(-10, 10, size=(80, 2)), half_extent=10, seed=4)
+    for temperature in (2.0, 0.5):
+        annealer.sweep(temperature, 400)
+    annealer.restore_best()
+
+    assert annealer.energy == pytest.approx(layout_energy(annealer.positions), rel=1e-9, abs=1e-6)
+    assert np.all(np.abs(annealer.positions) <= 10)
+
+
+def test_fixed_buildings_do_not_move():
+    rng = np.random.default_rng(5)
+    positions = rng.uniform(-10, 10, size=(50, 2))
+    movable = np.zeros(50, dtype=bool)
+    movable[:10] = True
+    annealer = LayoutAnnealer(positions, half_extent=10, seed=6, movable=movable)
+    annealer.sweep(1.0, 300)
+
+    np.testing.assert_array_equal(annealer.positions[10:], positions[10:])
+
+
+def test_strict_annealing_keeps_footprints_apart_and_inside():
+    rng = np.random.default_rng(7)
+    sizes = rng.uniform(1, 4, size=(60, 2))
+    # A collision-free start: one building per 5 x 5 cell
+    cells = np.stack(np.meshgrid(np.arange(10), np.arange(6)), axis=-1).reshape(-1, 2)
+    positions = cells * 5.0 - 20.0
+    annealer = LayoutAnnealer(positions, half_extent=25, seed=8, footprints=sizes, gap=1.0, strict=True)
+    for temperature in (50.0, 5.0, 0.5):
+        annealer.sweep(temperature, 2000)
+
+    halves = sizes / 2
+    assert np.all(np.abs(annealer.positions) + halves <= 25 + 1e-9)
+    apart = np.abs(annealer.positions[:, None] - annealer.positions[None])
+    reach = halves[:, None] + halves[None] + 1.0
+    overlap = np.all(apart < reach - 1e-9, axis=2)
+    assert not np.triu(overlap, k=1).any()
+    assert annealer.accepted > 0
+
+    with pytest.raises(ValueError):
+        LayoutAnnealer(positions, half_extent=25, strict=True)
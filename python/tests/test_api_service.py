@@ -0,0 +1,54 @@
+import time
+import pytest
+
+from api_service import app, job_queue
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def test_job_round_trip(client):
+    response = client.post('/api/jobs/generate-positions',
+                           json={'grid_size': 60, 'building_count': 20, 'seed': 1})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        status = client.get(f'/api/jobs/{job_id}').get_json()
+        if status['status'] not in ('queued', 'running'):
+            break
+        time.sleep(0.02)
+    assert status['status'] == 'completed'
+    result = client.get(f'/api/jobs/{job_id}/result').get_json()
+    assert result['count'] == 20
+
+
+@pytest.mark.parametrize('kind, body', [
+    ('generate-positions', None),
+    ('generate-positions', 'null'),
+    ('generate-positions', [1, 2]),
+    ('generate-positions', {'grid_size': 'x'}),
+    ('generate-positions', {'timeout': 'soon'}),
+    ('optimize-layout', {'buildings': 'none'}),
+    ('optimize-layout', {'buildings': [{'id': 'a'}]}),
+    ('optimize-layout', {'objective': 'speed'}),
+    ('place-buildings', {'max_attempts': 0}),
+    ('generate-city', {'schedule': {'bogus': 1}})
+])
+def test_malformed_job_is_rejected_before_queueing(client, kind, body):
+    retained = job_queue.stats()['retained']
+    if isinstance(body, str):
+        response = client.post(f'/api/jobs/{kind}', data=body, content_type='application/json')
+    else:
+        response = client.post(f'/api/jobs/{kind}', json=body)
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert job_queue.stats()['retained'] == retained
+
+
+def test_unknown_job_kind(client):
+    assert client.post('/api/jobs/unknown', json={}).status_code == 404
@@ -0,0 +1,78 @@
+import json
+import os
+import struct
+import numpy as np
+import pytest
+
+from city_arrays import CityArrays
+from city_io import (CityBlockReader, export_city_blocks, export_city_ndjson,
+                     iter_city_blocks, iter_city_ndjson)
+
+
+def assert_same_city(actual, expected):
+    assert actual.ids == expected.ids
+    np.testing.assert_array_equal(actual.positions, expected.positions)
+    np.testing.assert_array_equal(actual.sizes, expected.sizes)
+    np.testing.assert_array_equal(actual.phases, expected.phases)
+    assert actual.to_dicts() == expected.to_dicts()
+
+
+def open_descriptors() -> int:
+    return len(os.listdir('/proc/self/fd'))
+
+
+@pytest.mark.parametrize('suffix', ['.ndjson', '.ndjson.gz', '.ndjson.xz'])
+def test_ndjson_round_trip(tmp_path, make_buildings, suffix):
+    buildings = make_buildings(250, seed=2)
+    path = str(tmp_path / f'city{suffix}')
+
+    assert export_city_ndjson(buildings, path, chunk_size=64) == 250
+    chunks = list(iter_city_ndjson(path, chunk_size=100))
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    assert CityArrays.concat(chunks, np.float64).to_dicts() == buildings
+
+
+def test_blocks_round_trip_keeps_float64(tmp_path, make_buildings):
+    city = CityArrays.from_dicts(make_buildings(1000, seed=3), np.float64)
+    path = str(tmp_path / 'city.cityb')
+
+    assert export_city_blocks(city, path, block_size=300) == 1000
+    assert_same_city(CityArrays.concat(list(iter_city_blocks(path)), np.float64), city)
+    with CityBlockReader(path) as reader:
+        assert len(reader) == 1000
+        assert len(reader.blocks) == 4
+        assert_same_city(reader.read(250, 720), city.slice(250, 720))
+
+
+def test_blocks_keep_float32(tmp_path, make_buildings):
+    city = CityArrays.from_dicts(make_buildings(100, seed=4), np.float32)
+    path = str(tmp_path / 'city.cityb')
+    export_city_blocks(city, path)
+
+    with CityBlockReader(path) as reader:
+        block = reader.block(0)
+        assert block.positions.dtype == np.float32
+        assert_same_city(block, city)
+        del block
+
+
+def malformed_index(path: str):
+    index = json.dumps({'blocks': 'none'}).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(b'CITYBLK1' + index + struct.pack('<QQ8s', 8, len(index), b'CITYEND1'))
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc')
+@pytest.mark.parametrize('content', [b'', b'CITYBLK1', b'CITYBLK1' + bytes(40), malformed_index])
+def test_bad_block_file_is_rejected_without_leaking(tmp_path, content):
+    path = str(tmp_path / 'bad.cityb')
+    if callable(content):
+        content(path)
+    else:
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    before = open_descriptors()
+    with pytest.raises(ValueError):
+        CityBlockReader(path)
+    assert open_descriptors() == before
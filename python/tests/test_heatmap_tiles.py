@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from heatmap_tiles import HeatmapPyramid
+
+PARAMS = {'resolution': 64, 'tile_size': 16}
+
+
+def all_tiles(pyramid):
+    tiles = {}
+    for level in pyramid.describe()['levels']:
+        for x in range(level['tiles_x']):
+            for z in range(level['tiles_z']):
+                key = (level['level'], x, z)
+                tiles[key] = pyramid.tile(*key) * pyramid.scale
+    return tiles
+
+
+def assert_same_tiles(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        np.testing.assert_allclose(actual[key], expected[key], rtol=1e-4, atol=1e-5, err_msg=str(key))
+
+
+@pytest.mark.parametrize('kernel, options', [
+    ('stencil', {}), ('gaussian', {'sigma': 1.5}), ('kde', {'bandwidth': 3.0})
+])
+def test_edits_match_rebuild(make_buildings, kernel, options):
+    buildings = make_buildings(60, seed=1)
+    params = dict(PARAMS, kernel=kernel, weight_by_volume=True, **options)
+    pyramid = HeatmapPyramid(buildings[:50], **params)
+    current = {b['id']: b for b in buildings[:50]}
+
+    edits = [{'op': 'add', 'building': b} for b in buildings[50:]]
+    current.update((b['id'], b) for b in buildings[50:])
+    for i in range(0, 20, 2):
+        position = [float(i) - 10, 0.0, 15.0 - i]
+        edits.append({'op': 'move', 'id': f'b{i}', 'position': position})
+        current[f'b{i}'] = dict(current[f'b{i}'], position=position)
+    for i in range(1, 20, 4):
+        edits.append({'op': 'remove', 'id': f'b{i}'})
+        del current[f'b{i}']
+    changed = pyramid.apply(edits)
+
+    rebuilt = HeatmapPyramid(list(current.values()), **params)
+    assert changed
+    assert_same_tiles(all_tiles(pyramid), all_tiles(rebuilt))
+
+
+def test_invalid_edit_list_leaves_pyramid_unchanged(make_buildings):
+    buildings = make_buildings(30, seed=2)
+    pyramid = HeatmapPyramid(buildings, **PARAMS)
+    before = all_tiles(pyramid)
+
+    with pytest.raises((KeyError, ValueError)):
+        pyramid.apply([{'op': 'move', 'id': 'b0', 'position': [0, 0, 0]},
+                       {'op': 'add', 'building': buildings[1]}])
+    assert pyramid.version == 0
+    assert_same_tiles(all_tiles(pyramid), before)
+
+
+def test_sum_levels_hold_the_base_total(make_buildings):
+    pyramid = HeatmapPyramid(make_buildings(40, seed=3), **PARAMS)
+    totals = [sum(float(tile.sum()) for key, tile in all_tiles(pyramid).items() if key[0] == level)
+              for level in range(pyramid.level_count)]
+    assert pyramid.level_count == 3
+    assert totals == pytest.approx([totals[-1]] * pyramid.level_count, rel=1e-5)
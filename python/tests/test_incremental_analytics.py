@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import incremental_analytics
+from city_analytics import CityAnalytics
+from incremental_analytics import AnalysisSessions, IncrementalAnalyzer
+
+SCORES = ('efficiency_score', 'density_score', 'distribution_score',
+          'diversity_score', 'sustainability_score', 'overall_score')
+
+
+def assert_scores_match(actual, expected):
+    for key in SCORES:
+        assert actual[key] == pytest.approx(expected[key], rel=1e-9, abs=1e-9), key
+
+
+def exact_scores(buildings):
+    return CityAnalytics().analyze_city_performance({'buildings': buildings})
+
+
+def test_incremental_scores_match_exact_after_edits(make_buildings):
+    buildings = make_buildings(120, seed=1)
+    analyzer = IncrementalAnalyzer(buildings[:100])
+    current = {b['id']: dict(b) for b in buildings[:100]}
+    rng = np.random.default_rng(2)
+
+    edits = [{'op': 'add', 'building': b} for b in buildings[100:]]
+    for b in buildings[100:]:
+        current[b['id']] = dict(b)
+    for building_id in rng.choice(sorted(current), size=30, replace=False).tolist():
+        position = [float(v) for v in rng.uniform(-30, 30, size=3)]
+        edits.append({'op': 'move', 'id': building_id, 'position': position})
+        current[building_id]['position'] = position
+    for building_id in rng.choice(sorted(current), size=15, replace=False).tolist():
+        edits.append({'op': 'remove', 'id': building_id})
+        del current[building_id]
+    analyzer.apply(edits)
+
+    assert len(analyzer) == len(current)
+    assert_scores_match(analyzer.performance(), exact_scores(list(current.values())))
+
+
+def test_resync_restores_exact_sums(make_buildings):
+    buildings = make_buildings(50, seed=3)
+    analyzer = IncrementalAnalyzer(buildings)
+    analyzer.distance_sum += 1.0
+    analyzer.occupied_area -= 1.0
+    analyzer.resync()
+
+    assert_scores_match(analyzer.performance(), exact_scores(buildings))
+
+
+def test_invalid_edit_list_applies_nothing(make_buildings):
+    buildings = make_buildings(20, seed=4)
+    analyzer = IncrementalAnalyzer(buildings)
+    before = analyzer.performance()
+
+    with pytest.raises(KeyError):
+        analyzer.apply([{'op': 'remove', 'id': 'b0'}, {'op': 'remove', 'id': 'missing'}])
+    assert 'b0' in analyzer
+    assert_scores_match(analyzer.performance(), before)
+
+
+def test_resync_is_spread_over_later_edits(make_buildings, monkeypatch):
+    monkeypatch.setattr(incremental_analytics, 'RESYNC_EDITS', 8)
+    monkeypatch.setattr(incremental_analytics, 'RESYNC_PAIRS', 200)
+    buildings = make_buildings(40, seed=6)
+    analyzer = IncrementalAnalyzer(buildings)
+    current = {b['id']: dict(b) for b in buildings}
+    rng = np.random.default_rng(7)
+
+    # Drift from before a snapshot is gone once its resync completes
+    analyzer.distance_sum += 5.0
+    started = False
+    for step in range(120):
+        building_id = f'b{int(rng.integers(40))}'
+        position = [float(v) for v in rng.uniform(-30, 30, size=3)]
+        analyzer.move(building_id, position)
+        current[building_id]['position'] = position
+        started = started or analyzer._pending is not None
+
+    assert started
+    while analyzer._pending is not None:
+        analyzer.move('b0', current['b0']['position'])
+    assert_scores_match(analyzer.performance(), exact_scores(list(current.values())))
+
+
+@pytest.mark.parametrize('bad', [
+    {'position': [float('nan'), 0.0, 0.0]},
+    {'position': [0.0, 0.0]},
+    {'size': [1.0, float('inf'), 1.0]},
+    {'type': None}
+])
+def test_malformed_initial_buildings_are_rejected(make_buildings, bad):
+    buildings = make_buildings(5, seed=8)
+    buildings[2] = dict(buildings[2], **bad)
+
+    with pytest.raises(ValueError):
+        AnalysisSessions().create(buildings)
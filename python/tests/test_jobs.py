@@ -0,0 +1,99 @@
+import os
+import time
+import pytest
+
+from jobs import (JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED, JOB_TIMED_OUT, FINISHED_STATES,
+                  JobQueue, QueueFullError)
+
+
+def double(data):
+    return {'value': data['value'] * 2}
+
+
+def sleep(data):
+    time.sleep(data['seconds'])
+    return {}
+
+
+def fail(data):
+    raise ValueError('bad input')
+
+
+def die(data):
+    os._exit(1)
+
+
+def wait_for(queue, job, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job.id)
+        if job.status in FINISHED_STATES:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job.id} did not finish")
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1, max_pending=4)
+    yield queue
+    queue.shutdown(wait=False)
+
+
+def test_job_lifecycle(queue):
+    job = queue.submit('double', double, {'value': 21})
+    assert job.future is not None
+    assert queue.get(job.id).status in ('queued', 'running', JOB_COMPLETED)
+
+    job = wait_for(queue, job)
+    assert job.status == JOB_COMPLETED
+    assert job.result == {'value': 42}
+    assert job.finished_at >= job.submitted_at
+    assert queue.stats()['pending'] == 0
+
+
+def test_failed_job_keeps_its_error(queue):
+    job = wait_for(queue, queue.submit('fail', fail, {}))
+    assert job.status == JOB_FAILED
+    assert job.error == 'bad input'
+
+
+def test_job_timeout_frees_the_worker(queue):
+    job = wait_for(queue, queue.submit('sleep', sleep, {'seconds': 5}, timeout=0.2))
+    assert job.status == JOB_TIMED_OUT
+
+    job = wait_for(queue, queue.submit('double', double, {'value': 1}))
+    assert job.result == {'value': 2}
+
+
+def test_cancel_queued_job(queue):
+    running = queue.submit('sleep', sleep, {'seconds': 0.5})
+    queued = queue.submit('double', double, {'value': 1})
+    assert queue.cancel(queued.id).cancel_requested
+
+    assert wait_for(queue, queued).status == JOB_CANCELLED
+    assert wait_for(queue, running).status == JOB_COMPLETED
+
+
+def test_queue_applies_backpressure(queue):
+    jobs = [queue.submit('sleep', sleep, {'seconds': 0.3}) for _ in range(4)]
+    with pytest.raises(QueueFullError):
+        queue.submit('double', double, {'value': 1})
+    for job in jobs:
+        wait_for(queue, job)
+
+
+def test_dead_worker_does_not_break_later_jobs(queue):
+    job = wait_for(queue, queue.submit('die', die, {}))
+    assert job.status == JOB_FAILED
+
+    for value in (1, 2):
+        job = wait_for(queue, queue.submit('double', double, {'value': value}))
+        assert job.result == {'value': 2 * value}
+
+
+@pytest.mark.parametrize('timeout', [0, -1, 'x', [1], float('nan')])
+def test_invalid_timeout_is_rejected(queue, timeout):
+    with pytest.raises(ValueError):
+        queue.submit('double', double, {'value': 1}, timeout=timeout)
+    assert queue.stats()['retained'] == 0
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from metrics_history import MetricsHistory, ScoreSeries, downsample, rolling_mean
+
+
+def rows(count: int, start: int = 0):
+    timestamps = np.arange(start, start + count, dtype=np.float64)
+    values = np.stack([timestamps, -timestamps], axis=1)
+    return timestamps, values
+
+
+def test_ring_buffer_keeps_the_newest_rows_in_order():
+    series = ScoreSeries(capacity=8, columns=('a', 'b'))
+    timestamps, values = rows(21)
+    for t, v in zip(timestamps, values):
+        series.append(t, v)
+
+    found_t, found_v = series.query()
+    assert series.size == 8 and series.total == 21
+    np.testing.assert_array_equal(found_t, timestamps[-8:])
+    np.testing.assert_array_equal(found_v, values[-8:])
+
+    found_t, _ = series.query(15.5, 18)
+    np.testing.assert_array_equal(found_t, [16.0, 17.0, 18.0])
+
+
+def test_extend_matches_append_across_wraps():
+    appended = ScoreSeries(capacity=8, columns=('a', 'b'))
+    extended = ScoreSeries(capacity=8, columns=('a', 'b'))
+    timestamps, values = rows(29)
+    for t, v in zip(timestamps, values):
+        appended.append(t, v)
+    extended.extend(timestamps[:5], values[:5])
+    extended.extend(timestamps[5:], values[5:])
+
+    for a, b in zip(appended.query(), extended.query()):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_timestamps_never_go_backwards():
+    series = ScoreSeries(capacity=4, columns=('a',))
+    series.append(10.0, [1.0])
+    series.append(5.0, [2.0])
+    series.extend([3.0, 12.0], [[3.0], [4.0]])
+    np.testing.assert_array_equal(series.query()[0], [10.0, 10.0, 10.0, 12.0])
+
+
+@pytest.mark.parametrize('flush_rows', [1, 3, 8])
+def test_range_query_reads_evicted_rows_from_the_log(tmp_path, flush_rows):
+    log_path = str(tmp_path / 'city.scores')
+    series = ScoreSeries(capacity=8, columns=('a', 'b'), log_path=log_path, flush_rows=flush_rows)
+    timestamps, values = rows(50)
+    series.extend(timestamps[:20], values[:20])
+    for t, v in zip(timestamps[20:], values[20:]):
+        series.append(t, v)
+
+    for start, end in [(None, None), (3, 17), (10, 45), (44, None), (60, 70)]:
+        found_t, found_v = series.query(start, end)
+        keep = ((timestamps >= (-np.inf if start is None else start)) &
+                (timestamps <= (np.inf if end is None else end)))
+        np.testing.assert_array_equal(found_t, timestamps[keep])
+        np.testing.assert_array_equal(found_v, values[keep])
+
+
+def test_series_resumes_from_its_log(tmp_path):
+    log_path = str(tmp_path / 'city.scores')
+    series = ScoreSeries(capacity=8, columns=('a', 'b'), log_path=log_path, flush_rows=4)
+    timestamps, values = rows(30)
+    series.extend(timestamps, values)
+    series.flush()
+
+    resumed = ScoreSeries(capacity=8, columns=('a', 'b'), log_path=log_path, flush_rows=4)
+    assert resumed.total == 30 and resumed.size == 8
+    np.testing.assert_array_equal(resumed.query(2, 25)[0], timestamps[2:26])
+    resumed.append(30.0, [30.0, -30.0])
+    np.testing.assert_array_equal(resumed.query(28)[0], [28.0, 29.0, 30.0])
+
+
+def test_dropped_city_reloads_from_disk(tmp_path):
+    history = MetricsHistory(capacity=8, directory=str(tmp_path), max_cities=1, flush_rows=4,
+                             columns=('a', 'b'))
+    timestamps, values = rows(20)
+    history.record_many('north', timestamps, values)
+    history.record('south', {'a': 1.0, 'b': 2.0}, timestamp=0.0)
+
+    assert history.stats()['cities'] == 1
+    np.testing.assert_array_equal(history.query('north')[0], timestamps)
+    assert history.query('east') is None
+
+
+def test_trends_report():
+    history = MetricsHistory(capacity=64, columns=('a', 'b'))
+    timestamps, values = rows(40)
+    history.record_many('city', timestamps, values)
+
+    report = history.trends('city', start=10, end=19, columns=['a'], window=4)
+    assert report['count'] == 10
+    assert report['summary']['a'] == {'min': 10.0, 'max': 19.0, 'mean': 14.5,
+                                      'first': 10.0, 'last': 19.0, 'change': 9.0}
+    assert report['rolling_mean']['a'][-1] == pytest.approx(17.5)
+
+    buckets = history.trends('city', buckets=4)['buckets']
+    assert sum(buckets['count']) == 40
+    with pytest.raises(ValueError):
+        history.trends('city', columns=['c'])
+
+
+def test_rolling_mean_and_downsample():
+    values = np.arange(10, dtype=np.float64)
+    expected = [np.mean(values[max(0, i - 2):i + 1]) for i in range(10)]
+    np.testing.assert_allclose(rolling_mean(values, 3), expected)
+
+    timestamps = np.array([0.0, 1.0, 2.0, 9.0, 10.0])
+    buckets = downsample(timestamps, timestamps[:, None], 2)
+    assert buckets['count'] == [3, 2]
+    assert buckets['mean'] == [[1.0], [9.5]]
+    assert buckets['max'] == [[2.0], [10.0]]
+
+
+def test_flush_rows_are_checked_for_logged_series(tmp_path):
+    ScoreSeries(capacity=8)
+    with pytest.raises(ValueError):
+        ScoreSeries(capacity=8, log_path=str(tmp_path / 'city.scores'))
+    with pytest.raises(ValueError):
+        ScoreSeries(capacity=0)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from api_service import app
+from conftest import outside_extent, overlapping_pairs
+from heatmap import grid_extent
+from phased_generation import AnnealingSnapshot, PhaseResult, iter_phases
+from tasks import check_city_request
+
+
+def random_city(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    types = rng.choice(['residential', 'commercial', 'office', 'public'], count).tolist()
+    return types, rng.uniform(1.0, 4.0, size=(count, 2)), rng.integers(1, 4, size=count)
+
+
+@pytest.mark.parametrize('gap', [0.0, 1.0])
+def test_annealed_phases_keep_gap_and_extent(gap):
+    types, footprints, phases = random_city(600, seed=1)
+    events = list(iter_phases(types, footprints, phases, grid_size=120.0, gap=gap, seed=2))
+    results = [e for e in events if isinstance(e, PhaseResult)]
+    assert [r.phase for r in results] == [1, 2, 3]
+
+    positions = np.concatenate([r.positions[r.placement.placed] for r in results])
+    sizes = np.concatenate([footprints[r.indices[r.placement.placed]] for r in results])
+    assert len(positions) > 500
+    assert all(r.annealing.accepted > 0 for r in results)
+    assert overlapping_pairs(positions, sizes, gap) == 0
+    assert outside_extent(positions, sizes, grid_extent(120.0)) == 0
+
+
+def test_earlier_phases_do_not_move_and_snapshots_are_yielded():
+    types, footprints, phases = random_city(120, seed=3)
+    events = list(iter_phases(types, footprints, phases, grid_size=80.0, seed=4, snapshot_every=2))
+    snapshots = [e for e in events if isinstance(e, AnnealingSnapshot)]
+    results = [e for e in events if isinstance(e, PhaseResult)]
+
+    assert snapshots and all(s.level % 2 == 0 for s in snapshots)
+    for result in results:
+        np.testing.assert_array_equal(result.indices, np.flatnonzero(phases == result.phase))
+        assert np.isnan(result.positions[~result.placement.placed]).all()
+
+
+@pytest.mark.parametrize('data', [
+    {'snapshot_every': 'x'},
+    {'snapshot_every': None},
+    {'snapshot_every': -1},
+    {'gap': 'x'},
+    {'schedule': {'cooling_rate': 2}}
+])
+def test_malformed_city_request_is_rejected(make_buildings, data):
+    body = {'buildings': make_buildings(10), **data}
+    with pytest.raises(ValueError):
+        check_city_request(body)
+
+    response = app.test_client().post('/api/generate-city/stream', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from conftest import outside_extent, overlapping_pairs
+from placement import place_buildings, radial_zoning
+from tasks import check_placement_request, place_buildings_task
+
+EXTENT = (-30.0, 30.0, -30.0, 30.0)
+
+
+def random_city(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    types = rng.choice(['residential', 'commercial', 'office', 'public', 'infrastructure'], count).tolist()
+    return types, rng.uniform(1.0, 5.0, size=(count, 2))
+
+
+@pytest.mark.parametrize('gap, zoning', [(0.0, None), (1.0, None), (0.5, radial_zoning(16))])
+def test_placed_footprints_never_overlap(gap, zoning):
+    types, footprints = random_city(120, seed=1)
+    result = place_buildings(types, footprints, extent=EXTENT, zoning=zoning, gap=gap, seed=2)
+    placed = result.placed
+
+    assert placed.sum() > 100
+    assert overlapping_pairs(result.positions[placed], footprints[placed], gap) == 0
+    assert outside_extent(result.positions[placed], footprints[placed], EXTENT) == 0
+    assert np.isnan(result.positions[~placed]).all()
+
+
+def test_crowded_map_reports_unplaced_buildings():
+    types, footprints = random_city(2000, seed=3)
+    result = place_buildings(types, footprints, extent=EXTENT, gap=0.5, seed=4, max_attempts=5)
+
+    assert len(result.unplaced) > 0
+    placed = result.placed
+    assert overlapping_pairs(result.positions[placed], footprints[placed], 0.5) == 0
+
+
+def test_fixed_buildings_are_avoided():
+    types, footprints = random_city(100, seed=5)
+    fixed = np.array([[0.0, 0.0], [10.0, -10.0]])
+    fixed_footprints = np.array([[12.0, 12.0], [6.0, 6.0]])
+    result = place_buildings(types, footprints, extent=EXTENT, gap=1.0, seed=6,
+                             fixed_positions=fixed, fixed_footprints=fixed_footprints)
+
+    positions = np.concatenate([fixed, result.positions[result.placed]])
+    sizes = np.concatenate([fixed_footprints, footprints[result.placed]])
+    assert overlapping_pairs(positions, sizes, 1.0) == 0
+
+
+def test_zero_weight_cells_stay_empty():
+    zoning = {'residential': np.array([[1.0, 0.0]])}
+    types = ['residential'] * 40
+    result = place_buildings(types, np.ones((40, 2)), extent=EXTENT, zoning=zoning, seed=7)
+    assert np.all(result.positions[result.placed][:, 0] <= 0.0)
+
+
+def test_placement_task(make_buildings):
+    buildings = make_buildings(80, seed=8)
+    result = place_buildings_task({'buildings': buildings, 'gap': '0.5', 'seed': 9})
+    placed = [b for b in result['buildings'] if b['id'] not in result['placement']['unplaced']]
+
+    positions = np.array([(b['position'][0], b['position'][2]) for b in placed])
+    footprints = np.array([(b['size'][0], b['size'][2]) for b in placed])
+    assert result['placement']['placed'] == len(placed)
+    assert overlapping_pairs(positions, footprints, 0.5) == 0
+
+
+@pytest.mark.parametrize('data', [
+    {'gap': 'x'},
+    {'gap': None},
+    {'gap': -1},
+    {'grid_size': 'x'},
+    {'zoning': 'striped'},
+    {'zoning_resolution': None},
+    {'max_attempts': 0},
+    {'seed': 'x'}
+])
+def test_malformed_placement_request_is_a_value_error(data):
+    with pytest.raises(ValueError):
+        check_placement_request(data)
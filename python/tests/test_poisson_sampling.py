@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from ai_city_generator import CityGenerator
+from poisson_sampling import PoissonDiskSampler, poisson_disk_sample
+
+
+def closest_pair(positions: np.ndarray) -> float:
+    distances, _ = cKDTree(positions).query(positions, k=2)
+    return float(distances[:, 1].min())
+
+
+@pytest.mark.parametrize('count', [50, 400, 1500])
+def test_samples_keep_min_distance_and_count(count):
+    result = poisson_disk_sample(200, 120, count, min_distance=3.0, seed=1)
+
+    assert len(result.positions) == count
+    assert not result.saturated
+    assert closest_pair(result.positions) >= 3.0
+    assert np.all((result.positions >= 0) & (result.positions < [200, 120]))
+
+
+def test_saturated_domain_returns_maximal_set():
+    result = poisson_disk_sample(30, 30, 10_000, min_distance=2.0, seed=2)
+
+    assert result.saturated
+    assert 0 < len(result.positions) < 10_000
+    assert closest_pair(result.positions) >= 2.0
+
+
+def test_fixed_points_constrain_samples():
+    fixed = np.array([[-1.0, 10.0], [20.5, 5.0]])
+    result = poisson_disk_sample(20, 20, 40, min_distance=2.5, seed=3, fixed=fixed)
+
+    distances, _ = cKDTree(fixed).query(result.positions)
+    assert distances.min() >= 2.5
+
+
+def test_seed_reproduces_samples():
+    first = poisson_disk_sample(100, 100, 300, seed=4).positions
+    second = poisson_disk_sample(100, 100, 300, seed=4).positions
+    np.testing.assert_array_equal(first, second)
+
+
+def test_generator_centres_the_grid():
+    generator = CityGenerator(grid_size=60, building_count=80)
+    positions = generator.generate_spatial_distribution(min_distance=4.0, seed=5)
+
+    assert len(positions) == 80
+    assert np.all(np.abs(positions) <= 30)
+
+
+def test_invalid_parameters_are_rejected():
+    with pytest.raises(ValueError):
+        PoissonDiskSampler(10, 10, min_distance=0)
+    with pytest.raises(ValueError):
+        PoissonDiskSampler(10, 10, max_attempts=0)
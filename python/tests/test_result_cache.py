@@ -0,0 +1,95 @@
+import time
+import numpy as np
+import pytest
+
+from city_analytics import BuildingColumns
+from result_cache import (MemoryCache, ResultCache, SQLiteCache, cache_key, city_fingerprint,
+                          create_cache)
+
+
+@pytest.fixture(params=['memory', 'tiered'])
+def cache(request, tmp_path):
+    if request.param == 'memory':
+        return create_cache(max_bytes=1 << 16)
+    return create_cache(max_bytes=1 << 16, path=str(tmp_path / 'cache.db'))
+
+
+def test_hit_and_miss_counts(cache):
+    assert cache.get('a') is None
+    cache.set('a', {'score': 1.5, 'grid': np.arange(3)})
+    value = cache.get('a')
+
+    assert value['score'] == 1.5
+    np.testing.assert_array_equal(value['grid'], np.arange(3))
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_values_are_copies(cache):
+    cache.set('a', {'scores': [1, 2]})
+    cache.get('a')['scores'].append(3)
+    assert cache.get('a') == {'scores': [1, 2]}
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_bytes=300)
+    for key in 'abc':
+        cache.set(key, bytes(80))
+    cache.get('a')
+    cache.set('d', bytes(80))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] <= 300
+
+
+def test_expired_entries_are_misses(tmp_path):
+    for cache in (MemoryCache(ttl=0.05), SQLiteCache(str(tmp_path / 'c.db'), ttl=0.05)):
+        cache.set('a', 1)
+        time.sleep(0.1)
+        assert cache.get('a') is None
+        assert cache.stats()['expirations'] == 1
+
+
+def test_disk_tier_is_shared(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    create_cache(path=path).set('a', 42)
+    other = create_cache(path=path)
+
+    assert other.get('a') == 42
+    assert other.stats()['tiers']['disk']['hits'] == 1
+
+
+def test_fingerprint_ignores_building_and_type_order(make_buildings):
+    buildings = make_buildings(60, seed=1)
+    columns = BuildingColumns.from_buildings(buildings)
+    shuffled = BuildingColumns.from_buildings(buildings[::-1])
+    retyped = BuildingColumns(columns.positions, columns.sizes,
+                              len(columns.type_names) - 1 - columns.type_codes,
+                              columns.type_names[::-1])
+
+    assert city_fingerprint(shuffled) == city_fingerprint(columns)
+    assert city_fingerprint(retyped) == city_fingerprint(columns)
+    assert cache_key('analyze', shuffled, {'grid_size': 60}) == cache_key('analyze', columns, {'grid_size': 60})
+
+
+def test_fingerprint_tracks_geometry_and_params(make_buildings):
+    buildings = make_buildings(20, seed=2)
+    columns = BuildingColumns.from_buildings(buildings)
+    moved = BuildingColumns.from_buildings(
+        [dict(buildings[0], position=[0.5, 0.0, 0.5])] + buildings[1:])
+
+    assert city_fingerprint(moved) != city_fingerprint(columns)
+    assert cache_key('analyze', columns, {'a': 1}) != cache_key('analyze', columns, {'a': 2})
+    assert cache_key('analyze', columns) != cache_key('heatmap', columns)
+
+
+def test_incomplete_backend_fails_at_construction():
+    class Partial(ResultCache):
+        def _load(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
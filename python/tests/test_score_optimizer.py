@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from api_service import app
+from city_analytics import BuildingColumns, CityAnalytics
+from score_optimizer import optimize_scores, resolve_weights
+from tasks import check_layout_request, score_params
+
+SCORES = ('efficiency_score', 'density_score', 'distribution_score',
+          'diversity_score', 'sustainability_score', 'overall_score')
+
+
+def assert_scores_match(actual, expected):
+    for key in SCORES:
+        assert actual[key] == pytest.approx(expected[key], rel=1e-9, abs=1e-9), key
+
+
+def exact_scores(buildings):
+    return CityAnalytics().analyze_city_performance({'buildings': buildings})
+
+
+def test_optimized_scores_are_exact(make_buildings):
+    buildings = make_buildings(150, seed=5)
+    result = optimize_scores(BuildingColumns.from_buildings(buildings), time_budget=None,
+                             max_steps=3000, checkpoints=3, seed=6)
+
+    moved = [dict(b, position=[x, b['position'][1], z])
+             for b, (x, z) in zip(buildings, result.positions.tolist())]
+    exact = exact_scores(moved)
+    for key, value in result.scores.items():
+        assert value == pytest.approx(exact[key], rel=1e-9, abs=1e-9), key
+    assert_scores_match(result.initial_scores, exact_scores(buildings))
+    assert result.objective >= result.initial_objective
+    assert len(result.checkpoints) == 3
+    final = result.checkpoints[-1]
+    assert final.exact == {key: result.scores[key] for key in final.exact}
+    for checkpoint in result.checkpoints:
+        assert checkpoint.drift < 1e-6
+
+
+def test_score_params_are_coerced():
+    params = score_params({'grid_size': '40', 'max_steps': '100', 'seed': '3',
+                           'footprint_gap': '0.5', 'weights': {'density': 2, 'efficiency': 2}})
+    assert params['extent'] == (-20.0, 20.0, -20.0, 20.0)
+    assert params['max_steps'] == 100 and params['seed'] == 3 and params['footprint_gap'] == 0.5
+    assert params['weights'] == resolve_weights({'density': 1, 'efficiency': 1})
+
+    defaults = score_params({})
+    assert defaults['max_steps'] is None and defaults['seed'] is None
+    assert defaults['footprint_gap'] is None
+
+
+@pytest.mark.parametrize('data', [
+    {'grid_size': 'x'},
+    {'grid_size': -5},
+    {'extent': 5},
+    {'extent': [0, 1, 0]},
+    {'extent': [0, None, 0, 1]},
+    {'max_steps': 'x'},
+    {'max_steps': [1]},
+    {'max_steps': -1},
+    {'seed': 'x'},
+    {'seed': -1},
+    {'footprint_gap': 'x'},
+    {'footprint_gap': -0.5},
+    {'footprint_gap': float('nan')},
+    {'weights': {'density': None}},
+    {'weights': {'density': float('inf')}},
+    {'time_budget': None}
+])
+def test_malformed_score_request_is_rejected(make_buildings, data):
+    body = {'buildings': make_buildings(10), 'objective': 'score', **data}
+    with pytest.raises(ValueError):
+        check_layout_request(body)
+
+
+@pytest.mark.parametrize('footprint_gap', ['x', -0.5, [1]])
+def test_annealing_footprint_gap_is_checked(make_buildings, footprint_gap):
+    with pytest.raises(ValueError):
+        check_layout_request({'buildings': make_buildings(10), 'footprint_gap': footprint_gap})
+
+
+@pytest.mark.parametrize('data', [{'max_steps': 'x'}, {'footprint_gap': -1}, {'seed': [1]}])
+def test_malformed_score_request_is_a_400(make_buildings, data):
+    body = {'buildings': make_buildings(10), 'objective': 'score', **data}
+    response = app.test_client().post('/api/optimize-layout', json=body)
+    assert response.status_code == 400
@@ -0,0 +1,75 @@
+import pytest
+
+from tasks import (MAX_ATTEMPTS, check_layout_request, generate_positions_task, iter_tiled_positions,
+                   optimize_layout_task, sample_positions)
+
+
+def test_positions_request():
+    result = generate_positions_task({'grid_size': 60, 'building_count': 40,
+                                      'min_distance': 4, 'seed': '7'})
+    assert result['count'] == 40
+    assert not result['saturated']
+    assert sample_positions({'building_count': 40, 'seed': 7})[0].tolist() == result['positions']
+
+
+@pytest.mark.parametrize('data', [
+    {'grid_size': None},
+    {'grid_size': [1]},
+    {'grid_size': 'x'},
+    {'grid_size': -5},
+    {'building_count': None},
+    {'building_count': 1e400},
+    {'min_distance': None},
+    {'min_distance': float('nan')},
+    {'max_attempts': None},
+    {'max_attempts': MAX_ATTEMPTS + 1},
+    {'seed': 'x'},
+    {'seed': -1}
+])
+def test_malformed_positions_request_is_a_value_error(data):
+    with pytest.raises(ValueError):
+        sample_positions(data)
+
+
+def test_layout_request_runs_every_chain_mode(make_buildings):
+    buildings = make_buildings(30, seed=1)
+    schedule = {'iterations_per_temperature': 20, 'cooling_rate': 0.5}
+    for mode in ('restarts', 'tempering'):
+        result = optimize_layout_task({'buildings': buildings, 'schedule': schedule,
+                                       'chains': 2, 'workers': 1, 'mode': mode, 'seed': '3'})
+        assert result['annealing']['mode'] == mode
+        assert result['annealing']['energy'] <= result['annealing']['initial_energy']
+        assert [b['id'] for b in result['buildings']] == [b['id'] for b in buildings]
+
+
+@pytest.mark.parametrize('data', [
+    {'seed': 'abc'},
+    {'mode': 'bogus'},
+    {'mode': 'bogus', 'chains': 2},
+    {'chains': 0},
+    {'chains': None},
+    {'workers': [1]},
+    {'objective': 'speed'},
+    {'schedule': {'cooling_rate': 2}}
+])
+def test_malformed_layout_request_is_a_value_error(data):
+    with pytest.raises(ValueError):
+        check_layout_request(data)
+
+
+@pytest.mark.parametrize('data', [
+    {'tile_size': None},
+    {'tile_size': 'x'},
+    {'tile_size': 0},
+    {'tile_size': 64, 'min_distance': 1e-3}
+])
+def test_malformed_tiled_request_is_a_value_error(data):
+    with pytest.raises(ValueError):
+        next(iter_tiled_positions(data))
+
+
+def test_tiled_request_yields_every_tile():
+    tiles = list(iter_tiled_positions({'grid_size': 200, 'building_count': 300, 'tile_size': 64,
+                                       'seed': 1, 'workers': 1}))
+    assert len(tiles) == 16
+    assert sum(len(tile.positions) for tile in tiles) == 300
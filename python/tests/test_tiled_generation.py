@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from tiled_generation import generate_tiled, iter_tiles, plan_tiles
+
+
+def closest_pair(positions: np.ndarray) -> float:
+    distances, _ = cKDTree(positions).query(positions, k=2)
+    return float(distances[:, 1].min())
+
+
+def test_plan_shares_count_by_area():
+    tiles = plan_tiles(100, 70, 1000, tile_size=40)
+    assert len(tiles) == 3 * 2
+    assert sum(tile.count for tile in tiles) == 1000
+    assert tiles[0].count > tiles[-1].count
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_min_distance_holds_across_seams(workers):
+    result = generate_tiled(200, 150, 1500, tile_size=50, min_distance=3.0,
+                            seed=7, workers=workers)
+    positions = result.positions
+
+    assert len(positions) == 1500
+    assert closest_pair(positions) >= 3.0
+    assert positions.min(axis=0) == pytest.approx([0, 0], abs=3.0)
+    assert np.all(positions < [200, 150])
+
+
+def test_samples_do_not_depend_on_worker_count():
+    serial = generate_tiled(120, 120, 600, tile_size=40, min_distance=3.0, seed=8, workers=1)
+    parallel = generate_tiled(120, 120, 600, tile_size=40, min_distance=3.0, seed=8, workers=3)
+    np.testing.assert_array_equal(serial.positions, parallel.positions)
+
+
+def test_saturated_tiles_keep_min_distance():
+    results = list(iter_tiles(60, 60, 10_000, tile_size=20, min_distance=4.0, seed=9, workers=1))
+    positions = np.concatenate([result.positions for result in results])
+
+    assert any(result.sampling.saturated for result in results)
+    assert closest_pair(positions) >= 4.0
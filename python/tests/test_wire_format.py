@@ -0,0 +1,74 @@
+import json
+import struct
+import numpy as np
+import pytest
+
+from city_arrays import CityArrays
+from wire_format import decode, decode_city, encode, encode_city
+
+_PREAMBLE = struct.Struct('<8sI4x')
+
+
+def payload_with_header(header, body: bytes = b'') -> bytes:
+    text = json.dumps(header).encode('utf-8')
+    text += b' ' * (-(_PREAMBLE.size + len(text)) % 8)
+    return _PREAMBLE.pack(b'CITYCOL1', len(text)) + text + body
+
+
+def test_columns_round_trip():
+    columns = {
+        'heatmap': np.arange(12, dtype=np.float32).reshape(3, 4),
+        'codes': np.array([1, 2, 3], dtype='>u2'),
+        'empty': np.empty((0, 3))
+    }
+    decoded, meta = decode(encode(columns, {'resolution': [3, 4]}))
+
+    assert meta == {'resolution': [3, 4]}
+    for name, array in columns.items():
+        np.testing.assert_array_equal(decoded[name], array)
+        assert decoded[name].shape == array.shape
+        assert decoded[name].dtype.byteorder in '<|='
+
+
+def test_city_round_trip(make_buildings):
+    city = CityArrays.from_dicts(make_buildings(100, seed=1))
+    decoded, meta = decode_city(b''.join(encode_city(city, {'grid_size': 60})))
+
+    assert meta == {'grid_size': 60}
+    assert decoded.ids == city.ids
+    np.testing.assert_array_equal(decoded.positions, city.positions)
+    assert decoded.to_dicts() == city.to_dicts()
+
+
+def test_float64_geometry_on_request(make_buildings):
+    city = CityArrays.from_dicts(make_buildings(20, seed=2), np.float64)
+    decoded, _ = decode_city(b''.join(encode_city(city, float_dtype='<f8')))
+    np.testing.assert_array_equal(decoded.sizes, city.sizes)
+
+
+@pytest.mark.parametrize('cut', [4, 20, 100, 16])
+def test_truncated_payload_is_rejected(make_buildings, cut):
+    payload = b''.join(encode_city(CityArrays.from_dicts(make_buildings(10))))
+    with pytest.raises(ValueError):
+        decode_city(payload[:cut] if cut != 16 else payload[:-cut])
+
+
+@pytest.mark.parametrize('header', [
+    [],
+    'columns',
+    {'columns': [], 'meta': []},
+    {'columns': [{'name': 'a', 'dtype': '<f8', 'shape': [1], 'offset': 0, 'nbytes': -8}]},
+    {'columns': [{'name': 'a', 'dtype': '<f8', 'shape': [1], 'offset': -8, 'nbytes': 8}]},
+    {'columns': [{'name': 'a', 'dtype': 'V0', 'shape': [1], 'offset': 0, 'nbytes': 8}]},
+    {'columns': [{'name': 'a', 'dtype': '<f8', 'shape': [2], 'offset': 0, 'nbytes': 8}]},
+    {'columns': [{'name': 'a'}]},
+    {'columns': 'a'}
+])
+def test_malformed_header_is_rejected(header):
+    with pytest.raises(ValueError):
+        decode(payload_with_header(header, bytes(8)))
+
+
+def test_payload_without_city_is_rejected():
+    with pytest.raises(ValueError):
+        decode_city(encode({'values': np.arange(3)}))
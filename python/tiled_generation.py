@@ -0,0 +1,181 @@
+"""
+Tiled Generation Module
+Parallel, seam-aware Poisson disk sampling of very large maps tile by tile
+"""
+
+import math
+import os
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass
+
+from poisson_sampling import SamplingResult, poisson_disk_sample
+
+
+# World units per tile side; each worker holds one tile's sampling grid
+DEFAULT_TILE_SIZE = 256.0
+
+# Tiles sharing (row % 2, col % 2) never touch, so each colour is one parallel phase
+_TILE_PHASES = ((0, 0), (0, 1), (1, 0), (1, 1))
+
+
+@dataclass
+class Tile:
+    """One rectangle of a tiled map"""
+    row: int
+    col: int
+    origin: Tuple[float, float]
+    size: Tuple[float, float]
+    count: int
+
+
+@dataclass
+class TileResult:
+    """Samples of one finished tile"""
+    tile: Tile
+    sampling: SamplingResult
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self.sampling.positions
+
+
+def plan_tiles(width: float, height: float, count: int, tile_size: float = DEFAULT_TILE_SIZE,
+               origin: Tuple[float, float] = (0.0, 0.0)) -> List[Tile]:
+    """
+    Split a ``width`` x ``height`` map into row-major tiles of at most
+    ``tile_size`` per side and share ``count`` between them in proportion to
+    their area (largest remainders get the leftover buildings)
+    """
+    if width <= 0 or height <= 0:
+        raise ValueError("width and height must be positive")
+    if tile_size <= 0:
+        raise ValueError("tile_size must be positive")
+
+    cols = max(1, math.ceil(width / tile_size))
+    rows = max(1, math.ceil(height / tile_size))
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            x, z = col * tile_size, row * tile_size
+            tiles.append(Tile(
+                row=row,
+                col=col,
+                origin=(origin[0] + x, origin[1] + z),
+                size=(min(tile_size, width - x), min(tile_size, height - z)),
+                count=0
+            ))
+
+    shares = np.array([t.size[0] * t.size[1] for t in tiles]) * max(0, int(count)) / (width * height)
+    counts = np.floor(shares).astype(np.int64)
+    leftover = int(count) - int(counts.sum())
+    if leftover > 0:
+        counts[np.argsort(counts - shares, kind='stable')[:leftover]] += 1
+    for tile, tile_count in zip(tiles, counts.tolist()):
+        tile.count = tile_count
+    return tiles
+
+
+def _sample_tile(origin: Tuple[float, float], size: Tuple[float, float], count: int,
+                 min_distance: float, max_attempts: int, seed: int,
+                 fixed: np.ndarray) -> SamplingResult:
+    return poisson_disk_sample(size[0], size[1], count, min_distance=min_distance,
+                               max_attempts=max_attempts, seed=seed, origin=origin,
+                               fixed=fixed)
+
+
+def _border(tile: Tile, positions: np.ndarray, reach: float) -> np.ndarray:
+    """Samples within ``reach`` of a tile's edges, the only ones its neighbours can see"""
+    x0, z0 = tile.origin
+    local = positions - (x0, z0)
+    near = (
+        (local[:, 0] < reach) | (local[:, 0] >= tile.size[0] - reach) |
+        (local[:, 1] < reach) | (local[:, 1] >= tile.size[1] - reach)
+    )
+    return positions[near]
+
+
+def iter_tiles(width: float, height: float, count: int, tile_size: float = DEFAULT_TILE_SIZE,
+               min_distance: float = 4.0, max_attempts: int = 30,
+               seed: Optional[int] = None, workers: Optional[int] = None,
+               origin: Tuple[float, float] = (0.0, 0.0)) -> Iterator[TileResult]:
+    """
+    Poisson disk sample a large map tile by tile, yielding each tile as it
+    finishes.
+
+    Tiles are sampled in four phases by the parity of their row and column.
+    Tiles within one phase never touch, so they run in parallel across
+    ``workers`` processes. Each tile is sampled against the border samples
+    of its already finished neighbours, so ``min_distance`` holds across
+    every seam. The coordinator only keeps those border strips, never the
+    whole map. Every tile draws from its own stream spawned from ``seed``,
+    so the samples do not depend on worker count or completion order.
+    """
+    if tile_size < min_distance:
+        raise ValueError("tile_size must be at least min_distance")
+
+    tiles = plan_tiles(width, height, count, tile_size, origin)
+    streams = np.random.SeedSequence(seed).spawn(len(tiles))
+    seeds = [int(stream.generate_state(1)[0]) for stream in streams]
+    workers = max(1, min(len(tiles), workers or os.cpu_count() or 1))
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    borders: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def neighbour_borders(tile: Tile) -> np.ndarray:
+        found = [borders[(tile.row + dr, tile.col + dc)]
+                 for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+                 if (tile.row + dr, tile.col + dc) in borders]
+        return np.concatenate(found) if found else np.empty((0, 2))
+
+    try:
+        for phase in _TILE_PHASES:
+            indices = [i for i, t in enumerate(tiles) if (t.row % 2, t.col % 2) == phase]
+            args = {
+                i: (tiles[i].origin, tiles[i].size, tiles[i].count, min_distance,
+                    max_attempts, seeds[i], neighbour_borders(tiles[i]))
+                for i in indices
+            }
+
+            if executor is None:
+                finished = ((i, _sample_tile(*args[i])) for i in indices)
+            else:
+                finished = _as_finished(executor, args)
+
+            for i, sampling in finished:
+                tile = tiles[i]
+                borders[(tile.row, tile.col)] = _border(tile, sampling.positions, min_distance)
+                yield TileResult(tile, sampling)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _as_finished(executor: ProcessPoolExecutor,
+                 args: Dict[int, tuple]) -> Iterator[Tuple[int, SamplingResult]]:
+    futures = {executor.submit(_sample_tile, *tile_args): i for i, tile_args in args.items()}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        # Report simultaneous completions in tile order
+        for future in sorted(done, key=futures.get):
+            yield futures[future], future.result()
+
+
+def generate_tiled(width: float, height: float, count: int,
+                   tile_size: float = DEFAULT_TILE_SIZE, min_distance: float = 4.0,
+                   max_attempts: int = 30, seed: Optional[int] = None,
+                   workers: Optional[int] = None,
+                   origin: Tuple[float, float] = (0.0, 0.0)) -> SamplingResult:
+    """All tiles of ``iter_tiles`` merged in row-major tile order"""
+    results = sorted(
+        iter_tiles(width, height, count, tile_size, min_distance, max_attempts,
+                   seed, workers, origin),
+        key=lambda result: (result.tile.row, result.tile.col)
+    )
+    return SamplingResult(
+        positions=np.concatenate([r.positions for r in results]) if results else np.empty((0, 2)),
+        saturated=any(r.sampling.saturated for r in results),
+        attempts=sum(r.sampling.attempts for r in results),
+        rejections=sum(r.sampling.rejections for r in results)
+    )
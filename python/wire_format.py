@@ -0,0 +1,209 @@
+"""
+Wire Format Module
+Binary columnar encoding for city payloads and array results
+"""
+
+import json
+import struct
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from city_arrays import CityArrays
+
+
+COLUMNAR_MIMETYPE = 'application/vnd.city-columnar'
+
+# 8-byte magic (format name and version) followed by the header length
+_MAGIC = b'CITYCOL1'
+_PREAMBLE = struct.Struct('<8sI4x')
+_ALIGNMENT = 8
+
+# Column bytes are streamed in slices of at most this size
+_CHUNK_SIZE = 1 << 20
+
+# Suffixes of the two numeric columns backing one string column
+_OFFSETS = '.offsets'
+_DATA = '.data'
+
+# Columns every city payload carries
+_CITY_COLUMNS = ('positions', 'sizes', 'type_codes', 'color_codes', 'name_codes', 'phases',
+                 'ids' + _OFFSETS, 'ids' + _DATA)
+
+
+def _padding(size: int) -> int:
+    return -size % _ALIGNMENT
+
+
+def _little_endian(array: np.ndarray) -> np.ndarray:
+    array = np.asarray(array)
+    return np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+
+
+def _string_columns(name: str, values: List[str]) -> Dict[str, np.ndarray]:
+    """Pack strings as a UTF-8 byte blob plus n + 1 byte offsets"""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return {
+        name + _OFFSETS: offsets,
+        name + _DATA: np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    }
+
+
+def _decode_strings(columns: Dict[str, np.ndarray], name: str) -> List[str]:
+    offsets = columns.pop(name + _OFFSETS).ravel()
+    data = columns.pop(name + _DATA).tobytes()
+    if (not len(offsets) or offsets[0] != 0 or offsets[-1] != len(data) or
+            np.any(np.diff(offsets.astype(np.int64)) < 0)):
+        raise ValueError(f"column {name} has malformed string offsets")
+    offsets = offsets.tolist()
+    return [data[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+
+def iter_encode(columns: Dict[str, np.ndarray], meta: Optional[Dict] = None) -> Iterator[bytes]:
+    """
+    Stream a columnar payload chunk by chunk.
+
+    Layout: magic, header length, a JSON header describing every column
+    (dtype, shape, offset, nbytes) and free-form ``meta``, then each column's
+    raw little-endian bytes aligned to 8 bytes. Column data is yielded in
+    bounded chunks, so nothing is materialised per element or per payload.
+    """
+    arrays = {name: _little_endian(array) for name, array in columns.items()}
+
+    entries = []
+    offset = 0
+    for name, array in arrays.items():
+        entries.append({
+            'name': name,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': offset,
+            'nbytes': array.nbytes
+        })
+        offset += array.nbytes + _padding(array.nbytes)
+
+    header = json.dumps({'columns': entries, 'meta': meta or {}}).encode('utf-8')
+    header += b' ' * _padding(_PREAMBLE.size + len(header))
+    yield _PREAMBLE.pack(_MAGIC, len(header)) + header
+
+    for array in arrays.values():
+        view = memoryview(array).cast('B') if array.nbytes else memoryview(b'')
+        for start in range(0, array.nbytes, _CHUNK_SIZE):
+            yield view[start:start + _CHUNK_SIZE].tobytes()
+        if _padding(array.nbytes):
+            yield b'\0' * _padding(array.nbytes)
+
+
+def encode(columns: Dict[str, np.ndarray], meta: Optional[Dict] = None) -> bytes:
+    """Encode columns and metadata into one payload"""
+    return b''.join(iter_encode(columns, meta))
+
+
+def decode(payload: bytes) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """
+    Decode a payload into ``(columns, meta)``. Columns are read-only views
+    into ``payload`` rather than copies.
+    """
+    if len(payload) < _PREAMBLE.size:
+        raise ValueError("payload too short for the columnar format")
+    magic, header_length = _PREAMBLE.unpack_from(payload)
+    if magic != _MAGIC:
+        raise ValueError("not a columnar city payload")
+
+    body = _PREAMBLE.size + header_length
+    header = json.loads(bytes(payload[_PREAMBLE.size:body]).decode('utf-8'))
+    if not isinstance(header, dict) or not isinstance(header.get('meta', {}), dict):
+        raise ValueError("malformed header: expected an object with object meta")
+
+    columns = {}
+    try:
+        for entry in header['columns']:
+            dtype = np.dtype(entry['dtype'])
+            if dtype.itemsize == 0:
+                raise ValueError(f"column {entry['name']} has a zero-sized dtype")
+            if entry['nbytes'] < 0:
+                raise ValueError(f"column {entry['name']} has a negative size")
+            start = body + entry['offset']
+            if entry['offset'] < 0 or start + entry['nbytes'] > len(payload):
+                raise ValueError(f"column {entry['name']} extends past the end of the payload")
+            array = np.frombuffer(payload, dtype=dtype, count=entry['nbytes'] // dtype.itemsize,
+                                  offset=start)
+            columns[entry['name']] = array.reshape(entry['shape'])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"malformed column header: {e}") from e
+
+    return columns, header.get('meta', {})
+
+
+def city_columns(city: CityArrays, float_dtype='<f4') -> Dict[str, np.ndarray]:
+    """Columns of a city with geometry cast to ``float_dtype`` (float32 by default)"""
+    columns = {
+        'positions': city.positions.astype(float_dtype, copy=False),
+        'sizes': city.sizes.astype(float_dtype, copy=False),
+        'type_codes': city.type_codes,
+        'color_codes': city.color_codes,
+        'name_codes': city.name_codes,
+        'phases': city.phases
+    }
+    columns.update(_string_columns('ids', city.ids))
+    return columns
+
+
+def city_tables(city: CityArrays) -> Dict[str, List[str]]:
+    """Lookup tables travelling in the header next to the city columns"""
+    return {
+        'type_names': city.type_names,
+        'colors': city.colors,
+        'names': city.names
+    }
+
+
+def encode_city(city: CityArrays, meta: Optional[Dict] = None,
+                float_dtype='<f4') -> Iterator[bytes]:
+    """Stream a city and its lookup tables, with optional extra metadata"""
+    return iter_encode(city_columns(city, float_dtype), {**(meta or {}), 'tables': city_tables(city)})
+
+
+def decode_city(payload: bytes) -> Tuple[CityArrays, Dict]:
+    """Decode a city payload into ``(city, meta)``"""
+    columns, meta = decode(payload)
+    tables = meta.pop('tables', None)
+    if not isinstance(tables, dict):
+        raise ValueError("payload does not contain a city")
+
+    missing = [name for name in _CITY_COLUMNS if name not in columns]
+    if missing:
+        raise ValueError(f"payload is missing city columns: {', '.join(missing)}")
+    ids = _decode_strings(columns, 'ids')
+    n = len(ids)
+
+    for name in ('positions', 'sizes'):
+        if columns[name].dtype.kind != 'f' or columns[name].size != 3 * n:
+            raise ValueError(f"column {name} must hold {n} rows of 3 floats")
+    for name in ('type_codes', 'color_codes', 'name_codes', 'phases'):
+        if columns[name].dtype.kind not in 'iu' or columns[name].size != n:
+            raise ValueError(f"column {name} must hold {n} integers")
+
+    for codes, table in (('type_codes', 'type_names'), ('color_codes', 'colors'),
+                         ('name_codes', 'names')):
+        values = tables.get(table)
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            raise ValueError(f"table {table} must be a list of strings")
+        column = columns[codes].ravel()
+        if n and (column.min() < 0 or column.max() >= len(values)):
+            raise ValueError(f"column {codes} refers past the end of table {table}")
+
+    city = CityArrays(
+        ids=ids,
+        positions=columns['positions'].reshape(-1, 3),
+        sizes=columns['sizes'].reshape(-1, 3),
+        type_codes=columns['type_codes'].ravel(),
+        type_names=tables['type_names'],
+        color_codes=columns['color_codes'].ravel(),
+        colors=tables['colors'],
+        name_codes=columns['name_codes'].ravel(),
+        names=tables['names'],
+        phases=columns['phases'].ravel()
+    )
+    return city, meta